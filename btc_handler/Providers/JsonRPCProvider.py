@@ -1,18 +1,87 @@
+import json
+from decimal import Decimal
+
+from btc_handler.exceptions import BadRequest, NetworkBusyException
+
+
 class JsonRPCProvider:
     PROVIDER_NAME = "JSON-RPC"
     BASE_URL = "172.24.2.3"
+    MAX_BATCH_SIZE = 500  # Maximum number of calls that are sent to the node in one batch request
 
     @staticmethod
-    def get_balance_request(address):
+    def get_rpc_request(body):
         return {
             "base_url": JsonRPCProvider.BASE_URL,
             "method": "POST",
-            "headers": {},
-            "body": {},
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(body),
             "params": {},
             "path": "",
         }
 
+    @staticmethod
+    def get_batch_request(calls):
+        """
+        Builds one request that carries all the calls as a JSON-RPC batch array.
+        The id of each call is its index in the list, so the results can be matched back with parse_batch_response.
+        """
+        for index, call in enumerate(calls):
+            call["id"] = index
+        return JsonRPCProvider.get_rpc_request(calls)
+
+    @staticmethod
+    def parse_batch_response(response, status_code):
+        """
+        Returns the results of a batch request as a dictionary of {id: result_of_the_call}.
+        Each result has the same shape as the response of the call when it is sent alone.
+        """
+        if not isinstance(response, list):
+            raise BadRequest(data={}, error=str(response), node=JsonRPCProvider.PROVIDER_NAME,
+                             status_code=status_code)
+        return {result.get("id"): result for result in response}
+
+    @staticmethod
+    def check_error(response, status_code):
+        if response.get("error") is not None:
+            raise BadRequest(data={}, error=str(response["error"]), node=JsonRPCProvider.PROVIDER_NAME,
+                             status_code=status_code)
+
+    @staticmethod
+    def get_balances_request(addresses):
+        # scantxoutset sums the current unspent outputs of the addresses in the UTXO set of the node (the node doesn't
+        # need to own them). Every call is a full scan of the UTXO set, so all the addresses go in one call.
+        return JsonRPCProvider.get_rpc_request({"jsonrpc": "1.0", "id": 0, "method": "scantxoutset",
+                                                "params": ["start", [f"addr({address})" for address in addresses]]})
+
+    @staticmethod
+    def parse_balances_response(response, status_code):
+        """
+        Splits the unspent outputs of a scan by the address in their descriptor.
+        @return: A dictionary of {address: balance} of the addresses that have unspent outputs
+        """
+        error = response.get("error")
+        if isinstance(error, dict) and "Scan already in progress" in str(error.get("message")):
+            # The node runs one scan at a time. It is transient, so the retry policy can try again.
+            raise NetworkBusyException(network=JsonRPCProvider.PROVIDER_NAME, main_exception_message=error["message"])
+        JsonRPCProvider.check_error(response, status_code)
+        if not response["result"].get("success", True):
+            raise BadRequest(data={}, error="The scan of the UTXO set was aborted", node=JsonRPCProvider.PROVIDER_NAME,
+                             status_code=status_code)
+        balances = {}
+        for unspent in response["result"]["unspents"]:
+            descriptor = unspent["desc"].split("#")[0]  # e.g. addr(1BoatSLRHtKNngkdXEeobR76b53LETtpyT)#checksum
+            if not (descriptor.startswith("addr(") and descriptor.endswith(")")):
+                raise BadRequest(data={}, error=f"Unexpected descriptor {unspent['desc']} in the scan",
+                                 node=JsonRPCProvider.PROVIDER_NAME, status_code=status_code)
+            address = descriptor[len("addr("):-1]
+            balances[address] = balances.get(address, Decimal("0")) + Decimal(str(unspent["amount"]))
+        return balances
+
+    @staticmethod
+    def get_balance_request(address):
+        return JsonRPCProvider.get_balances_request([address])
+
     @staticmethod
     def parse_balance_response(response, status_code):
-        return response["address"]
+        return sum(JsonRPCProvider.parse_balances_response(response, status_code).values(), Decimal("0"))
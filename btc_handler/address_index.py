@@ -0,0 +1,103 @@
+import hashlib
+from typing import Iterator
+
+"""
+    > Address Index
+    A compiled set of watched addresses that matches an address of a transaction output in O(1).
+    => It can be passed instead of the list of {"address", "sub_address"} dictionaries to the deposit functions of the
+       Node Handlers. Iterating it yields the same dictionaries, so code that loops over the list still works.
+    => Build it once and update it with add/remove instead of building it again for every call.
+    => digest identifies the set of entries regardless of their order. It is updated by add/remove, so caches can key
+       on it without reading all the addresses.
+"""
+
+
+class AddressIndex:
+    _DIGEST_MODULUS = 1 << 256
+
+    def __init__(self, addresses=()):
+        """
+        @param addresses: a list of addresses in below format:
+        [
+            {
+                "address": "asdfasdfewaf",
+                "sub_address": "asdfwevwef",
+            }, ...
+        ]
+        """
+        self._sub_addresses = {}  # {address: [sub_address, ...]}
+        self._size = 0
+        self._digest_sum = 0  # Sum of the hashes of the entries, so the order of the entries doesn't matter
+        self.add_many(addresses)
+
+    @staticmethod
+    def _get_entry_hash(address: str, sub_address) -> int:
+        entry = f"{len(address)}:{address}:{sub_address!r}".encode()
+        return int.from_bytes(hashlib.blake2b(entry, digest_size=32).digest(), "big")
+
+    @property
+    def digest(self) -> str:
+        """
+        @return: A hex digest that is the same for two indexes with the same entries, in any order
+        """
+        return f"{self._size:x}-{self._digest_sum:064x}"
+
+    @classmethod
+    def compile(cls, addresses) -> "AddressIndex":
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format, or an AddressIndex
+        @return: The given AddressIndex, or a new one built from the list
+        """
+        if isinstance(addresses, AddressIndex):
+            return addresses
+        return cls(addresses)
+
+    def add(self, address: str, sub_address: str = None):
+        sub_addresses = self._sub_addresses.setdefault(address, [])
+        if sub_address not in sub_addresses:
+            sub_addresses.append(sub_address)
+            self._size += 1
+            self._digest_sum = (self._digest_sum + self._get_entry_hash(address, sub_address)) % self._DIGEST_MODULUS
+
+    def add_many(self, addresses):
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        """
+        for address in addresses:
+            self.add(address=address["address"], sub_address=address.get("sub_address"))
+
+    def remove(self, address: str, sub_address: str = None):
+        """
+        Removes the address with the sub_address
+        """
+        sub_addresses = self._sub_addresses.get(address)
+        if sub_addresses and sub_address in sub_addresses:
+            sub_addresses.remove(sub_address)
+            self._size -= 1
+            self._digest_sum = (self._digest_sum - self._get_entry_hash(address, sub_address)) % self._DIGEST_MODULUS
+            if not sub_addresses:
+                del self._sub_addresses[address]
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._sub_addresses
+
+    def get_sub_addresses(self, address: str) -> list:
+        """
+        @return: The sub_addresses of the address, or an empty list if the address isn't watched
+        """
+        return self._sub_addresses.get(address, [])
+
+    def match(self, address: str) -> list:
+        """
+        @param address: An address of a transaction output
+        @return: The watched entries of the address in {"address", "sub_address"} format (empty if it isn't watched)
+        """
+        return [{"address": address, "sub_address": sub_address} for sub_address in self.get_sub_addresses(address)]
+
+    def __iter__(self) -> Iterator[dict]:
+        for address, sub_addresses in self._sub_addresses.items():
+            for sub_address in sub_addresses:
+                yield {"address": address, "sub_address": sub_address}
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,70 @@
+from decimal import Decimal, Context, Inexact, MAX_PREC, MAX_EMAX, MIN_EMIN
+from functools import lru_cache
+
+"""
+    > Amounts
+    Conversions between the integer amounts of the nodes (in the base unit of a token, like satoshi) and the Decimal
+    amounts of the Node Handlers.
+    => from_base_unit gives exactly the same Decimal as Decimal(value) / 10 ** decimals (same digits and exponent),
+       it only reuses a cached Decimal scale of the decimals instead of building it for every value.
+    => The *_units functions convert a whole list at once, which is the fast path for the outputs of a block.
+    => to_base_unit never rounds. An amount with more digits than the decimals of the token raises ValueError.
+"""
+
+_EXACT_CONTEXT = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN, traps=[Inexact])
+
+
+@lru_cache(maxsize=None)
+def get_scale(decimals: int) -> Decimal:
+    """
+    @param decimals: decimals of a token
+    @return: 10 ** decimals as a Decimal
+    """
+    return Decimal(10 ** decimals)
+
+
+def from_base_unit(value: int, decimals: int) -> Decimal:
+    """
+    @param value: An amount in the base unit, e.g. 230000
+    @param decimals: decimals of the token
+    @return: The amount of the token, e.g. Decimal("0.0023")
+    """
+    return Decimal(value) / get_scale(decimals)
+
+
+def from_base_units(values: list, decimals: int) -> list:
+    """
+    Same as calling from_base_unit for each value
+    @param values: A list of amounts in the base unit
+    @param decimals: decimals of the token
+    @return: A list of the amounts of the token in the same order
+    """
+    return list(map(get_scale(decimals).__rtruediv__, map(Decimal, values)))
+
+
+def to_base_unit(amount, decimals: int) -> int:
+    """
+    @param amount: An amount of the token as a Decimal, int, str or float, e.g. Decimal("0.0023")
+    @param decimals: decimals of the token
+    @return: The amount in the base unit, e.g. 230000
+    @raise ValueError: if the amount has more digits than the decimals
+    """
+    if isinstance(amount, int):
+        return amount * 10 ** decimals
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    base_amount = amount.scaleb(decimals, context=_EXACT_CONTEXT)
+    integer_amount = int(base_amount)
+    if base_amount != integer_amount:
+        raise ValueError(f"{amount} has more than {decimals} decimals")
+    return integer_amount
+
+
+def to_base_units(amounts: list, decimals: int) -> list:
+    """
+    Same as calling to_base_unit for each amount
+    @param amounts: A list of amounts of the token
+    @param decimals: decimals of the token
+    @return: A list of the amounts in the base unit in the same order
+    """
+    return [to_base_unit(amount, decimals) for amount in amounts]
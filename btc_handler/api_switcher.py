@@ -1,13 +1,50 @@
-import requests
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from btc_handler.exceptions import UnknownException, NetworkBusyException, RateLimit, IPBan
+from btc_handler.provider_health import ProviderHealth
+from btc_handler.rate_limiter import TokenBucket
+from btc_handler.retry_policy import RetryPolicy, parse_retry_after
+from btc_handler.session_pool import SessionPool, AsyncSessionPool
+from btc_handler.singleflight import SingleFlight
 
 """
     > API Switcher
     All the requests and API-Calls of the network should get through this class.
+    => Every request function has an async twin with the same name and an "a" prefix (like arequest_providers)
+       that can be awaited on an asyncio event loop.
+    => Providers that define get_batch_request, parse_batch_response and get_{function}_call can receive many calls
+       of a function in one request (see request_providers_batch).
+    => In hedge mode, a request that its provider doesn't answer within its usual (p95) latency is sent to the next
+       provider too. The async path returns the first answer. The sync path sends the first request on the caller's
+       thread and only the hedge in a pool of HEDGE_WORKERS threads.
+    => When no provider is specified, the request goes to the fastest provider whose circuit isn't open
+       (see provider_health.py). DEFAULT_PROVIDER is used until the latencies of the others are known. If all the
+       circuits are open, the provider that failed the longest time ago gets the request as a probe.
+    => The requests of a provider with a rate limit wait for their turn in its limiter (see rate_limiter.py).
+       A 429 response doesn't open the circuit of the provider: its Retry-After holds back the next requests of the
+       limiter and the retry of the request.
+    => Only the read functions in IDEMPOTENT_FUNCTIONS are hedged and have their transient failures retried
+       (see retry_policy.py). Any other function (like broadcast_transaction) is sent exactly once.
+    => Identical calls of those functions that are in flight at the same time share one request (see singleflight.py).
 """
 
 
 class APISwitcher:
-    def __init__(self, network_name: str, providers: dict, default_provider: str):
+    # Read functions that can be hedged or retried
+    IDEMPOTENT_FUNCTIONS = ("balance", "balances", "last_block", "block_timestamp", "block_header", "network_fee",
+                            "params", "deposits", "transaction_info", "block_by_transaction_id",
+                            "fee_by_transaction_id", "received_amount_in_transaction")
+    UNHEALTHY_STATUS_CODES = (502, 503, 504)  # Status codes that count as a failure of the provider
+
+    def __init__(self, network_name: str, providers: dict, default_provider: str,
+                 pool_size: int = 10, timeout: tuple = (3.05, 30), max_concurrency: int = 100,
+                 hedge_requests: bool = False, hedge_percentile: float = 0.95, hedge_delay: float = 1.0,
+                 hedge_workers: int = 10, rate_limiters: dict = None, retry_policy: RetryPolicy = None,
+                 single_flight: bool = True, idempotent_functions: tuple = None):
         """
         Initialize the API Switcher client. It should be done once per Node Handler.
         @param network_name: Name of the network
@@ -17,10 +54,50 @@ class APISwitcher:
             ...
         }
         @param default_provider: Default provider which network mostly use
+        @param pool_size: Maximum number of keep-alive connections that are kept open to each host of a provider
+        @param timeout: Default (connect_timeout, read_timeout) of the requests in seconds.
+            A provider can override it for a request by putting "timeout" in its payload.
+        @param max_concurrency: Maximum number of in-flight async requests to each provider
+        @param hedge_requests: Whether request_providers hedges the requests to another provider when the default
+            provider is slow
+        @param hedge_percentile: The latency percentile of a provider that a request waits before it is hedged
+        @param hedge_delay: Seconds that a request waits before it is hedged, until enough latencies of the
+            provider are recorded
+        @param hedge_workers: Maximum number of the hedged sync requests in flight at the same time. A request isn't
+            hedged while all of them are busy.
+        @param rate_limiters: A dictionary of the rate limiters of the providers, like this:
+        {
+            "json-rpc": TokenBucket(rate=10, burst=20),
+            ...
+        }
+        A provider that isn't in it gets a TokenBucket if it defines RATE_LIMIT = (rate, burst),
+        otherwise it has no limit.
+        @param retry_policy: The policy that retries the failed requests. Its retry budget is shared by all the
+            requests of the API Switcher.
+        @param single_flight: Whether identical calls of request_providers that are in flight at the same time share
+            one request
+        @param idempotent_functions: The read functions of the providers that can be hedged, retried and shared.
+            IDEMPOTENT_FUNCTIONS is used if it is None.
         """
         self.NETWORK_NAME = network_name
         self.PROVIDERS = providers
         self.DEFAULT_PROVIDER = default_provider
+        self.SESSION_POOL = SessionPool(pool_size=pool_size, timeout=timeout)
+        self.ASYNC_SESSION_POOL = AsyncSessionPool(max_concurrency=max_concurrency, timeout=timeout)
+        self.HEDGE_REQUESTS = hedge_requests
+        self.HEDGE_PERCENTILE = hedge_percentile
+        self.HEDGE_DELAY = hedge_delay
+        self.HEDGE_WORKERS = hedge_workers
+        self.HEALTH = {provider_name: ProviderHealth() for provider_name in providers}
+        self.RATE_LIMITERS = {provider_name: TokenBucket(*provider.RATE_LIMIT)
+                              for provider_name, provider in providers.items() if hasattr(provider, "RATE_LIMIT")}
+        self.RATE_LIMITERS.update(rate_limiters or {})
+        self.RETRY_POLICY = retry_policy or RetryPolicy()
+        self.SINGLE_FLIGHT = SingleFlight() if single_flight else None
+        if idempotent_functions is not None:
+            self.IDEMPOTENT_FUNCTIONS = tuple(idempotent_functions)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix=f"{network_name}-hedge")
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
 
     def get_payload(self, function: str, **kwargs) -> list:
         """
@@ -39,39 +116,330 @@ class APISwitcher:
                              'payload': payload})
         return data
 
-    def handle_request(self, payload: list, api_switcher_mode: bool = False, provider: str = None) -> tuple:
+    def rank_providers(self, payload: list) -> list:
+        """
+        Sorts the providers of the payload from the best to the worst and drops the ones that their circuit is open.
+        The providers with lower average latency come first. DEFAULT_PROVIDER comes first among the providers that
+        their latency isn't known yet.
+        @param payload: List of data that given from the get_payload
+        @return: A list of the provider names
+        """
+        ranking = []
+        for index, provider_payload in enumerate(payload):
+            provider = provider_payload['provider']
+            health = self.HEALTH[provider]
+            if health.is_available():
+                ewma_latency = health.ewma_latency
+                ranking.append((ewma_latency is None, ewma_latency or 0, provider != self.DEFAULT_PROVIDER, index,
+                                provider))
+        return [rank[-1] for rank in sorted(ranking)]
+
+    def _get_fallback_provider(self, providers: list):
+        """
+        Picks the provider that failed the longest time ago when the circuits of all the providers are open, and lets
+        the request through its circuit as a probe.
+        @param providers: Names of the providers to pick from
+        @return: Name of the provider, or None if providers is empty
+        """
+        if not providers:
+            return None
+        provider = min(providers, key=lambda provider_name: self.HEALTH[provider_name].failed_at or 0)
+        self.HEALTH[provider].probe()
+        return provider
+
+    def _get_provider_request(self, payload: list, provider: str = None) -> tuple:
+        """
+        Picks the request of the provider from the payload.
+        @param payload: List of data that given from the get_payload
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+        @return: A tuple of (provider_name, request)
+        """
+        if provider is None:
+            ranking = self.rank_providers(payload=payload)
+            if not ranking:
+                if not payload:
+                    raise Exception("No provider is covered in payload")
+                ranking = [self._get_fallback_provider([provider_payload['provider'] for provider_payload in payload])]
+            provider = ranking[0]
+        for provider_payload in payload:
+            if provider_payload['provider'] == provider:
+                return provider, provider_payload['payload']
+        raise Exception("Default provider is not covered in payload")
+
+    def _get_hedge_provider_request(self, payload: list, provider: str) -> tuple:
+        """
+        Picks the provider that a hedged request of the provider is sent to.
+        @param payload: List of data that given from the get_payload
+        @param provider: The provider that the request is sent to at first
+        @return: A tuple of (provider_name, request), or (None, None) if no other healthy provider is in the payload
+        """
+        for hedge_provider in self.rank_providers(payload=payload):
+            if hedge_provider != provider:
+                return self._get_provider_request(payload=payload, provider=hedge_provider)
+        return None, None
+
+    def get_hedge_delay(self, provider: str) -> float:
+        """
+        Returns how long a request of the provider waits before the hedged request is sent to another provider.
+        @param provider: Name of the provider
+        @return: The HEDGE_PERCENTILE latency of the provider in seconds, or HEDGE_DELAY if it isn't known yet
+        """
+        delay = self.HEALTH[provider].LATENCIES.percentile(self.HEDGE_PERCENTILE)
+        return self.HEDGE_DELAY if delay is None else delay
+
+    def is_idempotent(self, function: str) -> bool:
+        """
+        @param function: The function that you want to call
+        @return: Whether the function can be sent more than once (hedged or retried). Only the functions in
+            IDEMPOTENT_FUNCTIONS can.
+        """
+        return function in self.IDEMPOTENT_FUNCTIONS
+
+    def should_hedge(self, function: str) -> bool:
+        """
+        @param function: The function that you want to call
+        @return: Whether the requests of the function can be hedged
+        """
+        return self.HEDGE_REQUESTS and self.is_idempotent(function)
+
+    def _run_with_retry(self, function: str, attempt):
+        """
+        Runs the attempt of the function with RETRY_POLICY, or just once if the function isn't idempotent.
+        @param function: The function that you want to call
+        @param attempt: A function without argument that makes one attempt of the request
+        """
+        if not self.is_idempotent(function):
+            return attempt()
+        return self.RETRY_POLICY.run(attempt)
+
+    async def _arun_with_retry(self, function: str, attempt):
+        """
+        Async twin of _run_with_retry.
+        @param function: The function that you want to call
+        @param attempt: A function without argument that returns an awaitable of one attempt of the request
+        """
+        if not self.is_idempotent(function):
+            return await attempt()
+        return await self.RETRY_POLICY.arun(attempt)
+
+    def _decode_response(self, provider: str, response_text: str, status_code: int, headers) -> dict:
+        """
+        Decodes the json body of a response and raises the proper exception if the provider is failing.
+        @raise RateLimit: If the status code is 429. Its retry_after is the Retry-After header of the response.
+        @raise NetworkBusyException: If the status code is one of UNHEALTHY_STATUS_CODES
+        @raise UnknownException: If the body isn't json
+        """
+        if status_code == 429:
+            exception = RateLimit(error=response_text[:200], node=provider, status_code=status_code)
+            exception.retry_after = parse_retry_after(headers.get("Retry-After"))
+            raise exception
+        if status_code in self.UNHEALTHY_STATUS_CODES:
+            raise NetworkBusyException(network=self.NETWORK_NAME,
+                                       main_exception_message=f"{provider} returned {status_code}: "
+                                                              f"{response_text[:200]}")
+        try:
+            return json.loads(response_text)
+        except ValueError:
+            raise UnknownException(f"{provider} returned a response that isn't json with status code "
+                                   f"{status_code}: {response_text[:200]}")
+
+    def _pause_provider(self, provider: str, exception: RateLimit):
+        """
+        Holds back the next requests of the rate limiter of the provider for the Retry-After of the exception.
+        """
+        retry_after = getattr(exception, "retry_after", None)
+        if retry_after and provider in self.RATE_LIMITERS:
+            self.RATE_LIMITERS[provider].pause(retry_after)
+
+    def _send(self, provider: str, request: dict, acquire: bool = True) -> tuple:
+        """
+        Sends the request of the provider and records the result in its health.
+        @param acquire: Whether the request waits for its turn in the rate limiter of the provider. Pass False if the
+            turn is already taken.
+        @return: A tuple of (response_data, status_code, provider_name)
+        """
+        if acquire and provider in self.RATE_LIMITERS:
+            self.RATE_LIMITERS[provider].acquire()
+        health = self.HEALTH[provider]
+        health.start_request()
+        started_at = time.monotonic()
+        try:
+            response = self.SESSION_POOL.request(provider=provider,
+                                                 url=request["base_url"] + request["path"],
+                                                 data=request["body"],
+                                                 headers=request["headers"],
+                                                 method=request["method"],
+                                                 params=request['params'],
+                                                 timeout=request.get("timeout"))
+            response_data = self._decode_response(provider=provider, response_text=response.text,
+                                                  status_code=response.status_code, headers=response.headers)
+        except RateLimit as e:
+            health.end_request()
+            self._pause_provider(provider=provider, exception=e)
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - started_at)
+        return response_data, response.status_code, provider
+
+    async def _asend(self, provider: str, request: dict, acquire: bool = True) -> tuple:
+        """
+        Async twin of _send.
+        @return: A tuple of (response_data, status_code, provider_name)
+        """
+        if acquire and provider in self.RATE_LIMITERS:
+            await self.RATE_LIMITERS[provider].aacquire()
+        health = self.HEALTH[provider]
+        health.start_request()
+        started_at = time.monotonic()
+        try:
+            response_text, status_code, headers = await self.ASYNC_SESSION_POOL.request(
+                provider=provider,
+                url=request["base_url"] + request["path"],
+                data=request["body"],
+                headers=request["headers"],
+                method=request["method"],
+                params=request['params'],
+                timeout=request.get("timeout"))
+            response_data = self._decode_response(provider=provider, response_text=response_text,
+                                                  status_code=status_code, headers=headers)
+        except RateLimit as e:
+            health.end_request()
+            self._pause_provider(provider=provider, exception=e)
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - started_at)
+        return response_data, status_code, provider
+
+    def _send_hedged(self, payload: list, provider: str) -> tuple:
+        """
+        Sends the request to the provider on this thread and, if it hasn't answered within its hedge delay, to another
+        provider too in the hedge pool. The delay starts after the request got its turn in the rate limiter.
+        @note: A sync request that has started can't be aborted, so the response of the first provider is returned if
+            it succeeds, even if the hedge answered earlier. The hedge's response is returned if the first one fails.
+        @return: A tuple of (response_data, status_code, provider_name)
+        """
+        provider, request = self._get_provider_request(payload=payload, provider=provider)
+        hedge_provider, hedge_request = self._get_hedge_provider_request(payload=payload, provider=provider)
+        if hedge_provider is None:
+            return self._send(provider=provider, request=request)
+        if provider in self.RATE_LIMITERS:
+            self.RATE_LIMITERS[provider].acquire()
+        hedges = []
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def send_hedge():
+            try:
+                return self._send(provider=hedge_provider, request=hedge_request)
+            finally:
+                self._hedge_slots.release()
+
+        def start_hedge():
+            with lock:
+                if not finished.is_set() and self._hedge_slots.acquire(blocking=False):
+                    hedges.append(self._hedge_executor.submit(send_hedge))
+
+        timer = threading.Timer(self.get_hedge_delay(provider), start_hedge)
+        timer.daemon = True
+        timer.start()
+        try:
+            return self._send(provider=provider, request=request, acquire=False)
+        except Exception as error:
+            with lock:
+                finished.set()
+            if not hedges:
+                raise
+            try:
+                return hedges[0].result()
+            except Exception:
+                raise error
+        finally:
+            with lock:
+                finished.set()
+            timer.cancel()
+
+    async def _asend_hedged(self, payload: list, provider: str) -> tuple:
+        """
+        Async twin of _send_hedged. The request that loses the race is cancelled.
+        @return: A tuple of (response_data, status_code, provider_name)
+        """
+        provider, request = self._get_provider_request(payload=payload, provider=provider)
+        hedge_provider, hedge_request = self._get_hedge_provider_request(payload=payload, provider=provider)
+        if hedge_provider is None:
+            return await self._asend(provider=provider, request=request)
+        if provider in self.RATE_LIMITERS:
+            await self.RATE_LIMITERS[provider].aacquire()  # The wait for its turn isn't a part of the hedge delay
+        pending = {asyncio.ensure_future(self._asend(provider=provider, request=request, acquire=False))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.get_hedge_delay(provider))
+            if not done:
+                pending.add(asyncio.ensure_future(self._asend(provider=hedge_provider, request=hedge_request)))
+            errors = []
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                if not pending:
+                    raise errors[0]
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for loser in pending:
+                loser.cancel()
+
+    def handle_request(self, payload: list, api_switcher_mode: bool = False, provider: str = None,
+                       hedge: bool = False) -> tuple:
         """
         Handling the request and returns the response.
         @param payload: List of data that given from the get_payload
         @param api_switcher_mode: Whether the function use API Switcher or not
-        @param provider: a specified provider to get payload from this provider instead of DEFAULT_PROVIDER
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+        @param hedge: Whether the request can be hedged to another provider when the chosen provider is slow.
+            Don't use it for the requests that shouldn't be sent twice (like broadcasting a transaction).
         @return: Response of the request
         """
         if api_switcher_mode:
-            response = requests.post("api-switcher.com", json={"network": self.NETWORK_NAME,
-                                                               "payloads": payload})
+            response = self.SESSION_POOL.request(provider="api-switcher", method="POST", url="api-switcher.com",
+                                                 json={"network": self.NETWORK_NAME, "payloads": payload})
             response_data = response.json()['data']
             status_code = response.json()['status_code']
             provider_name = response.json()['provider_name']
+        elif hedge and provider is None:
+            response_data, status_code, provider_name = self._send_hedged(payload=payload, provider=provider)
         else:
-            request = None
-            if provider is None:
-                provider = self.DEFAULT_PROVIDER
-            for provider_payload in payload:
-                if provider_payload['provider'] == provider:
-                    request = provider_payload['payload']
-                    break
-            if request is not None:
-                response = requests.request(url=request["base_url"] + request["path"],
-                                            data=request["body"],
-                                            headers=request["headers"],
-                                            method=request["method"],
-                                            params=request['params'])
-                response_data = response.json()
-                status_code = response.status_code
-                provider_name = provider
-            else:
-                raise Exception("Default provider is not covered in payload")
+            provider, request = self._get_provider_request(payload=payload, provider=provider)
+            response_data, status_code, provider_name = self._send(provider=provider, request=request)
+        return response_data, status_code, provider_name
+
+    async def ahandle_request(self, payload: list, api_switcher_mode: bool = False, provider: str = None,
+                              hedge: bool = False) -> tuple:
+        """
+        Async twin of handle_request. Cancelling the awaiting task cancels the HTTP request too.
+        @param payload: List of data that given from the get_payload
+        @param api_switcher_mode: Whether the function use API Switcher or not
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+        @param hedge: Whether the request can be hedged to another provider when the chosen provider is slow.
+            Don't use it for the requests that shouldn't be sent twice (like broadcasting a transaction).
+        @return: Response of the request
+        """
+        if api_switcher_mode:
+            response_text, _, _ = await self.ASYNC_SESSION_POOL.request(provider="api-switcher", method="POST",
+                                                                        url="api-switcher.com",
+                                                                        json={"network": self.NETWORK_NAME,
+                                                                              "payloads": payload})
+            response = json.loads(response_text)
+            response_data = response['data']
+            status_code = response['status_code']
+            provider_name = response['provider_name']
+        elif hedge and provider is None:
+            response_data, status_code, provider_name = await self._asend_hedged(payload=payload, provider=provider)
+        else:
+            provider, request = self._get_provider_request(payload=payload, provider=provider)
+            response_data, status_code, provider_name = await self._asend(provider=provider, request=request)
         return response_data, status_code, provider_name
 
     def parse_response(self, function: str, response: dict, status_code: int, provider_name: str):
@@ -86,7 +454,15 @@ class APISwitcher:
         provider = self.PROVIDERS[provider_name]
         function = f"parse_{function}_response"
         if hasattr(provider, function):
-            parsed_response = getattr(provider, function)(response=response, status_code=status_code)
+            try:
+                parsed_response = getattr(provider, function)(response=response, status_code=status_code)
+            except RateLimit as e:
+                self._pause_provider(provider=provider_name, exception=e)
+                raise
+            except IPBan:
+                if provider_name in self.HEALTH:
+                    self.HEALTH[provider_name].record_failure(trip=True)
+                raise
         else:
             raise Exception(f"{provider} has not function {function}")
         return parsed_response
@@ -95,14 +471,180 @@ class APISwitcher:
         """
         It uses the above functions to handle a request, parse it and return it to the Node Handler.
         @param function: The function that you want to call
-        @param provider: a specified provider to get payload from this provider instead of DEFAULT_PROVIDER
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
         @param kwargs: Needed parameters for the function
         @return: The parsed response that can be used in the Node Handler
         """
         payload = self.get_payload(function=function, **kwargs)
-        response_data, status_code, provider_name = self.handle_request(payload=payload, provider=provider)
-        parsed_response = self.parse_response(function=function,
-                                              response=response_data,
-                                              status_code=status_code,
-                                              provider_name=provider_name)
-        return parsed_response
+
+        def attempt():
+            response_data, status_code, provider_name = self.handle_request(payload=payload, provider=provider,
+                                                                            hedge=self.should_hedge(function))
+            return self.parse_response(function=function,
+                                       response=response_data,
+                                       status_code=status_code,
+                                       provider_name=provider_name)
+
+        if self.SINGLE_FLIGHT is None or not self.is_idempotent(function):
+            return self._run_with_retry(function=function, attempt=attempt)
+        return self.SINGLE_FLIGHT.do(key=SingleFlight.get_key(provider, function, **kwargs),
+                                     function=lambda: self._run_with_retry(function=function, attempt=attempt))
+
+    async def arequest_providers(self, function, provider=None, **kwargs):
+        """
+        Async twin of request_providers. The sync functions of the Node Handlers keep using request_providers.
+        @param function: The function that you want to call
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+        @param kwargs: Needed parameters for the function
+        @return: The parsed response that can be used in the Node Handler
+        """
+        payload = self.get_payload(function=function, **kwargs)
+
+        async def attempt():
+            response_data, status_code, provider_name = await self.ahandle_request(
+                payload=payload, provider=provider, hedge=self.should_hedge(function))
+            return self.parse_response(function=function,
+                                       response=response_data,
+                                       status_code=status_code,
+                                       provider_name=provider_name)
+
+        if self.SINGLE_FLIGHT is None or not self.is_idempotent(function):
+            return await self._arun_with_retry(function=function, attempt=attempt)
+        return await self.SINGLE_FLIGHT.ado(key=SingleFlight.get_key(provider, function, **kwargs),
+                                            function=lambda: self._arun_with_retry(function=function, attempt=attempt))
+
+    def supports_batch(self, function: str, provider: str = None) -> bool:
+        """
+        Checks whether the provider can get many calls of the function in one request.
+        @param function: Name of the function
+        @param provider: a specified provider to check instead of DEFAULT_PROVIDER
+        @return: True if the provider has batch functions for the function
+        """
+        provider = self.PROVIDERS[provider or self.DEFAULT_PROVIDER]
+        return (hasattr(provider, "get_batch_request") and hasattr(provider, "parse_batch_response")
+                and hasattr(provider, f"get_{function}_call"))
+
+    def get_batch_provider(self, function: str):
+        """
+        Picks the best healthy provider that can get many calls of the function in one request.
+        @param function: Name of the function
+        @return: Name of the provider, or None if no provider supports batching the function
+        """
+        providers = [provider_name for provider_name in self.PROVIDERS
+                     if self.supports_batch(function=function, provider=provider_name)]
+        ranking = self.rank_providers(payload=[{'provider': provider_name} for provider_name in providers])
+        return ranking[0] if ranking else self._get_fallback_provider(providers)
+
+    def get_batch_payload(self, function: str, kwargs_list: list, provider: str = None) -> list:
+        """
+        Returns the necessary data for making batch requests.
+        Each batch has at most MAX_BATCH_SIZE (defined in the provider) calls.
+        Example: get_batch_payload(function="balance", kwargs_list=[{"address": "non239x8b2bi..."}, ...])
+        @param function: Name of the function
+        @param kwargs_list: A list of the needed parameters of each call
+        @param provider: a specified provider to get payload from this provider instead of DEFAULT_PROVIDER
+        @return: A list of (number_of_calls, payload) that payload is in the same format of get_payload
+        """
+        provider_name = provider or self.DEFAULT_PROVIDER
+        provider = self.PROVIDERS[provider_name]
+        batch_size = getattr(provider, "MAX_BATCH_SIZE", len(kwargs_list)) or 1
+        get_call = getattr(provider, f"get_{function}_call")
+        data = []
+        for start in range(0, len(kwargs_list), batch_size):
+            calls = [get_call(**kwargs) for kwargs in kwargs_list[start:start + batch_size]]
+            data.append((len(calls), [{'provider': provider_name,
+                                       'payload': provider.get_batch_request(calls)}]))
+        return data
+
+    def parse_batch_response(self, function: str, number_of_calls: int, response, status_code: int,
+                             provider_name: str) -> list:
+        """
+        Splits the response of a batch request by the id of the calls and parses each of them with parse_response.
+        @param function: The function that you called
+        @param number_of_calls: Number of the calls in the batch
+        @param response: Given response of the batch request
+        @param status_code: Status code of the request
+        @param provider_name: What provider did handle_request use
+        @return: A list of the parsed responses in the order of the calls.
+            A call that failed has the raised exception in its place instead.
+        """
+        results = self.PROVIDERS[provider_name].parse_batch_response(response=response, status_code=status_code)
+        parsed_responses = []
+        for call_id in range(number_of_calls):
+            try:
+                if call_id not in results:
+                    raise UnknownException(f"{provider_name} didn't return the result of call {call_id} of the batch")
+                parsed_responses.append(self.parse_response(function=function,
+                                                            response=results[call_id],
+                                                            status_code=status_code,
+                                                            provider_name=provider_name))
+            except Exception as e:
+                parsed_responses.append(e)
+        return parsed_responses
+
+    def request_providers_batch(self, function: str, kwargs_list: list, provider: str = None) -> list:
+        """
+        Calls the function once per kwargs with the fewest requests that the provider allows.
+        If the provider doesn't support batching, the calls are sent one by one with request_providers.
+        Example: request_providers_batch(function="balance", kwargs_list=[{"address": "non239x8b2bi..."}, ...])
+        @param function: The function that you want to call
+        @param kwargs_list: A list of the needed parameters of each call
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+            that supports batching
+        @return: A list of the parsed responses in the order of kwargs_list.
+            A call that failed has the raised exception in its place instead, so check the items with isinstance.
+        """
+        results = []
+        batch_provider = provider or self.get_batch_provider(function=function)
+        if batch_provider is None or not self.supports_batch(function=function, provider=batch_provider):
+            for kwargs in kwargs_list:
+                try:
+                    results.append(self.request_providers(function=function, provider=provider, **kwargs))
+                except Exception as e:
+                    results.append(e)
+            return results
+        for number_of_calls, payload in self.get_batch_payload(function=function, kwargs_list=kwargs_list,
+                                                               provider=batch_provider):
+            try:
+                response_data, status_code, provider_name = self._run_with_retry(
+                    function=function, attempt=lambda: self.handle_request(payload=payload, provider=batch_provider))
+                results.extend(self.parse_batch_response(function=function,
+                                                         number_of_calls=number_of_calls,
+                                                         response=response_data,
+                                                         status_code=status_code,
+                                                         provider_name=provider_name))
+            except Exception as e:
+                results.extend([e] * number_of_calls)
+        return results
+
+    async def arequest_providers_batch(self, function: str, kwargs_list: list, provider: str = None) -> list:
+        """
+        Async twin of request_providers_batch. The batches are sent concurrently.
+        @param function: The function that you want to call
+        @param kwargs_list: A list of the needed parameters of each call
+        @param provider: a specified provider to get payload from this provider instead of the best healthy provider
+            that supports batching
+        @return: A list of the parsed responses in the order of kwargs_list.
+            A call that failed has the raised exception in its place instead, so check the items with isinstance.
+        """
+        batch_provider = provider or self.get_batch_provider(function=function)
+        if batch_provider is None or not self.supports_batch(function=function, provider=batch_provider):
+            return list(await asyncio.gather(*[self.arequest_providers(function=function, provider=provider, **kwargs)
+                                               for kwargs in kwargs_list], return_exceptions=True))
+
+        async def request_batch(number_of_calls, payload):
+            try:
+                response_data, status_code, provider_name = await self._arun_with_retry(
+                    function=function, attempt=lambda: self.ahandle_request(payload=payload, provider=batch_provider))
+                return self.parse_batch_response(function=function,
+                                                 number_of_calls=number_of_calls,
+                                                 response=response_data,
+                                                 status_code=status_code,
+                                                 provider_name=provider_name)
+            except Exception as e:
+                return [e] * number_of_calls
+
+        batches = await asyncio.gather(*[request_batch(number_of_calls, payload) for number_of_calls, payload
+                                         in self.get_batch_payload(function=function, kwargs_list=kwargs_list,
+                                                                   provider=batch_provider)])
+        return [result for batch in batches for result in batch]
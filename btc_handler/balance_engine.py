@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Literal
+
+"""
+    > Balance Engine
+    Fills the tokens × addresses balance matrix of get_all_token_balances with the fewest calls of get_balance.
+    => Every address is asked once per token, even if it is repeated with different sub_addresses.
+    => The addresses are split into chunks and the (token, chunk) calls run concurrently. Each get_balance call is
+       expected to batch its addresses into the requests of its provider (like BTCHandler.get_balance does).
+"""
+
+
+class BalanceEngine:
+    def __init__(self, node_handler, max_workers: int = 8, chunk_size: int = 5000):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param max_workers: Maximum number of the get_balance calls that run at the same time
+        @param chunk_size: Maximum number of the addresses of each get_balance call
+        """
+        self.NODE_HANDLER = node_handler
+        self.MAX_WORKERS = max_workers
+        self.CHUNK_SIZE = chunk_size
+
+    def _get_chunk_balances(self, token: dict, addresses: list, until_block) -> tuple:
+        result = self.NODE_HANDLER.get_balance(
+            token=token, addresses=[{"address": address, "sub_address": None} for address in addresses],
+            until_block=until_block)
+        return {balance["address"]: balance["balance"] for balance in result["balances"]}, result["until_block"]
+
+    def get_all_token_balances(self, tokens: list, addresses: list,
+                               until_block: Union[int, Literal["latest"]] = "latest") -> dict:
+        """
+        Same as get_all_token_balances of the Node Handler
+        @return: a dict in the format of get_all_token_balances. The balances of each token are in the order of the
+            given addresses.
+        """
+        unique_addresses = list(dict.fromkeys(address["address"] for address in addresses))
+        chunks = [unique_addresses[index:index + self.CHUNK_SIZE]
+                  for index in range(0, len(unique_addresses), self.CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="balance-engine") as executor:
+            futures = [[executor.submit(self._get_chunk_balances, token, chunk, until_block) for chunk in chunks]
+                       for token in tokens]
+            try:
+                results = [[future.result() for future in token_futures] for token_futures in futures]
+            except BaseException:
+                for token_futures in futures:
+                    for future in token_futures:
+                        future.cancel()  # shutdown(cancel_futures=True) needs Python 3.9
+                raise
+        token_balances = []
+        for token, token_results in zip(tokens, results):
+            balances = {}
+            for chunk_balances, chunk_until_block in token_results:
+                balances.update(chunk_balances)
+                until_block = chunk_until_block
+            token_balances.append({
+                "token": token,
+                "balances": [{"address": address["address"], "sub_address": address.get("sub_address"),
+                              "balance": balances[address["address"]]} for address in addresses],
+            })
+        return {"token_balances": token_balances, "until_block": until_block}
@@ -0,0 +1,210 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from btc_handler.amounts import to_base_unit, from_base_units
+
+"""
+    > Balance Snapshot Store
+    Answers get_balance with a historical until_block from local data instead of an archive node.
+    => Every applied block records the balance change (delta) of each address and token in that block. The balance at
+       a block is the sum of the deltas up to it.
+    => Every CHECKPOINT_INTERVAL blocks the balances of the addresses that changed are stored as a checkpoint, so a
+       query only sums the deltas after the nearest checkpoint.
+    => The amounts are stored as integers in the base unit of the token, so the sums are exact.
+    => The store only knows the history of the seeded addresses, from the block they were seeded at. Use seed to give
+       it the opening balances of the addresses (0 for a new address). covers is False for the other addresses, so
+       they are never answered with a made-up 0.
+"""
+
+
+class BalanceSnapshotStore:
+    def __init__(self, path: str, checkpoint_interval: int = 1000):
+        """
+        @param path: Path of the SQLite file of the store. It is created if it doesn't exist.
+        @param checkpoint_interval: Number of the blocks between two checkpoints
+        """
+        self.PATH = path
+        self.CHECKPOINT_INTERVAL = checkpoint_interval
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS deltas ("
+                                 "token TEXT NOT NULL, address TEXT NOT NULL, block INTEGER NOT NULL, "
+                                 "delta INTEGER NOT NULL, PRIMARY KEY (token, address, block))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS deltas_block ON deltas (block)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS checkpoints ("
+                                 "token TEXT NOT NULL, address TEXT NOT NULL, block INTEGER NOT NULL, "
+                                 "balance INTEGER NOT NULL, PRIMARY KEY (token, address, block))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS checkpoints_block ON checkpoints (block)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS seeded_addresses ("
+                                 "token TEXT NOT NULL, address TEXT NOT NULL, block INTEGER NOT NULL, "
+                                 "PRIMARY KEY (token, address))")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    @staticmethod
+    def get_token_key(token: dict) -> str:
+        return f"{token['token_symbol']}:{token.get('contract_address')}:{token.get('identifier')}"
+
+    def _get_state(self, key: str):
+        row = self._connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    @property
+    def first_block(self):
+        """
+        @return: The block that the history of the store starts after, or None if nothing is applied yet
+        """
+        with self._lock:
+            return self._get_state("first_block")
+
+    @property
+    def last_block(self):
+        """
+        @return: Height of the last applied block, or None if nothing is applied yet
+        """
+        with self._lock:
+            return self._get_state("last_block")
+
+    def covers(self, until_block: int, token: dict = None, addresses: list = None) -> bool:
+        """
+        @param until_block: The block that the balances are asked at
+        @param token: The token of the balances. The addresses are only checked if it is given.
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @return: Whether balances at the given block (of all the addresses) can be answered by the store
+        """
+        with self._lock:
+            first_block, last_block = self._get_state("first_block"), self._get_state("last_block")
+            if first_block is None or not first_block <= until_block <= last_block:
+                return False
+            if token is None:
+                return True
+            return not self._get_unseeded_addresses(self.get_token_key(token), addresses or [], until_block)
+
+    def _get_unseeded_addresses(self, token_key: str, addresses: list, until_block: int) -> list:
+        unique_addresses = list(dict.fromkeys(address["address"] for address in addresses))
+        seeded = set()
+        for index in range(0, len(unique_addresses), 500):
+            chunk = unique_addresses[index:index + 500]
+            seeded.update(address for (address,) in self._connection.execute(
+                f"SELECT address FROM seeded_addresses WHERE token = ? AND block <= ? "
+                f"AND address IN ({', '.join('?' * len(chunk))})", (token_key, until_block, *chunk)))
+        return [address for address in unique_addresses if address not in seeded]
+
+    def seed(self, token: dict, balances: list, block: int):
+        """
+        Stores the opening balances of the addresses. Their balances after the block are answered by the store.
+        @param token: The token of the balances
+        @param balances: the balances at the block in the format of get_balance of the Node Handler
+            (with a 0 balance for a new address)
+        @param block: The block of the balances. It is the last applied block, or the block before the first one.
+        """
+        token_key = self.get_token_key(token)
+        with self._transaction():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                [(token_key, balance["address"], block, to_base_unit(balance["balance"], token["decimals"]))
+                 for balance in balances])
+            self._connection.executemany(
+                "INSERT INTO seeded_addresses VALUES (?, ?, ?) "
+                "ON CONFLICT (token, address) DO UPDATE SET block = MIN(block, excluded.block)",
+                [(token_key, balance["address"], block) for balance in balances])
+            self._connection.execute("INSERT OR IGNORE INTO state VALUES ('first_block', ?)", (block,))
+            self._connection.execute("INSERT OR IGNORE INTO state VALUES ('last_block', ?)", (block,))
+
+    def apply_block(self, block: int, deposits: list = (), withdrawals: list = ()):
+        """
+        Records the balance changes of a block. Blocks have to be applied in order.
+        @param block: Height of the block
+        @param deposits: deposits of the block in the format of get_deposits_by_block
+        @param withdrawals: amounts that left the addresses in the block (fees included) in below format:
+        [
+            {
+                "token": {...},  # same as the token of the deposits
+                "address": "1BoatSLRHtKNngkdXEeobR76b53LETtpyT",
+                "amount": Decimal("0.0023")
+            }, ...
+        ]
+        """
+        deltas = {}
+        for deposit in deposits:
+            key = (self.get_token_key(deposit["token"]), deposit["to_address"])
+            deltas[key] = deltas.get(key, 0) + to_base_unit(deposit["amount"], deposit["token"]["decimals"])
+        for withdrawal in withdrawals:
+            key = (self.get_token_key(withdrawal["token"]), withdrawal["address"])
+            deltas[key] = deltas.get(key, 0) - to_base_unit(withdrawal["amount"], withdrawal["token"]["decimals"])
+        with self._transaction():
+            self._connection.executemany(
+                "INSERT INTO deltas VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (token, address, block) DO UPDATE SET delta = delta + excluded.delta",
+                [(token_key, address, block, delta) for (token_key, address), delta in deltas.items() if delta])
+            self._connection.execute("INSERT OR IGNORE INTO state VALUES ('first_block', ?)", (block - 1,))
+            self._connection.execute("INSERT OR REPLACE INTO state VALUES ('last_block', ?)", (block,))
+            if block % self.CHECKPOINT_INTERVAL == 0:
+                self._store_checkpoints(block)
+
+    def _store_checkpoints(self, block: int):
+        changed = self._connection.execute(
+            "SELECT DISTINCT token, address FROM deltas WHERE block > ? AND block <= ?",
+            (block - self.CHECKPOINT_INTERVAL, block)).fetchall()
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+            [(token_key, address, block, self._get_base_balance(token_key, address, block))
+             for token_key, address in changed])
+
+    def _get_base_balance(self, token_key: str, address: str, block: int) -> int:
+        checkpoint = self._connection.execute(
+            "SELECT block, balance FROM checkpoints WHERE token = ? AND address = ? AND block <= ? "
+            "ORDER BY block DESC LIMIT 1", (token_key, address, block)).fetchone()
+        checkpoint_block, balance = checkpoint if checkpoint is not None else (-1, 0)
+        return balance + self._connection.execute(
+            "SELECT COALESCE(SUM(delta), 0) FROM deltas WHERE token = ? AND address = ? AND block > ? AND block <= ?",
+            (token_key, address, checkpoint_block, block)).fetchone()[0]
+
+    def rollback_block(self, block: int):
+        """
+        Undoes the block and the blocks above it, e.g. from on_rollback of DepositWatcher.
+        @param block: Height of the first orphaned block
+        """
+        with self._transaction():
+            self._connection.execute("DELETE FROM deltas WHERE block >= ?", (block,))
+            self._connection.execute("DELETE FROM checkpoints WHERE block >= ?", (block,))
+            self._connection.execute("DELETE FROM seeded_addresses WHERE block >= ?", (block,))
+            self._connection.execute("UPDATE state SET value = ? WHERE key = 'last_block' AND value >= ?",
+                                     (block - 1, block))
+
+    def get_balance(self, token: dict, addresses: list, until_block: int) -> list:
+        """
+        @param token: same as get_balance of the Node Handler
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @param until_block: The block that the balances are asked at. It should be covered by the store.
+        @return: the balances in the format of get_balance of the Node Handler
+        @raise ValueError: if some of the addresses weren't seeded at the block
+        """
+        token_key = self.get_token_key(token)
+        with self._lock:
+            unseeded_addresses = self._get_unseeded_addresses(token_key, addresses, until_block)
+            if unseeded_addresses:
+                raise ValueError(f"The store doesn't know the history of {len(unseeded_addresses)} addresses, "
+                                 f"e.g. {unseeded_addresses[0]}")
+            balances = {address: self._get_base_balance(token_key, address, until_block)
+                        for address in dict.fromkeys(address["address"] for address in addresses)}
+        amounts = from_base_units([balances[address["address"]] for address in addresses], token["decimals"])
+        return [{"address": address["address"], "sub_address": address.get("sub_address"), "balance": amount}
+                for address, amount in zip(addresses, amounts)]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
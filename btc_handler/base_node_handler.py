@@ -1,8 +1,13 @@
+import threading
 from decimal import Decimal
-from typing import Optional, Union, Literal
+from typing import Optional, Union, Literal, Iterator
 
 from btc_handler.Providers.JsonRPCProvider import JsonRPCProvider
+from btc_handler.address_index import AddressIndex
 from btc_handler.api_switcher import APISwitcher
+from btc_handler.block_cache import BlockCache
+from btc_handler.fee_oracle import FeeOracle
+from btc_handler.transaction_cache import TransactionCache
 
 """
     > Base Node Handler
@@ -34,6 +39,11 @@ class BaseNodeHandler:
     API_SWITCHER_CLIENT = APISwitcher(network_name=NETWORK_NAME, providers=PROVIDERS, default_provider=DEFAULT_PROVIDER)
     # API Switcher client that can be used in your request functions
 
+    BLOCK_CACHE_SIZE = 1024  # Number of the block timestamps that get_cached_block_timestamp keeps
+    TRANSACTION_CACHE: Optional[TransactionCache] = None
+    # Set it to a TransactionCache to store the results of the confirmed transactions in the get_cached_* functions
+    _CACHE_LOCK = threading.Lock()
+
     @staticmethod
     def get_network_configuration() -> dict:
         """
@@ -132,6 +142,56 @@ class BaseNodeHandler:
         """
         raise NotImplementedError
 
+    @staticmethod
+    def get_block_header(block_number: int) -> dict:
+        """
+        Returns the hashes of the given block that chain it to its parent (used for detecting reorgs)
+        @param block_number: the height of the block wanted e.g. 1234518132
+        @return: a dictionary in shape of bellow:
+        {
+            "block": 1234518132,
+            "hash": "00000000000000000001a3c2c0d4b2fa0f3e8b9d6b5c7a1e2f3d4c5b6a7980e1",
+            "parent_hash": "00000000000000000002b7e1d0c3a4f5e6d7c8b9a0f1e2d3c4b5a69788796a5b"
+        }
+        @raise APIError: Raise the proper exception from the APIError family if something goes wrong from the API side
+            rest_framework.exceptions.APIException with details of response.text and code of response.status_code
+        @raise InvalidInputError: Raise the proper exception from the InvalidInputError family if the inputs aren't complete,
+         in the wrong format
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def get_block_cache(cls) -> BlockCache:
+        """
+        Returns the block cache of the network. It is created from get_network_configuration on the first call.
+        """
+        if "_BLOCK_CACHE" not in cls.__dict__:
+            with cls._CACHE_LOCK:
+                if "_BLOCK_CACHE" not in cls.__dict__:
+                    configuration = cls.get_network_configuration()
+                    cls._BLOCK_CACHE = BlockCache(min_confirmation=configuration["min_confirmation"],
+                                                  block_time=configuration["block_time"],
+                                                  max_size=cls.BLOCK_CACHE_SIZE)
+        return cls._BLOCK_CACHE
+
+    @classmethod
+    def get_cached_last_block(cls) -> int:
+        """
+        Same as get_last_block, but the answer of the node is reused for a fraction of block_time
+        @return: height of last mined block
+        """
+        return cls.get_block_cache().get_last_block(fetch=cls.get_last_block)
+
+    @classmethod
+    def get_cached_block_timestamp(cls, block_number: int) -> int:
+        """
+        Same as get_block_timestamp, but the timestamps of the confirmed blocks are only asked from the node once
+        @param block_number: the height of the block wanted e.g. 1234518132
+        @return an integer representing the block mined time in milliseconds unit
+        """
+        return cls.get_block_cache().get_block_timestamp(block_number=block_number, fetch=cls.get_block_timestamp,
+                                                         fetch_last_block=cls.get_last_block)
+
     @staticmethod
     def get_balance(token: dict, addresses: list, until_block: Union[int, Literal["latest"]] = "latest"):
         """
@@ -290,6 +350,32 @@ class BaseNodeHandler:
         """
         raise NotImplementedError
 
+    @classmethod
+    def get_fee_oracle(cls) -> FeeOracle:
+        """
+        Returns the fee oracle of the network. It is created on the first call and its background refresh is started.
+        """
+        if "_FEE_ORACLE" not in cls.__dict__:
+            with cls._CACHE_LOCK:
+                if "_FEE_ORACLE" not in cls.__dict__:
+                    cls._FEE_ORACLE = FeeOracle(node_handler=cls)
+                    cls._FEE_ORACLE.start()
+        return cls._FEE_ORACLE
+
+    @classmethod
+    def get_cached_network_fee(cls, token: dict) -> dict:
+        """
+        Same as get_network_fee, but the fee is served from memory and refreshed in the background
+        """
+        return cls.get_fee_oracle().get_network_fee(token=token)
+
+    @classmethod
+    def get_cached_all_tokens_network_fees(cls, tokens: list) -> list:
+        """
+        Same as get_all_tokens_network_fees, but the fees are served from memory and refreshed in the background
+        """
+        return cls.get_fee_oracle().get_all_tokens_network_fees(tokens=tokens)
+
     @staticmethod
     def get_deposits_by_block(addresses: list, from_block: int, until_block: int, tokens: list) -> list:
         """
@@ -302,6 +388,7 @@ class BaseNodeHandler:
                 "sub_address": "asdfwevwef",
             }, ...
         ]
+            or an AddressIndex of them. Use AddressIndex.compile(addresses) to match the outputs in O(1).
         @param from_block: open lower bound of the block which we are looking deposits
         @param until_block: closed upper bound of the block which we are looking deposits
         @param tokens: tokens which we want to check their deposits in format of list of dicts:
@@ -343,6 +430,37 @@ class BaseNodeHandler:
         """
         raise NotImplementedError
 
+    @classmethod
+    def iter_deposits_by_block(cls, addresses: list, from_block: int, until_block: int, tokens: list,
+                               blocks_per_call: int = 1) -> Iterator[tuple]:
+        """
+        Same as get_deposits_by_block, but yields the deposits block by block instead of returning all of them at once,
+        so a long scan doesn't hold all the deposits in memory and they can be processed as soon as their block is read
+        @param addresses: same as get_deposits_by_block. A list is compiled to an AddressIndex once for all the calls.
+        @param from_block: open lower bound of the block which we are looking deposits
+        @param until_block: closed upper bound of the block which we are looking deposits
+        @param tokens: same as get_deposits_by_block
+        @param blocks_per_call: Number of the blocks that are asked from get_deposits_by_block in each call
+        @return: a generator of (cursor, deposits) tuples for each block from from_block + 1 to until_block, where
+            deposits is the list of the deposits of the block (in the format of get_deposits_by_block) and cursor is
+            the height of the block. Every block up to the cursor is fully processed, so the scan can be resumed by
+            passing the last cursor as from_block.
+        @raise ValueError: if blocks_per_call isn't positive (raised when the iteration starts)
+        """
+        if blocks_per_call < 1:
+            raise ValueError(f"blocks_per_call must be at least 1, not {blocks_per_call}")
+        addresses = AddressIndex.compile(addresses)
+        cursor = from_block
+        while cursor < until_block:
+            window_end = min(cursor + blocks_per_call, until_block)
+            deposits_by_block = {}
+            for deposit in cls.get_deposits_by_block(addresses=addresses, from_block=cursor,
+                                                     until_block=window_end, tokens=tokens):
+                deposits_by_block.setdefault(deposit["block"], []).append(deposit)
+            for block in range(cursor + 1, window_end + 1):
+                yield block, deposits_by_block.pop(block, [])
+            cursor = window_end
+
     @staticmethod
     def get_deposits_by_time(addresses: list, from_time: int, until_time: int, tokens: list) -> list:
         """
@@ -355,6 +473,7 @@ class BaseNodeHandler:
                 "sub_address": "asdfwevwef",
             }, ...
         ]
+            or an AddressIndex of them. Use AddressIndex.compile(addresses) to match the outputs in O(1).
         @param from_time: closed lower bound of the time which we are looking deposits in milliseconds
         @param until_time: open upper bound of the time which we are looking deposits in milliseconds
         @param tokens: tokens which we want to check their deposits in format of list of dicts:
@@ -651,6 +770,7 @@ class BaseNodeHandler:
                 "sub_address": "sub_address_1"
             }, ...
         ]
+            or an AddressIndex of them. Use AddressIndex.compile(addresses) to match the outputs in O(1).
         @param token: The token which trying to create transaction of it in dict format of:
         {
             "token_symbol": "USDT",
@@ -673,3 +793,78 @@ class BaseNodeHandler:
          in the wrong format
         """
         raise NotImplementedError
+
+    @classmethod
+    def is_block_confirmed(cls, block: Optional[int]) -> bool:
+        """
+        @param block: Height of a block
+        @return: Whether the block has at least min_confirmation confirmations
+        """
+        if block is None:
+            return False
+        cls.get_cached_last_block()
+        return cls.get_block_cache().is_final(block)
+
+    @classmethod
+    def _read_through_transaction_cache(cls, function: str, txid: str, fetch, get_block, **arguments):
+        """
+        Returns the cached result of the function for the transaction, or fetches it and caches it if the
+        transaction is confirmed.
+        @param function: Name of the function, e.g. "get_transaction_info"
+        @param txid: Transaction id
+        @param fetch: A function without argument that gets the result from the node
+        @param get_block: A function that gets the block of the transaction from the result
+        @param arguments: Arguments of the function other than txid
+        """
+        cache = cls.TRANSACTION_CACHE
+        if cache is None:
+            return fetch()
+        found, result = cache.get(network=cls.NETWORK_NAME, txid=txid, function=function, arguments=arguments)
+        if found:
+            return result
+        result = fetch()
+        if result is not None and cls.is_block_confirmed(get_block(result)):
+            cache.set(network=cls.NETWORK_NAME, txid=txid, function=function, result=result, arguments=arguments)
+        return result
+
+    @classmethod
+    def get_cached_transaction_info(cls, txid: str, tokens: list, addresses: list = None) -> dict:
+        """
+        Same as get_transaction_info, but it reads through TRANSACTION_CACHE
+        """
+        return cls._read_through_transaction_cache(
+            function="get_transaction_info", txid=txid,
+            fetch=lambda: cls.get_transaction_info(txid=txid, tokens=tokens, addresses=addresses),
+            get_block=lambda transaction_info: transaction_info.get("block"),
+            tokens=tokens, addresses=addresses)
+
+    @classmethod
+    def get_cached_block_by_transaction_id(cls, txid: str) -> int:
+        """
+        Same as get_block_by_transaction_id, but it reads through TRANSACTION_CACHE
+        """
+        return cls._read_through_transaction_cache(
+            function="get_block_by_transaction_id", txid=txid,
+            fetch=lambda: cls.get_block_by_transaction_id(txid=txid),
+            get_block=lambda block: block)
+
+    @classmethod
+    def get_cached_fee_by_transaction_id(cls, txid: str) -> Decimal:
+        """
+        Same as get_fee_by_transaction_id, but it reads through TRANSACTION_CACHE
+        """
+        return cls._read_through_transaction_cache(
+            function="get_fee_by_transaction_id", txid=txid,
+            fetch=lambda: cls.get_fee_by_transaction_id(txid=txid),
+            get_block=lambda fee: cls.get_cached_block_by_transaction_id(txid=txid))
+
+    @classmethod
+    def get_cached_received_amount_in_transaction(cls, txid: str, addresses: list, token: dict) -> list:
+        """
+        Same as get_received_amount_in_transaction, but it reads through TRANSACTION_CACHE
+        """
+        return cls._read_through_transaction_cache(
+            function="get_received_amount_in_transaction", txid=txid,
+            fetch=lambda: cls.get_received_amount_in_transaction(txid=txid, addresses=addresses, token=token),
+            get_block=lambda received_amounts: cls.get_cached_block_by_transaction_id(txid=txid),
+            addresses=addresses, token=token)
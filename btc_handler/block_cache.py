@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+"""
+    > Block Cache
+    In-memory cache of the last block and the block timestamps of a network.
+    => A block with at least min_confirmation confirmations can't change anymore, so its timestamp is kept until the
+       cache is full (least recently used blocks are dropped first).
+    => The last block and the timestamps of the shallower blocks are only kept for TIP_TTL seconds, because they may
+       still be replaced by a reorg.
+    => If the node reports a lower last block than before, or invalidate_from is called (e.g. by a reorg detector),
+       the blocks above that height are dropped.
+"""
+
+
+class BlockCache:
+    def __init__(self, min_confirmation: int, block_time: float, max_size: int = 1024, tip_ttl: float = None):
+        """
+        @param min_confirmation: min_confirmation of the network (from get_network_configuration)
+        @param block_time: block_time of the network in seconds (from get_network_configuration)
+        @param max_size: Maximum number of the block timestamps that are kept
+        @param tip_ttl: Seconds that the last block and the unconfirmed timestamps are kept. It is block_time / 4 by
+            default, so a new block is seen at most a quarter of a block late.
+        """
+        self.MIN_CONFIRMATION = min_confirmation
+        self.MAX_SIZE = max_size
+        self.TIP_TTL = block_time / 4 if tip_ttl is None else tip_ttl
+        self._last_block = None
+        self._last_block_cached_at = 0
+        self._timestamps = OrderedDict()  # {block_number: (timestamp, cached_at)}
+        self._lock = threading.Lock()
+
+    def is_final(self, block_number: int) -> bool:
+        """
+        @param block_number: Height of the block
+        @return: Whether the block has enough confirmations that it can't be replaced by a reorg
+        """
+        return self._last_block is not None and self._last_block - block_number + 1 >= self.MIN_CONFIRMATION
+
+    def get_last_block(self, fetch) -> int:
+        """
+        @param fetch: The function that gets the last block from the node, like get_last_block of the Node Handler
+        @return: Height of the last mined block
+        """
+        with self._lock:
+            if self._last_block is not None and time.monotonic() - self._last_block_cached_at < self.TIP_TTL:
+                return self._last_block
+        last_block = fetch()
+        with self._lock:
+            if self._last_block is not None and last_block < self._last_block:
+                self._invalidate_from(last_block + 1)
+            self._last_block = last_block
+            self._last_block_cached_at = time.monotonic()
+        return last_block
+
+    def get_block_timestamp(self, block_number: int, fetch, fetch_last_block=None) -> int:
+        """
+        @param block_number: Height of the block
+        @param fetch: The function that gets the timestamp of a block from the node,
+            like get_block_timestamp of the Node Handler
+        @param fetch_last_block: The function that gets the last block from the node. If it is given, an expired
+            timestamp refreshes the last block first (through get_last_block), so a block that became final is kept
+            even if nobody else asks for the last block.
+        @return: Timestamp of the block
+        """
+        with self._lock:
+            cached = self._timestamps.get(block_number)
+            if cached is not None:
+                timestamp, cached_at = cached
+                if self.is_final(block_number) or time.monotonic() - cached_at < self.TIP_TTL:
+                    self._timestamps.move_to_end(block_number)
+                    return timestamp
+        if cached is not None and fetch_last_block is not None:
+            self.get_last_block(fetch_last_block)
+            with self._lock:
+                if self.is_final(block_number) and self._timestamps.get(block_number) == cached:
+                    self._timestamps.move_to_end(block_number)
+                    return cached[0]
+        timestamp = fetch(block_number)
+        with self._lock:
+            self._timestamps[block_number] = (timestamp, time.monotonic())
+            self._timestamps.move_to_end(block_number)
+            while len(self._timestamps) > self.MAX_SIZE:
+                self._timestamps.popitem(last=False)
+        return timestamp
+
+    def invalidate_from(self, block_number: int):
+        """
+        Drops the cached data of the block and the blocks above it, e.g. after a reorg.
+        @param block_number: Height of the first block that is not valid anymore
+        """
+        with self._lock:
+            self._invalidate_from(block_number)
+
+    def _invalidate_from(self, block_number: int):
+        for cached_block in [cached_block for cached_block in self._timestamps if cached_block >= block_number]:
+            del self._timestamps[cached_block]
+        if self._last_block is not None and self._last_block >= block_number:
+            self._last_block = None
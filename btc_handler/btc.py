@@ -1,7 +1,24 @@
+import threading
+from decimal import Decimal
+
+from balance_engine import BalanceEngine
+from balance_snapshots import BalanceSnapshotStore
 from base_node_handler import BaseNodeHandler
+from utxo_index import UTXOIndex
 
 
 class BTCHandler(BaseNodeHandler):
+    UTXO_INDEX: UTXOIndex = None
+    # Set it to a UTXOIndex of the watched addresses to answer get_balance and get_params locally when it is synced
+    BALANCE_SNAPSHOTS: BalanceSnapshotStore = None
+    # Set it to a BalanceSnapshotStore to answer get_balance with a historical until_block
+    _node_scan_lock = threading.Lock()
+
+    @staticmethod
+    def is_utxo_index_usable(addresses):
+        utxo_index = BTCHandler.UTXO_INDEX
+        return (utxo_index is not None and utxo_index.is_synced(BTCHandler.get_cached_last_block())
+                and utxo_index.is_watched(addresses))
 
     @staticmethod
     def get_network_configuration():
@@ -21,11 +38,35 @@ class BTCHandler(BaseNodeHandler):
 
     @staticmethod
     def get_balance(token, addresses, until_block="latest"):
-        return 1
+        if until_block != "latest":
+            snapshots = BTCHandler.BALANCE_SNAPSHOTS
+            if snapshots is None or not snapshots.covers(until_block=until_block, token=token, addresses=addresses):
+                raise NotImplementedError  # The node doesn't keep historical balances
+            return {"balances": BTCHandler.BALANCE_SNAPSHOTS.get_balance(token=token, addresses=addresses,
+                                                                         until_block=until_block),
+                    "until_block": until_block}
+        if BTCHandler.is_utxo_index_usable(addresses):
+            return {"balances": BTCHandler.UTXO_INDEX.get_balance(addresses), "until_block": until_block}
+        return BTCHandler.get_node_balance(token=token, addresses=addresses)
+
+    @staticmethod
+    def get_node_balance(token, addresses):
+        # Always asks the providers, even if the UTXO index could answer (e.g. for UTXOIndex.reconcile).
+        # All the addresses are scanned in one call, and the node runs one scan at a time, so the scans of this
+        # process wait for each other instead of being rejected.
+        with BTCHandler._node_scan_lock:
+            balances = BTCHandler.API_SWITCHER_CLIENT.request_providers(
+                function="balances", addresses=[address["address"] for address in addresses])
+        return {"balances": [{"address": address["address"], "sub_address": address["sub_address"],
+                              "balance": balances.get(address["address"],
+                                                      balances.get(address["address"].lower(), Decimal("0")))}
+                             for address in addresses],
+                "until_block": "latest"}
 
     @staticmethod
     def get_all_token_balances(tokens, addresses, until_block="latest"):
-        return 1
+        return BalanceEngine(node_handler=BTCHandler).get_all_token_balances(tokens=tokens, addresses=addresses,
+                                                                             until_block=until_block)
 
     @staticmethod
     def get_network_fee(token):
@@ -33,7 +74,9 @@ class BTCHandler(BaseNodeHandler):
 
     @staticmethod
     def get_all_tokens_network_fees(tokens):
-        return 1
+        # All the fees are paid in BTC by the size of the transaction, so one estimate is shared by all the tokens
+        network_fee = BTCHandler.get_network_fee(token=BTCHandler.NATIVE_TOKEN)
+        return [{"token": token, **network_fee} for token in tokens]
 
     @staticmethod
     def get_deposits_by_block(addresses, from_block, until_block, tokens):
@@ -45,6 +88,8 @@ class BTCHandler(BaseNodeHandler):
 
     @staticmethod
     def get_params(addresses):
+        if BTCHandler.is_utxo_index_usable(addresses):
+            return BTCHandler.UTXO_INDEX.get_params(addresses)
         return 1
 
     @staticmethod
@@ -0,0 +1,102 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from btc_handler.address_index import AddressIndex
+from btc_handler.records import DepositBatch
+
+"""
+    > Deposit Scanner
+    Scans a long block range for deposits by splitting it into shards that are fetched concurrently.
+    => The shards are (lower, upper] windows that don't overlap, so each block belongs to exactly one shard.
+       Deposits that a node returns outside of their shard or twice are dropped, so every deposit is yielded once.
+       A deposit is identified by its txid, to_address, param (the output index on UTXO networks), amount, memo and
+       token, so two outputs of one transaction to the same address stay two deposits.
+    => The results are yielded in block order with the same (cursor, deposits) format of iter_deposits_by_block,
+       so a scan can be resumed from the last cursor.
+"""
+
+
+class DepositScanner:
+    def __init__(self, node_handler, max_workers: int = 8, shard_size: int = 100):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param max_workers: Maximum number of the shards that are fetched at the same time
+        @param shard_size: Number of the blocks of each shard (each shard is one get_deposits_by_block call)
+        """
+        self.NODE_HANDLER = node_handler
+        self.MAX_WORKERS = max_workers
+        self.SHARD_SIZE = shard_size
+
+    def get_shards(self, from_block: int, until_block: int) -> list:
+        """
+        @param from_block: open lower bound of the block range
+        @param until_block: closed upper bound of the block range
+        @return: A list of (shard_from_block, shard_until_block) with the same open/closed bounds
+        """
+        return [(shard_from_block, min(shard_from_block + self.SHARD_SIZE, until_block))
+                for shard_from_block in range(from_block, until_block, self.SHARD_SIZE)]
+
+    def _get_shard_deposits(self, addresses: list, shard: tuple, tokens: list) -> dict:
+        shard_from_block, shard_until_block = shard
+        deposits_by_block = {}
+        seen = set()
+        for deposit in self.NODE_HANDLER.get_deposits_by_block(addresses=addresses, from_block=shard_from_block,
+                                                               until_block=shard_until_block, tokens=tokens):
+            if not shard_from_block < deposit["block"] <= shard_until_block:
+                continue
+            token = deposit["token"]
+            key = (deposit["txid"], deposit["to_address"], deposit.get("param"), deposit["amount"], deposit.get("memo"),
+                   token["token_symbol"], token.get("contract_address"), token.get("identifier"))
+            if key in seen:
+                continue
+            seen.add(key)
+            deposits_by_block.setdefault(deposit["block"], []).append(deposit)
+        return deposits_by_block
+
+    def iter_deposits(self, addresses: list, from_block: int, until_block: int, tokens: list) -> Iterator[tuple]:
+        """
+        Same as iter_deposits_by_block of the Node Handler, but the shards are fetched concurrently
+        @param addresses: same as get_deposits_by_block. A list is compiled to an AddressIndex once for all the shards.
+        @param from_block: open lower bound of the block which we are looking deposits
+        @param until_block: closed upper bound of the block which we are looking deposits
+        @param tokens: same as get_deposits_by_block
+        @return: a generator of (cursor, deposits) tuples for each block from from_block + 1 to until_block.
+            At most 2 * MAX_WORKERS shards are fetched ahead of the consumer.
+        """
+        addresses = AddressIndex.compile(addresses)
+        shards = iter(self.get_shards(from_block=from_block, until_block=until_block))
+        executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="deposit-scanner")
+        pending = deque()
+        try:
+            for shard in shards:
+                pending.append((shard, executor.submit(self._get_shard_deposits, addresses, shard, tokens)))
+                if len(pending) >= 2 * self.MAX_WORKERS:
+                    break
+            while pending:
+                (shard_from_block, shard_until_block), future = pending.popleft()
+                deposits_by_block = future.result()
+                next_shard = next(shards, None)
+                if next_shard is not None:
+                    pending.append((next_shard,
+                                    executor.submit(self._get_shard_deposits, addresses, next_shard, tokens)))
+                for block in range(shard_from_block + 1, shard_until_block + 1):
+                    yield block, deposits_by_block.pop(block, [])
+        finally:
+            for _, future in pending:
+                future.cancel()  # shutdown(cancel_futures=True) needs Python 3.9
+            executor.shutdown(wait=False)
+
+    def get_deposits(self, addresses: list, from_block: int, until_block: int, tokens: list,
+                     compact: bool = False):
+        """
+        Same as get_deposits_by_block of the Node Handler, but the shards are fetched concurrently
+        @param compact: Whether the deposits are kept in a DepositBatch instead of a list of dicts. It takes about a
+            tenth of the memory of the dicts for a long scan. Use its to_dicts to get the dicts.
+        @return: a list of deposits in the format of get_deposits_by_block (or a DepositBatch), sorted by block
+        """
+        deposits = DepositBatch() if compact else []
+        for _, block_deposits in self.iter_deposits(addresses=addresses, from_block=from_block,
+                                                    until_block=until_block, tokens=tokens):
+            deposits.extend(block_deposits)
+        return deposits
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from btc_handler.address_index import AddressIndex
+from btc_handler.exceptions import InvalidBlockError
+
+"""
+    > Deposit Watcher
+    Follows the tip of a network and reports the deposits of the new blocks exactly in the order they are mined.
+    => The checkpoint (last processed block, its hash and the hashes and deposits of the last MAX_REORG_DEPTH blocks)
+       is written to a JSON file after each step, so a restart only reads that file and continues from the checkpoint.
+    => Each new block must point to the hash of the previous one. If it doesn't, the orphaned blocks are walked back
+       to the common ancestor, on_rollback is called for each of them (newest first) and the new chain is scanned.
+    => The callbacks run before the checkpoint is saved, so after a crash a block may be reported again but never lost.
+    => A reorg deeper than MAX_REORG_DEPTH raises InvalidBlockError and leaves the checkpoint as it was, so no block
+       is skipped. It needs a manual decision (a larger MAX_REORG_DEPTH or a rescan).
+"""
+
+
+def _encode_checkpoint_value(value):
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if hasattr(value, "to_dict"):  # Deposit records
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} can't be stored in the checkpoint")
+
+
+def _decode_checkpoint_object(value: dict):
+    if len(value) == 1 and "__decimal__" in value:
+        return Decimal(value["__decimal__"])
+    return value
+
+
+class DepositWatcher:
+    def __init__(self, node_handler, addresses, tokens: list, checkpoint_path: str, on_deposits=None,
+                 on_rollback=None, start_block: int = None, blocks_per_call: int = 1, max_reorg_depth: int = None):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param addresses: same as get_deposits_by_block (a list is compiled to an AddressIndex once)
+        @param tokens: same as get_deposits_by_block
+        @param checkpoint_path: Path of the checkpoint file. It is created if it doesn't exist.
+        @param on_deposits: A function of (block, deposits) that is called for each new block, even without deposits
+        @param on_rollback: A function of (block, deposits) that is called for each orphaned block with the deposits
+            that were reported for it
+        @param start_block: Block that the watcher starts after if there isn't any checkpoint. It is the last block
+            by default, so the history isn't scanned.
+        @param blocks_per_call: Number of the blocks that are asked from get_deposits_by_block in each call
+        @param max_reorg_depth: Number of the recent blocks that are kept for detecting reorgs. It is twice the
+            min_confirmation of the network by default.
+        """
+        self.NODE_HANDLER = node_handler
+        self.ADDRESSES = AddressIndex.compile(addresses)
+        self.TOKENS = tokens
+        self.CHECKPOINT_PATH = checkpoint_path
+        self.ON_DEPOSITS = on_deposits
+        self.ON_ROLLBACK = on_rollback
+        self.START_BLOCK = start_block
+        self.BLOCKS_PER_CALL = blocks_per_call
+        configuration = node_handler.get_network_configuration()
+        self.BLOCK_TIME = configuration["block_time"]
+        self.MAX_REORG_DEPTH = max_reorg_depth or max(2 * configuration["min_confirmation"], 1)
+        self._recent_blocks = OrderedDict()  # {block: (hash, deposits)} of the last MAX_REORG_DEPTH blocks
+        self._stop_event = threading.Event()
+        self.load_checkpoint()
+
+    @property
+    def last_block(self):
+        """
+        @return: Height of the last processed block, or None if nothing is processed yet
+        """
+        return next(reversed(self._recent_blocks), None)
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.CHECKPOINT_PATH):
+            return
+        with open(self.CHECKPOINT_PATH, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file, object_hook=_decode_checkpoint_object)
+        if checkpoint["network"] != self.NODE_HANDLER.NETWORK_NAME:
+            raise ValueError(f"The checkpoint belongs to the {checkpoint['network']} network")
+        self._recent_blocks = OrderedDict((recent_block["block"], (recent_block["hash"], recent_block["deposits"]))
+                                          for recent_block in checkpoint["recent_blocks"])
+
+    def save_checkpoint(self):
+        temporary_path = f"{self.CHECKPOINT_PATH}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump({"network": self.NODE_HANDLER.NETWORK_NAME,
+                       "recent_blocks": [{"block": block, "hash": block_hash, "deposits": deposits}
+                                         for block, (block_hash, deposits) in self._recent_blocks.items()]},
+                      checkpoint_file, default=_encode_checkpoint_value)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.CHECKPOINT_PATH)
+
+    def _rollback(self):
+        """
+        Drops the recent blocks that aren't in the chain of the node anymore, newest first.
+        @raise InvalidBlockError: if none of the recent blocks is in the chain of the node. The checkpoint isn't changed.
+        """
+        orphaned_blocks = []
+        for block, (block_hash, _) in reversed(self._recent_blocks.items()):
+            if self.NODE_HANDLER.get_block_header(block)["hash"] == block_hash:
+                break
+            orphaned_blocks.append(block)
+        else:
+            raise InvalidBlockError(block=orphaned_blocks[-1] if orphaned_blocks else None,
+                                    message=f"The reorg is deeper than the last {self.MAX_REORG_DEPTH} blocks")
+        if not orphaned_blocks:
+            return  # The chain changed back while it was read
+        for block in orphaned_blocks:
+            _, deposits = self._recent_blocks.pop(block)
+            if self.ON_ROLLBACK is not None:
+                self.ON_ROLLBACK(block, deposits)
+        self.NODE_HANDLER.get_block_cache().invalidate_from(orphaned_blocks[-1])
+        self.save_checkpoint()
+
+    def poll(self) -> int:
+        """
+        Processes the blocks that are mined since the checkpoint
+        @return: Number of the processed blocks
+        """
+        last_block = self.NODE_HANDLER.get_cached_last_block()
+        if self.last_block is None:
+            start_block = last_block if self.START_BLOCK is None else self.START_BLOCK
+            self._recent_blocks[start_block] = (self.NODE_HANDLER.get_block_header(start_block)["hash"], [])
+            self.save_checkpoint()
+        processed_blocks = 0
+        while not self._stop_event.is_set() and self.last_block < last_block:
+            from_block = self.last_block
+            until_block = min(from_block + self.BLOCKS_PER_CALL, last_block)
+            headers = [self.NODE_HANDLER.get_block_header(block) for block in range(from_block + 1, until_block + 1)]
+            if headers[0]["parent_hash"] != self._recent_blocks[from_block][0]:
+                self._rollback()
+                continue
+            if any(header["parent_hash"] != parent["hash"] for parent, header in zip(headers, headers[1:])):
+                break  # The chain changed while reading the headers, so it is read again in the next poll
+            deposits_by_block = {}
+            for deposit in self.NODE_HANDLER.get_deposits_by_block(addresses=self.ADDRESSES, from_block=from_block,
+                                                                   until_block=until_block, tokens=self.TOKENS):
+                deposits_by_block.setdefault(deposit["block"], []).append(deposit)
+            if self.NODE_HANDLER.get_block_header(until_block)["hash"] != headers[-1]["hash"]:
+                break  # The deposits may belong to another chain
+            for header in headers:
+                deposits = deposits_by_block.get(header["block"], [])
+                if self.ON_DEPOSITS is not None:
+                    self.ON_DEPOSITS(header["block"], deposits)
+                self._recent_blocks[header["block"]] = (header["hash"], deposits)
+                while len(self._recent_blocks) > self.MAX_REORG_DEPTH:
+                    self._recent_blocks.popitem(last=False)
+                processed_blocks += 1
+            self.save_checkpoint()
+        return processed_blocks
+
+    def run(self, interval: float = None):
+        """
+        Polls the network until stop is called
+        @param interval: Seconds between the polls. It is a quarter of block_time by default.
+        """
+        interval = self.BLOCK_TIME / 4 if interval is None else interval
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(interval)
+
+    def stop(self):
+        self._stop_event.set()
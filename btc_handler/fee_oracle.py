@@ -0,0 +1,162 @@
+import threading
+import time
+
+"""
+    > Fee Oracle
+    Serves the network fees of a Node Handler from memory and refreshes them in the background.
+    => All the known tokens are refreshed together with one get_all_tokens_network_fees call. If it fails, or leaves
+       some tokens out, they are fetched one by one. A token is only known after it got a fee.
+    => A quote is fresh for REFRESH_INTERVAL seconds. After that it is still returned (stale-while-revalidate) and a
+       refresh starts in the background. Only a quote older than MAX_AGE, or of a new token, waits for the node.
+    => start runs a daemon thread that refreshes the fees every REFRESH_INTERVAL, so the quotes are rarely stale.
+"""
+
+
+class FeeOracle:
+    def __init__(self, node_handler, refresh_interval: float = None, max_age: float = None):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param refresh_interval: Seconds that a quote is fresh. It is half of block_time by default.
+        @param max_age: Seconds that a stale quote can still be returned. It is 10 * refresh_interval by default.
+        """
+        self.NODE_HANDLER = node_handler
+        if refresh_interval is None:
+            refresh_interval = node_handler.get_network_configuration()["block_time"] / 2
+        self.REFRESH_INTERVAL = refresh_interval
+        self.MAX_AGE = 10 * refresh_interval if max_age is None else max_age
+        self._tokens = {}  # {token_key: token}
+        self._fees = {}  # {token_key: (fee, fetched_at)}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def get_token_key(token: dict) -> tuple:
+        return token["token_symbol"], token.get("contract_address"), token.get("identifier")
+
+    def refresh(self, tokens: list = ()):
+        """
+        Gets the fees of all the known tokens (and the given ones) from the node with one call.
+        If a refresh is already running, it waits for that one instead.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            with self._refresh_lock:
+                return
+        try:
+            with self._lock:
+                known_tokens = dict(self._tokens)
+            for token in tokens:
+                known_tokens.setdefault(self.get_token_key(token), token)
+            if known_tokens:
+                self._fetch(list(known_tokens.values()))
+        finally:
+            self._refresh_lock.release()
+
+    def _fetch(self, tokens: list) -> dict:
+        """
+        Gets the fees of the tokens with one get_all_tokens_network_fees call. If the call fails, or leaves some tokens
+        out, those tokens are fetched one by one with get_network_fee, so one bad token doesn't fail the others.
+        Only the tokens that got a fee are known (and refreshed) afterwards.
+        @return: {token_key: exception} of the tokens that didn't get a fee
+        """
+        fees = {}
+        if len(tokens) > 1:
+            try:
+                fees = {self.get_token_key(fee["token"]): fee
+                        for fee in self.NODE_HANDLER.get_all_tokens_network_fees(tokens=tokens)}
+            except Exception:
+                pass  # The tokens are fetched one by one below
+        errors = {}
+        for token in tokens:
+            token_key = self.get_token_key(token)
+            if token_key not in fees:
+                try:
+                    fees[token_key] = self.NODE_HANDLER.get_network_fee(token=token)
+                except Exception as error:
+                    errors[token_key] = error
+        fetched_at = time.monotonic()
+        with self._lock:
+            for token in tokens:
+                token_key = self.get_token_key(token)
+                if token_key in errors:
+                    self._tokens.pop(token_key, None)  # It is fetched again when it is asked for
+                    continue
+                self._tokens[token_key] = token
+                self._fees[token_key] = ({
+                    "default_fee": fees[token_key]["default_fee"],
+                    "additional_input_fee": fees[token_key]["additional_input_fee"],
+                    "additional_output_fee": fees[token_key]["additional_output_fee"],
+                }, fetched_at)
+        return errors
+
+    def _refresh_quietly(self, tokens: list = ()):
+        try:
+            self.refresh(tokens=tokens)
+        except Exception:
+            pass  # The quotes stay stale and the next refresh tries again
+
+    def _refresh_in_background(self, tokens: list):
+        if not self._refresh_lock.locked():
+            threading.Thread(target=self._refresh_quietly, args=(tokens,), name="fee-oracle-refresh",
+                             daemon=True).start()
+
+    def _get_cached_fees(self, tokens: list) -> tuple:
+        """
+        @return: ({token_key: fee} of the tokens with a quote younger than MAX_AGE, the tokens without one)
+        """
+        fees, stale_tokens, missing_tokens = {}, [], []
+        now = time.monotonic()
+        with self._lock:
+            for token in tokens:
+                token_key = self.get_token_key(token)
+                cached = self._fees.get(token_key)
+                if cached is None or now - cached[1] >= self.MAX_AGE:
+                    missing_tokens.append(token)
+                    continue
+                fees[token_key] = cached[0]
+                if now - cached[1] >= self.REFRESH_INTERVAL:
+                    stale_tokens.append(token)
+        if stale_tokens:
+            self._refresh_in_background(stale_tokens)
+        return fees, missing_tokens
+
+    def get_network_fee(self, token: dict) -> dict:
+        """
+        Same as get_network_fee of the Node Handler
+        """
+        fee = self.get_all_tokens_network_fees(tokens=[token])[0]
+        del fee["token"]
+        return fee
+
+    def get_all_tokens_network_fees(self, tokens: list) -> list:
+        """
+        Same as get_all_tokens_network_fees of the Node Handler
+        @raise: the exception of the node for a token that doesn't have a quote and can't be fetched
+        """
+        fees, missing_tokens = self._get_cached_fees(tokens)
+        if missing_tokens:
+            errors = self._fetch(missing_tokens)
+            if errors:
+                raise next(iter(errors.values()))
+            with self._lock:
+                fees.update((self.get_token_key(token), self._fees[self.get_token_key(token)][0])
+                            for token in missing_tokens)
+        return [{"token": token, **fees[self.get_token_key(token)]} for token in tokens]
+
+    def start(self):
+        """
+        Starts refreshing the fees of the known tokens every REFRESH_INTERVAL seconds in a daemon thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="fee-oracle", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.REFRESH_INTERVAL):
+            self._refresh_quietly()
+
+    def stop(self):
+        self._stop_event.set()
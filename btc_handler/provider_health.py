@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+
+"""
+    > Provider Health
+    Bookkeeping of how the providers of the API Switcher behave, so it can decide where to send the requests.
+    => A provider whose circuit is open (too many errors or banned) gets no requests until its cooldown is passed.
+       Then a probe request decides whether it is healthy again.
+    => Being rate limited isn't a failure of the provider: the rate limiter and the retry policy wait for its
+       Retry-After instead.
+"""
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        """
+        Keeps the latency of the last requests of a provider.
+        @param size: Number of the last requests that are kept
+        @param min_samples: Number of the requests that are needed before percentile returns a value
+        """
+        self.SIZE = size
+        self.MIN_SAMPLES = min_samples
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        """
+        @param latency: Duration of a successful request in seconds
+        """
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percentile: float):
+        """
+        @param percentile: A number between 0 and 1, e.g. 0.95 for p95
+        @return: The latency in seconds that the given share of the requests are faster than it,
+            or None if there are less than MIN_SAMPLES requests
+        """
+        with self._lock:
+            if len(self._latencies) < self.MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(int(percentile * len(latencies)), len(latencies) - 1)]
+
+
+class ProviderHealth:
+    CLOSED = "closed"  # The provider gets requests
+    OPEN = "open"  # The provider is failing and gets no requests until COOLDOWN is passed
+    HALF_OPEN = "half-open"  # COOLDOWN is passed and a few probe requests decide whether the provider is back
+
+    def __init__(self, window: int = 50, min_requests: int = 10, error_threshold: float = 0.5,
+                 cooldown: float = 30, half_open_probes: int = 1, ewma_alpha: float = 0.2):
+        """
+        Keeps the health of a provider: its recent error rate, its average latency and its circuit breaker.
+        @param window: Number of the last requests that the error rate is calculated on
+        @param min_requests: Number of the requests in the window that are needed before the error rate can open
+            the circuit
+        @param error_threshold: Error rate (between 0 and 1) that opens the circuit
+        @param cooldown: Seconds that the circuit stays open before the provider is probed again
+        @param half_open_probes: Number of the requests that are let through at the same time to probe the provider
+        @param ewma_alpha: Weight of the last latency in the exponentially weighted moving average of the latency
+        """
+        self.MIN_REQUESTS = min_requests
+        self.ERROR_THRESHOLD = error_threshold
+        self.COOLDOWN = cooldown
+        self.HALF_OPEN_PROBES = half_open_probes
+        self.EWMA_ALPHA = ewma_alpha
+        self.LATENCIES = LatencyWindow()
+        self.state = self.CLOSED
+        self.ewma_latency = None
+        self.failed_at = None  # time.monotonic() of the last failure
+        self._errors = deque(maxlen=window)
+        self._changed_at = 0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self._errors) / len(self._errors) if self._errors else 0.0
+
+    def is_available(self) -> bool:
+        """
+        @return: Whether a request can be sent to the provider now
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._changed_at >= self.COOLDOWN:
+                self._set_state(self.HALF_OPEN, now)
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.HALF_OPEN_PROBES and now - self._changed_at >= self.COOLDOWN:
+                    # The probes never came back (e.g. they were cancelled), so let new ones through
+                    self._set_state(self.HALF_OPEN, now)
+                return self._probes < self.HALF_OPEN_PROBES
+            return self.state == self.CLOSED
+
+    def start_request(self):
+        """
+        Call it when a request is sent to the provider.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probes += 1
+
+    def probe(self):
+        """
+        Lets a probe request through an open circuit before its cooldown is passed, e.g. when the circuits of all
+        the providers are open. The result of the probe closes or opens the circuit again.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                self._set_state(self.HALF_OPEN, time.monotonic())
+
+    def end_request(self):
+        """
+        Call it when a request ended without telling anything about the health of the provider, e.g. it was rate
+        limited. A probe slot that the request had taken is freed.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record_success(self, latency: float):
+        """
+        @param latency: Duration of the request in seconds
+        """
+        self.LATENCIES.record(latency)
+        with self._lock:
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * self.ewma_latency
+            self._errors.append(False)
+            if self.state == self.HALF_OPEN:
+                self._errors.clear()
+                self._set_state(self.CLOSED, time.monotonic())
+
+    def record_failure(self, trip: bool = False):
+        """
+        @param trip: Open the circuit right away, e.g. when the provider says we are banned
+        """
+        with self._lock:
+            self.failed_at = time.monotonic()
+            self._errors.append(True)
+            if trip or self.state == self.HALF_OPEN or (
+                    len(self._errors) >= self.MIN_REQUESTS
+                    and sum(self._errors) / len(self._errors) >= self.ERROR_THRESHOLD):
+                self._set_state(self.OPEN, time.monotonic())
+
+    def _set_state(self, state: str, now: float):
+        self.state = state
+        self._changed_at = now
+        self._probes = 0
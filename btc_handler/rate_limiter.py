@@ -0,0 +1,107 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # fcntl is only needed by FileTokenBucket and isn't available on Windows
+    fcntl = None
+
+"""
+    > Rate Limiter
+    Client-side rate limiting of the requests that the API Switcher sends to a provider.
+    => The limiters queue the requests (the caller sleeps until its turn) instead of failing them, so the provider gets
+       the highest rate that it accepts without rate limiting or banning us.
+    => TokenBucket is shared between the threads of a process. FileTokenBucket keeps its state in a local file, so it
+       is shared between the processes of a machine too.
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        """
+        @param rate: Number of the requests per second that the provider accepts
+        @param burst: Number of the requests that can be sent at once after a quiet time. It is the rate by default.
+        """
+        self.RATE = rate
+        self.BURST = burst or max(1, rate)
+        self._tokens = self.BURST
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float) -> float:
+        # The tokens can go below zero: each caller reserves its own turn, so the waiting callers are served in order
+        now = time.time()
+        self._tokens = min(self.BURST, self._tokens + max(0.0, now - self._updated_at) * self.RATE)
+        self._updated_at = now
+        self._tokens -= tokens
+        return max(0.0, -self._tokens / self.RATE)
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes the tokens of a request from the bucket.
+        @param tokens: Number of the tokens that the request needs
+        @return: Seconds that the caller has to wait before sending the request
+        """
+        with self._lock:
+            return self._take(tokens)
+
+    def acquire(self, tokens: float = 1):
+        """
+        Blocks until the request can be sent.
+        @param tokens: Number of the tokens that the request needs
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1):
+        """
+        Async twin of acquire. It doesn't block the event loop.
+        @param tokens: Number of the tokens that the request needs
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Holds the next requests back for at least the given seconds, e.g. the Retry-After of a 429 response.
+        @param seconds: Seconds that the provider asked us to wait
+        """
+        if seconds and seconds > 0:
+            self.reserve(self.BURST + seconds * self.RATE)
+
+
+class FileTokenBucket(TokenBucket):
+    STATE_FORMAT = "dd"  # (tokens, updated_at)
+
+    def __init__(self, path: str, rate: float, burst: float = None):
+        """
+        @param path: Path of the file that keeps the state of the bucket. All the processes that use the same path
+            share the same bucket.
+        @param rate: Number of the requests per second that the provider accepts
+        @param burst: Number of the requests that can be sent at once after a quiet time. It is the rate by default.
+        """
+        if fcntl is None:
+            raise NotImplementedError("FileTokenBucket needs fcntl, which isn't available on this platform")
+        super().__init__(rate=rate, burst=burst)
+        self.PATH = path
+
+    def reserve(self, tokens: float = 1) -> float:
+        with self._lock:
+            fd = os.open(self.PATH, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                state = os.pread(fd, struct.calcsize(self.STATE_FORMAT), 0)
+                if len(state) == struct.calcsize(self.STATE_FORMAT):
+                    self._tokens, self._updated_at = struct.unpack(self.STATE_FORMAT, state)
+                else:
+                    self._tokens, self._updated_at = self.BURST, time.time()
+                wait = self._take(tokens)
+                os.pwrite(fd, struct.pack(self.STATE_FORMAT, self._tokens, self._updated_at), 0)
+                return wait
+            finally:
+                os.close(fd)  # Closing the file releases the lock
@@ -0,0 +1,264 @@
+import sys
+import weakref
+from array import array
+
+from btc_handler.amounts import to_base_unit, from_base_unit
+
+"""
+    > Records
+    Compact types for the deposits and transactions of the Node Handlers, for scans that keep millions of them.
+    => The records have __slots__ instead of a __dict__ and share one interned dict per token instead of a copy of it.
+       A token is interned only while a record or a DepositBatch holds it.
+       They can be read like the documented dicts (record["txid"], record.get("memo")) and to_dict gives the dict.
+    => DepositBatch keeps many deposits in columns (arrays of integers and interned strings) and is the most compact
+       way to hold a long scan. Its amounts are stored in the base unit of their token. An amount that has more digits
+       than the decimals of its token (like a float) is kept as it is.
+    => A token dict that is shared by the records must not be changed.
+"""
+
+
+class _Token(dict):
+    __slots__ = ("__weakref__",)  # A dict can't be weakly referenced
+
+
+_TOKENS = weakref.WeakValueDictionary()
+
+
+def get_token_key(token: dict) -> tuple:
+    return tuple(sorted(token.items()))
+
+
+def intern_token(token: dict) -> dict:
+    """
+    @param token: A token dict
+    @return: A shared dict that is equal to the token
+    """
+    if token is None:
+        return None
+    key = get_token_key(token)
+    interned = _TOKENS.get(key)
+    if interned is None:
+        interned = _TOKENS.setdefault(key, _Token(token))
+    return interned
+
+
+def _intern_string(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+
+class Deposit(Record):
+    __slots__ = ("token", "from_address", "to_address", "txid", "amount", "block", "fee", "param", "memo")
+
+    def __init__(self, token: dict, from_address: str, to_address: str, txid: str, amount, block: int, fee=None,
+                 param=None, memo=None):
+        """
+        A deposit in the format of get_deposits_by_block. The token and the addresses are interned.
+        """
+        self.token = intern_token(token)
+        self.from_address = _intern_string(from_address)
+        self.to_address = _intern_string(to_address)
+        self.txid = txid
+        self.amount = amount
+        self.block = block
+        self.fee = fee
+        self.param = param
+        self.memo = memo
+
+
+class TransactionInput(Record):
+    __slots__ = ("address", "transaction_output_txid", "param")
+
+    def __init__(self, address: str, transaction_output_txid: str, param=None):
+        self.address = _intern_string(address)
+        self.transaction_output_txid = transaction_output_txid
+        self.param = param
+
+
+class TransactionOutput(Record):
+    __slots__ = ("address", "amount", "index")
+
+    def __init__(self, address: str, amount, index: int):
+        self.address = _intern_string(address)
+        self.amount = amount
+        self.index = index
+
+
+class Transaction(Record):
+    __slots__ = ("txid", "token", "transaction_inputs", "transaction_outputs", "total_amount", "timestamp", "block",
+                 "fee", "memo")
+
+    def __init__(self, txid: str, token: dict, transaction_inputs: list, transaction_outputs: list, total_amount,
+                 timestamp: int, block: int, fee=None, memo=None):
+        """
+        A transaction in the format of get_transaction_info. The inputs and outputs can be dicts or records.
+        """
+        self.txid = txid
+        self.token = intern_token(token)
+        self.transaction_inputs = [transaction_input if isinstance(transaction_input, TransactionInput)
+                                   else TransactionInput.from_dict(transaction_input)
+                                   for transaction_input in transaction_inputs]
+        self.transaction_outputs = [transaction_output if isinstance(transaction_output, TransactionOutput)
+                                    else TransactionOutput.from_dict(transaction_output)
+                                    for transaction_output in transaction_outputs]
+        self.total_amount = total_amount
+        self.timestamp = timestamp
+        self.block = block
+        self.fee = fee
+        self.memo = memo
+
+    def to_dict(self) -> dict:
+        transaction = super().to_dict()
+        transaction["transaction_inputs"] = [transaction_input.to_dict()
+                                             for transaction_input in self.transaction_inputs]
+        transaction["transaction_outputs"] = [transaction_output.to_dict()
+                                              for transaction_output in self.transaction_outputs]
+        return transaction
+
+
+def to_dicts(records) -> list:
+    """
+    @param records: Records, a DepositBatch or dicts
+    @return: A list of the documented dicts of them
+    """
+    return [record.to_dict() if isinstance(record, Record) else record for record in records]
+
+
+class DepositBatch:
+    _INT64_RANGE = range(-2 ** 63, 2 ** 63)
+
+    def __init__(self, deposits=()):
+        """
+        @param deposits: deposits in the format of get_deposits_by_block (dicts or Deposit records)
+        """
+        self._tokens = []
+        self._token_indexes = {}  # {token key: index in _tokens}
+        self._strings = []
+        self._string_indexes = {}  # {string: index in _strings}, for the addresses
+        self._values = {}  # {repr of value: value}, so the equal fees and params share one object
+        self._token_column = array("I")
+        self._from_address_column = array("I")
+        self._to_address_column = array("I")
+        self._txid_column = bytearray()  # 32 bytes per txid
+        self._amount_column = array("q")
+        self._block_column = array("q")
+        self._fee_column = []
+        self._param_column = []
+        self._overflow = {}  # {(field, index): value} for the values that don't fit in their column
+        self.extend(deposits)
+
+    def _get_string_index(self, value) -> int:
+        index = self._string_indexes.get(value)
+        if index is None:
+            index = self._string_indexes[value] = len(self._strings)
+            self._strings.append(value)
+        return index
+
+    def _share(self, value):
+        return self._values.setdefault((type(value), repr(value)), value) if value is not None else None
+
+    def append(self, deposit):
+        index = len(self._block_column)
+        token = deposit["token"]
+        token_key = get_token_key(token)
+        token_index = self._token_indexes.get(token_key)
+        if token_index is None:
+            token_index = self._token_indexes[token_key] = len(self._tokens)
+            self._tokens.append(intern_token(token))
+        self._token_column.append(token_index)
+        self._from_address_column.append(self._get_string_index(deposit["from_address"]))
+        self._to_address_column.append(self._get_string_index(deposit["to_address"]))
+        txid = deposit["txid"]
+        try:
+            txid_bytes = bytes.fromhex(txid)
+        except (TypeError, ValueError):
+            txid_bytes = b""
+        if len(txid_bytes) != 32 or txid_bytes.hex() != txid:
+            self._overflow["txid", index] = txid
+            txid_bytes = bytes(32)
+        self._txid_column += txid_bytes
+        try:
+            amount = to_base_unit(deposit["amount"], token["decimals"])
+        except ValueError:
+            self._overflow["original_amount", index] = deposit["amount"]
+            amount = 0
+        if amount not in self._INT64_RANGE:
+            self._overflow["amount", index] = amount
+            amount = 0
+        self._amount_column.append(amount)
+        self._block_column.append(deposit["block"])
+        self._fee_column.append(self._share(deposit.get("fee")))
+        self._param_column.append(self._share(deposit.get("param")))
+        memo = deposit.get("memo")
+        if memo is not None:
+            self._overflow["memo", index] = memo
+
+    def extend(self, deposits):
+        for deposit in deposits:
+            self.append(deposit)
+
+    def __len__(self) -> int:
+        return len(self._block_column)
+
+    def get_deposit(self, index: int) -> Deposit:
+        """
+        @return: The deposit at the index as a Deposit record. Its amount is the Decimal of its base-unit amount, or
+            the original amount if it had more digits than the decimals of the token.
+        """
+        token = self._tokens[self._token_column[index]]
+        txid = self._overflow.get(("txid", index))
+        if txid is None:
+            txid = self._txid_column[32 * index:32 * index + 32].hex()
+        amount = self._overflow.get(("original_amount", index))
+        if amount is None:
+            amount = from_base_unit(self._overflow.get(("amount", index), self._amount_column[index]),
+                                    token["decimals"])
+        return Deposit(token=token, from_address=self._strings[self._from_address_column[index]],
+                       to_address=self._strings[self._to_address_column[index]], txid=txid,
+                       amount=amount, block=self._block_column[index],
+                       fee=self._fee_column[index], param=self._param_column[index],
+                       memo=self._overflow.get(("memo", index)))
+
+    def __getitem__(self, index: int) -> Deposit:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.get_deposit(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_deposit(index)
+
+    def to_dicts(self) -> list:
+        """
+        @return: A list of the deposits in the documented dict format of get_deposits_by_block
+        """
+        return [deposit.to_dict() for deposit in self]
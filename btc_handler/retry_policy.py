@@ -0,0 +1,143 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from itertools import count
+
+import requests
+
+from btc_handler.exceptions import RateLimit, NetworkBusyException, UnknownException
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed by the async twins of the API Switcher
+    aiohttp = None
+
+"""
+    > Retry Policy
+    Decides whether a failed request of the API Switcher is sent again and how long it waits before that.
+    => Only the transient failures are retried: RateLimit, NetworkBusyException, UnknownException and connection
+       errors or timeouts. Others (like BadRequest or InvalidInputError) are raised right away.
+    => The waits are jittered exponential backoffs. If the provider has sent a Retry-After header, it is honoured.
+    => All the requests share a RetryBudget, so a failing node can't get a storm of retries.
+"""
+
+
+def parse_retry_after(value):
+    """
+    @param value: Value of a Retry-After header, in seconds or as an HTTP date
+    @return: Seconds to wait, or None if the value isn't valid
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10):
+        """
+        Every request adds ratio to the budget and every retry takes one from it, so the retries stay under
+        (ratio * requests) plus max_tokens.
+        @param ratio: Share of the requests that can be retried
+        @param max_tokens: Maximum number of the retries that can be saved for a burst of failures
+        """
+        self.RATIO = ratio
+        self.MAX_TOKENS = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.MAX_TOKENS, self._tokens + self.RATIO)
+
+    def withdraw(self) -> bool:
+        """
+        @return: Whether a retry is allowed
+        """
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    RETRYABLE_EXCEPTIONS = (RateLimit, NetworkBusyException, UnknownException,
+                            requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)
+    if aiohttp is not None:
+        RETRYABLE_EXCEPTIONS += (aiohttp.ClientConnectionError,)
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 10,
+                 budget: RetryBudget = None):
+        """
+        @param max_attempts: Maximum number of the attempts of a request (the first one included)
+        @param base_delay: Upper bound of the wait before the first retry in seconds. It doubles for each retry.
+        @param max_delay: Upper bound of the wait before a retry in seconds, unless the provider asks for more
+            with Retry-After
+        @param budget: The retry budget that is shared by all the requests of the policy
+        """
+        self.MAX_ATTEMPTS = max_attempts
+        self.BASE_DELAY = base_delay
+        self.MAX_DELAY = max_delay
+        self.BUDGET = budget or RetryBudget()
+
+    def is_retryable(self, exception: Exception) -> bool:
+        return isinstance(exception, self.RETRYABLE_EXCEPTIONS)
+
+    def should_retry(self, exception: Exception, attempt: int) -> bool:
+        """
+        @param exception: The exception that the attempt raised
+        @param attempt: Number of the failed attempt, starting from 0
+        @return: Whether the request should be sent again
+        """
+        return attempt + 1 < self.MAX_ATTEMPTS and self.is_retryable(exception) and self.BUDGET.withdraw()
+
+    def get_delay(self, exception: Exception, attempt: int) -> float:
+        """
+        @param exception: The exception that the attempt raised
+        @param attempt: Number of the failed attempt, starting from 0
+        @return: Seconds to wait before the next attempt
+        """
+        delay = random.uniform(0, min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt))
+        retry_after = getattr(exception, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def run(self, function):
+        """
+        Calls the function until it succeeds or the failure shouldn't be retried.
+        @param function: A function without argument that makes one attempt of the request
+        @return: What the function returns
+        """
+        self.BUDGET.deposit()
+        for attempt in count():
+            try:
+                return function()
+            except Exception as e:
+                if not self.should_retry(exception=e, attempt=attempt):
+                    raise
+                time.sleep(self.get_delay(exception=e, attempt=attempt))
+
+    async def arun(self, function):
+        """
+        Async twin of run.
+        @param function: A function without argument that returns an awaitable of one attempt of the request
+        @return: What the awaitable returns
+        """
+        self.BUDGET.deposit()
+        for attempt in count():
+            try:
+                return await function()
+            except Exception as e:
+                if not self.should_retry(exception=e, attempt=attempt):
+                    raise
+                await asyncio.sleep(self.get_delay(exception=e, attempt=attempt))
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed by the async twins of the API Switcher
+    aiohttp = None
+
+"""
+    > Session Pool
+    Keep-alive HTTP sessions that the API Switcher uses to reach the providers.
+    => Every provider gets its own requests.Session, so the TCP (and TLS) connections to its node are reused
+       between the calls instead of doing a new handshake for each request.
+    => AsyncSessionPool is the same thing for asyncio callers, on top of aiohttp.
+"""
+
+
+class SessionPool:
+    def __init__(self, pool_size: int = 10, timeout: tuple = (3.05, 30)):
+        """
+        Initialize the session pool. It should be done once per API Switcher.
+        @param pool_size: Maximum number of keep-alive connections that are kept open to each host of a provider
+        @param timeout: Default (connect_timeout, read_timeout) in seconds for the requests that don't define
+            their own "timeout" in the payload
+        """
+        self.POOL_SIZE = pool_size
+        self.TIMEOUT = timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, provider: str) -> requests.Session:
+        """
+        Returns the keep-alive session of the provider and creates it on the first call.
+        @param provider: Name of the provider
+        @return: The requests.Session that owns the connection pool of the provider
+        """
+        session = self._sessions.get(provider)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(provider)
+                if session is None:
+                    session = requests.Session()
+                    # Connections are only handed to one request at a time and go back to the pool once the
+                    # response is fully read, so a connection is never shared by two in-flight requests.
+                    adapter = HTTPAdapter(pool_connections=self.POOL_SIZE, pool_maxsize=self.POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers["Connection"] = "keep-alive"
+                    self._sessions[provider] = session
+        return session
+
+    def request(self, provider: str, method: str, url: str, timeout: tuple = None, **kwargs) -> requests.Response:
+        """
+        Sends a request through the keep-alive session of the provider.
+        @param provider: Name of the provider
+        @param method: HTTP method of the request
+        @param url: Full url of the request
+        @param timeout: (connect_timeout, read_timeout) of this request. SessionPool.TIMEOUT is used if it is None
+        @param kwargs: Other arguments of requests.Session.request (data, json, headers, params, ...)
+        @return: The response of the request (its body is already read, so its connection is back in the pool)
+        """
+        if timeout is None:
+            timeout = self.TIMEOUT
+        return self.get_session(provider).request(method=method, url=url, timeout=timeout, **kwargs)
+
+    def close(self):
+        """
+        Closes all the sessions and their open connections.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+class AsyncSessionPool:
+    def __init__(self, max_concurrency: int = 100, timeout: tuple = (3.05, 30)):
+        """
+        Initialize the async session pool. It should be done once per API Switcher.
+        @param max_concurrency: Maximum number of in-flight requests to each provider on each event loop. Other
+            requests wait for a slot.
+        @param timeout: Default (connect_timeout, read_timeout) in seconds for the requests that don't define
+            their own "timeout" in the payload
+        @note: Sessions and semaphores belong to the event loop that created them, so each event loop (e.g. of each
+            thread that uses the API Switcher) gets its own. Await close before a loop ends to release its
+            connections. The sessions of a loop that ended without it are only forgotten.
+        """
+        self.MAX_CONCURRENCY = max_concurrency
+        self.TIMEOUT = timeout
+        self._loops = {}  # {event_loop: ({provider: session}, {provider: semaphore})}
+        self._lock = threading.Lock()
+
+    def _get_loop_sessions(self) -> tuple:
+        """
+        @return: The (sessions, semaphores) of the running event loop. Only that loop uses them, so they aren't locked.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loop_sessions = self._loops.get(loop)
+            if loop_sessions is None:
+                for ended_loop in [ended_loop for ended_loop in self._loops if ended_loop.is_closed()]:
+                    del self._loops[ended_loop]
+                loop_sessions = self._loops[loop] = ({}, {})
+        return loop_sessions
+
+    def get_session(self, provider: str):
+        """
+        Returns the aiohttp session of the provider on the running event loop and creates it on the first call.
+        @param provider: Name of the provider
+        @return: The aiohttp.ClientSession that owns the connection pool of the provider
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp is needed for the async requests of the API Switcher")
+        sessions, semaphores = self._get_loop_sessions()
+        session = sessions.get(provider)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.MAX_CONCURRENCY)
+            session = sessions[provider] = aiohttp.ClientSession(connector=connector)
+            semaphores[provider] = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        return session
+
+    async def request(self, provider: str, method: str, url: str, timeout: tuple = None, **kwargs) -> tuple:
+        """
+        Sends a request through the session of the provider. At most MAX_CONCURRENCY requests of a provider are
+        in flight at the same time on an event loop. Cancelling the calling task aborts the request and frees its
+        slot.
+        @param provider: Name of the provider
+        @param method: HTTP method of the request
+        @param url: Full url of the request
+        @param timeout: (connect_timeout, read_timeout) or one timeout for both of this request.
+            AsyncSessionPool.TIMEOUT is used if it is None
+        @param kwargs: Other arguments of aiohttp.ClientSession.request (data, json, headers, params, ...)
+        @return: A tuple of (response_text, status_code, headers)
+        """
+        if timeout is None:
+            timeout = self.TIMEOUT
+        session = self.get_session(provider)
+        semaphore = self._get_loop_sessions()[1][provider]
+        connect_timeout, read_timeout = timeout if isinstance(timeout, (tuple, list)) else (timeout, timeout)
+        async with semaphore:
+            async with session.request(method=method, url=url,
+                                       timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                                                     sock_read=read_timeout),
+                                       **kwargs) as response:
+                return await response.text(), response.status, response.headers
+
+    async def close(self):
+        """
+        Closes all the sessions of the running event loop and their open connections. The sessions of the other
+        event loops aren't touched.
+        """
+        with self._lock:
+            sessions, _ = self._loops.pop(asyncio.get_running_loop(), ({}, {}))
+        for session in sessions.values():
+            await session.close()
@@ -0,0 +1,98 @@
+import asyncio
+import copy
+import json
+import threading
+
+"""
+    > Single Flight
+    Coalesces identical calls that are in flight at the same time into one call.
+    => The first caller of a key runs the function. The others that come before it finishes wait for it and get the
+       result (or the exception) too. When a result is shared, every caller gets its own copy of it, so they can't
+       change the result of each other. A result that nobody else waited for isn't copied.
+    => Only calls that are in flight are shared. Nothing is cached after the call finishes.
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.followers = 0
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.callers = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # {key: _Call}
+        self._async_calls = {}  # {(event_loop, key): _AsyncCall}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(*args, **kwargs) -> str:
+        """
+        @return: A key that is the same for equal arguments, regardless of the order of the kwargs
+        """
+        return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+    def do(self, key: str, function):
+        """
+        @param key: Key of the call, see get_key
+        @param function: A function without argument that makes the call
+        @return: What the function returns
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+        if not is_leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return copy.deepcopy(call.result)
+        try:
+            result = function()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]  # No follower joins after this, so call.followers is final
+            if call.exception is None and call.followers:
+                call.result = copy.deepcopy(result)  # Copied before it is published, the leader may change its result
+            call.done.set()
+        return result
+
+    def _forget(self, calls_key: tuple, call: _AsyncCall):
+        if self._async_calls.get(calls_key) is call:
+            del self._async_calls[calls_key]
+        if not call.task.cancelled():
+            call.task.exception()  # The exception is retrieved, even if all the callers were cancelled
+
+    async def ado(self, key: str, function):
+        """
+        Async twin of do. Calls are only shared on the same event loop.
+        @param key: Key of the call, see get_key
+        @param function: A function without argument that returns an awaitable of the call
+        @return: What the awaitable returns
+        """
+        loop = asyncio.get_running_loop()
+        calls_key = (loop, key)
+        call = self._async_calls.get(calls_key)
+        if call is None:
+            call = self._async_calls[calls_key] = _AsyncCall(loop.create_task(function()))
+            call.task.add_done_callback(lambda _: self._forget(calls_key, call))
+        call.callers += 1
+        result = await asyncio.shield(call.task)
+        if self._async_calls.get(calls_key) is call:
+            del self._async_calls[calls_key]  # No caller joins after this, so call.callers is final
+        # A shared result is never given out, so each caller copies the same untouched result
+        return copy.deepcopy(result) if call.callers > 1 else result
@@ -0,0 +1,42 @@
+from btc_handler.address_index import AddressIndex
+
+ADDRESSES = [{"address": "a", "sub_address": None}, {"address": "a", "sub_address": "memo"},
+             {"address": "b", "sub_address": None}]
+
+
+def test_match():
+    index = AddressIndex(ADDRESSES)
+    assert "a" in index and "c" not in index
+    assert index.match("a") == ADDRESSES[:2]
+    assert index.match("c") == []
+    assert len(index) == 3
+    assert list(index) == ADDRESSES
+
+
+def test_duplicate_entries_are_ignored():
+    index = AddressIndex(ADDRESSES + ADDRESSES)
+    assert len(index) == 3
+    assert index.digest == AddressIndex(ADDRESSES).digest
+
+
+def test_digest_doesnt_depend_on_the_order():
+    assert AddressIndex(ADDRESSES).digest == AddressIndex(reversed(ADDRESSES)).digest
+    assert AddressIndex(ADDRESSES).digest != AddressIndex(ADDRESSES[:2]).digest
+
+
+def test_add_and_remove_update_the_digest():
+    index = AddressIndex(ADDRESSES[:2])
+    index.add("b")
+    assert index.digest == AddressIndex(ADDRESSES).digest
+    index.remove("a", "memo")
+    index.remove("a", "missing")
+    assert index.digest == AddressIndex([ADDRESSES[0], ADDRESSES[2]]).digest
+    index.remove("a")
+    assert "a" not in index and len(index) == 1
+    assert index.digest == AddressIndex([ADDRESSES[2]]).digest
+
+
+def test_compile_keeps_an_index():
+    index = AddressIndex(ADDRESSES)
+    assert AddressIndex.compile(index) is index
+    assert AddressIndex.compile(ADDRESSES).digest == index.digest
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.amounts import from_base_unit, from_base_units, to_base_unit, to_base_units
+
+
+def test_from_base_unit_matches_the_division():
+    for value, decimals in ((230000, 8), (0, 8), (1, 0), (-5, 6), (10 ** 30, 18)):
+        expected = Decimal(value) / Decimal(10 ** decimals)
+        result = from_base_unit(value, decimals)
+        assert result == expected and str(result) == str(expected)
+    assert from_base_units([1, 20, 300], 2) == [Decimal("0.01"), Decimal("0.2"), Decimal("3")]
+
+
+def test_to_base_unit():
+    assert to_base_unit(Decimal("0.0023"), 8) == 230000
+    assert to_base_unit("1.5", 6) == 1500000
+    assert to_base_unit(0.1, 8) == 10000000
+    assert to_base_unit(2, 8) == 200000000
+    assert to_base_unit(Decimal("1E+2"), 2) == 10000
+    assert to_base_units(["0.01", "0.02"], 2) == [1, 2]
+
+
+def test_to_base_unit_never_rounds():
+    with pytest.raises(ValueError):
+        to_base_unit(Decimal("0.000000001"), 8)
+    with pytest.raises(ValueError):
+        to_base_units(["0.01", "0.001"], 2)
+
+
+def test_round_trip():
+    for amount in ("0.00000001", "21000000", "123.45678901"):
+        assert from_base_unit(to_base_unit(Decimal(amount), 8), 8) == Decimal(amount)
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from btc_handler.Providers.JsonRPCProvider import JsonRPCProvider
+from btc_handler.api_switcher import APISwitcher
+from btc_handler.exceptions import RateLimit, NetworkBusyException, UnknownException, BadRequest
+from btc_handler.rate_limiter import TokenBucket
+from btc_handler.retry_policy import RetryPolicy, RetryBudget
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body, headers: dict = None):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+        self.headers = headers or {}
+
+
+class FakeSessionPool:
+    """
+    Answers the requests with the handler of their url and records them
+    """
+
+    def __init__(self, handlers: dict):
+        self.handlers = handlers
+        self.requests = []
+
+    def request(self, provider: str, method: str, url: str, timeout=None, **kwargs):
+        self.requests.append({"provider": provider, "url": url, **kwargs})
+        return self.handlers[url](kwargs["data"])
+
+
+class FakeAsyncSessionPool(FakeSessionPool):
+    async def request(self, provider: str, method: str, url: str, timeout=None, **kwargs):
+        response = FakeSessionPool.request(self, provider=provider, method=method, url=url, timeout=timeout, **kwargs)
+        await asyncio.sleep(0)
+        return response.text, response.status_code, response.headers
+
+
+def get_provider(base_url: str):
+    class Provider:
+        @staticmethod
+        def get_request(body):
+            return {"base_url": base_url, "path": "", "method": "POST", "headers": {}, "params": {}, "body": body}
+
+        @staticmethod
+        def get_balance_request(address):
+            return Provider.get_request(address)
+
+        @staticmethod
+        def parse_balance_response(response, status_code):
+            return response["balance"]
+
+        @staticmethod
+        def get_broadcast_request(signed_transaction):
+            return Provider.get_request(signed_transaction)
+
+        @staticmethod
+        def parse_broadcast_response(response, status_code):
+            return response
+
+    return Provider
+
+
+def get_switcher(handlers: dict, **kwargs) -> APISwitcher:
+    switcher = APISwitcher(network_name="BTC", providers={"a": get_provider("a"), "b": get_provider("b")},
+                           default_provider="a", **kwargs)
+    switcher.SESSION_POOL = FakeSessionPool(handlers)
+    return switcher
+
+
+def answer(balance):
+    return lambda body: FakeResponse(200, {"balance": balance})
+
+
+def test_default_provider_is_used_until_the_latencies_are_known():
+    switcher = get_switcher({"a": answer("1"), "b": answer("2")})
+    assert switcher.request_providers(function="balance", address="addr") == "1"
+    assert switcher.SESSION_POOL.requests[0]["data"] == "addr"
+
+
+def test_the_fastest_healthy_provider_is_ranked_first():
+    switcher = get_switcher({"a": answer("1"), "b": answer("2")})
+    switcher.HEALTH["a"].record_success(0.5)
+    switcher.HEALTH["b"].record_success(0.1)
+    payload = switcher.get_payload(function="balance", address="addr")
+    assert switcher.rank_providers(payload) == ["b", "a"]
+    assert switcher.request_providers(function="balance", address="addr") == "2"
+
+
+def test_rate_limited_provider_isnt_tripped_and_the_retry_gets_through():
+    responses = [FakeResponse(429, "slow down", headers={"Retry-After": "0"}), FakeResponse(200, {"balance": "1"})]
+    switcher = APISwitcher(network_name="BTC", providers={"a": get_provider("a")}, default_provider="a",
+                           retry_policy=RetryPolicy(max_attempts=2, base_delay=0))
+    switcher.SESSION_POOL = FakeSessionPool({"a": lambda body: responses.pop(0)})
+    assert switcher.request_providers(function="balance", address="addr") == "1"
+    assert len(switcher.SESSION_POOL.requests) == 2
+    assert switcher.HEALTH["a"].state == switcher.HEALTH["a"].CLOSED
+    assert switcher.HEALTH["a"].error_rate == 0
+
+
+def test_retry_after_holds_back_the_rate_limiter():
+    bucket = TokenBucket(rate=10)
+    switcher = get_switcher({"a": lambda body: FakeResponse(429, "", headers={"Retry-After": "7"})},
+                            rate_limiters={"a": bucket}, retry_policy=RetryPolicy(max_attempts=1))
+    with pytest.raises(RateLimit):
+        switcher.request_providers(function="balance", provider="a", address="addr")
+    assert bucket.reserve() >= 7
+
+
+def test_rate_limit_keeps_the_retry_after_header():
+    switcher = get_switcher({"a": lambda body: FakeResponse(429, "", headers={"Retry-After": "7"})},
+                            retry_policy=RetryPolicy(max_attempts=1))
+    with pytest.raises(RateLimit) as error:
+        switcher.request_providers(function="balance", provider="a", address="addr")
+    assert error.value.retry_after == 7
+
+
+def test_non_idempotent_function_is_sent_once():
+    switcher = get_switcher({"a": lambda body: FakeResponse(503, "down"), "b": answer("2")},
+                            retry_policy=RetryPolicy(max_attempts=5, base_delay=0))
+    assert not switcher.is_idempotent("broadcast")
+    with pytest.raises(NetworkBusyException):
+        switcher.request_providers(function="broadcast", signed_transaction="0100")
+    assert len(switcher.SESSION_POOL.requests) == 1
+
+
+def test_idempotent_functions_can_be_configured():
+    switcher = get_switcher({}, idempotent_functions=("balance",))
+    assert switcher.is_idempotent("balance")
+    assert not switcher.is_idempotent("params")
+
+
+def test_response_that_isnt_json_is_an_unknown_exception():
+    switcher = get_switcher({"a": lambda body: FakeResponse(200, "<html>")},
+                            retry_policy=RetryPolicy(max_attempts=1))
+    with pytest.raises(UnknownException):
+        switcher.request_providers(function="balance", address="addr")
+    assert switcher.HEALTH["a"].error_rate == 1
+
+
+def test_least_recently_failed_provider_is_probed_when_all_are_unhealthy():
+    switcher = get_switcher({"a": answer("1"), "b": answer("2")}, retry_policy=RetryPolicy(max_attempts=1))
+    switcher.HEALTH["b"].record_failure(trip=True)
+    switcher.HEALTH["a"].record_failure(trip=True)
+    assert switcher.request_providers(function="balance", address="addr") == "2"
+    assert [request["provider"] for request in switcher.SESSION_POOL.requests] == ["b"]
+    assert switcher.HEALTH["b"].state == switcher.HEALTH["b"].CLOSED
+    assert switcher.HEALTH["a"].state == switcher.HEALTH["a"].OPEN
+
+
+def test_slow_provider_is_hedged_and_the_hedge_answers_if_it_fails():
+    def slow_failure(body):
+        time.sleep(0.3)
+        return FakeResponse(503, "down")
+
+    switcher = get_switcher({"a": slow_failure, "b": answer("2")}, hedge_requests=True, hedge_delay=0.05)
+    assert switcher.request_providers(function="balance", address="addr") == "2"
+    assert [request["provider"] for request in switcher.SESSION_POOL.requests] == ["a", "b"]
+    assert not switcher.should_hedge("broadcast")
+
+
+def test_first_provider_is_sent_on_the_callers_thread():
+    threads = []
+
+    def slow(body):
+        threads.append(threading.current_thread())
+        time.sleep(0.2)
+        return FakeResponse(200, {"balance": "1"})
+
+    def hedge(body):
+        threads.append(threading.current_thread())
+        return FakeResponse(200, {"balance": "2"})
+
+    switcher = get_switcher({"a": slow, "b": hedge}, hedge_requests=True, hedge_delay=0.05)
+    assert switcher.request_providers(function="balance", address="addr") == "1"
+    assert threads[0] is threading.current_thread() and threads[1] is not threading.current_thread()
+
+
+def test_rate_limiter_wait_doesnt_start_a_hedge():
+    bucket = TokenBucket(rate=5, burst=1)
+    bucket.reserve()  # The next request waits 0.2 seconds for its turn
+    switcher = get_switcher({"a": answer("1"), "b": answer("2")}, hedge_requests=True, hedge_delay=0.05,
+                            rate_limiters={"a": bucket})
+    assert switcher.request_providers(function="balance", address="addr") == "1"
+    time.sleep(0.1)
+    assert [request["provider"] for request in switcher.SESSION_POOL.requests] == ["a"]
+
+
+def test_request_isnt_hedged_while_the_hedge_workers_are_busy():
+    def slow_failure(body):
+        time.sleep(0.2)
+        return FakeResponse(503, "down")
+
+    switcher = get_switcher({"a": slow_failure, "b": answer("2")}, hedge_requests=True, hedge_delay=0.05,
+                            hedge_workers=1, retry_policy=RetryPolicy(max_attempts=1))
+    switcher._hedge_slots.acquire()
+    with pytest.raises(NetworkBusyException):
+        switcher.request_providers(function="balance", address="addr")
+    assert [request["provider"] for request in switcher.SESSION_POOL.requests] == ["a"]
+
+
+def test_identical_calls_in_flight_share_one_request():
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(body):
+        started.set()
+        release.wait(5)
+        return FakeResponse(200, {"balance": "1"})
+
+    switcher = get_switcher({"a": blocking})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(switcher.request_providers(function="balance",
+                                                                                        address="addr")))
+               for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["1", "1", "1"]
+    assert len(switcher.SESSION_POOL.requests) == 1
+
+
+def test_async_request_providers():
+    switcher = get_switcher({})
+    switcher.ASYNC_SESSION_POOL = FakeAsyncSessionPool({"a": answer("1"), "b": answer("2")})
+
+    async def request_all():
+        return await asyncio.gather(*[switcher.arequest_providers(function="balance", address=f"addr{index}")
+                                      for index in range(3)])
+
+    assert asyncio.run(request_all()) == ["1", "1", "1"]
+    assert len(switcher.ASYNC_SESSION_POOL.requests) == 3
+
+
+class BatchProvider(JsonRPCProvider):
+    @staticmethod
+    def get_block_hash_call(height):
+        return {"jsonrpc": "1.0", "id": 0, "method": "getblockhash", "params": [height]}
+
+    @staticmethod
+    def parse_block_hash_response(response, status_code):
+        JsonRPCProvider.check_error(response, status_code)
+        return response["result"]
+
+
+def get_json_rpc_switcher(handler) -> APISwitcher:
+    switcher = APISwitcher(network_name="BTC", providers={BatchProvider.PROVIDER_NAME: BatchProvider},
+                           default_provider=BatchProvider.PROVIDER_NAME,
+                           retry_policy=RetryPolicy(max_attempts=1, budget=RetryBudget()))
+    switcher.SESSION_POOL = FakeSessionPool({BatchProvider.BASE_URL: handler})
+    return switcher
+
+
+def block_hashes(body):
+    calls = json.loads(body)
+    results = [{"id": call["id"], "result": f"hash{call['params'][0]}", "error": None} for call in calls]
+    return FakeResponse(200, list(reversed(results)))
+
+
+def test_batch_is_split_by_max_batch_size_and_matched_by_id(monkeypatch):
+    monkeypatch.setattr(BatchProvider, "MAX_BATCH_SIZE", 2)
+    switcher = get_json_rpc_switcher(block_hashes)
+    assert switcher.supports_batch(function="block_hash")
+    assert not switcher.supports_batch(function="balance")  # Each scan of the UTXO set is a full scan
+    results = switcher.request_providers_batch(function="block_hash",
+                                               kwargs_list=[{"height": height} for height in range(5)])
+    assert results == ["hash0", "hash1", "hash2", "hash3", "hash4"]
+    assert len(switcher.SESSION_POOL.requests) == 3
+    calls = json.loads(switcher.SESSION_POOL.requests[0]["data"])
+    assert calls[0]["method"] == "getblockhash" and calls[1]["params"] == [1]
+
+
+def test_failed_call_of_a_batch_is_returned_in_its_place():
+    def partial_results(body):
+        calls = json.loads(body)
+        return FakeResponse(200, [{"id": 0, "result": None, "error": {"code": -8, "message": "Out of range"}},
+                                  {"id": 1, "result": "hash1", "error": None}][:len(calls) - 1])
+
+    switcher = get_json_rpc_switcher(partial_results)
+    results = switcher.request_providers_batch(function="block_hash",
+                                               kwargs_list=[{"height": height} for height in range(3)])
+    assert isinstance(results[0], BadRequest)
+    assert results[1] == "hash1"
+    assert isinstance(results[2], UnknownException)
+
+
+def test_failed_batch_request_fails_all_its_calls():
+    switcher = get_json_rpc_switcher(lambda body: FakeResponse(200, {"error": "batch isn't supported"}))
+    results = switcher.request_providers_batch(function="block_hash", kwargs_list=[{"height": 0}, {"height": 1}])
+    assert len(results) == 2 and all(isinstance(result, BadRequest) for result in results)
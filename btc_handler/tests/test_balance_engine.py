@@ -0,0 +1,68 @@
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.balance_engine import BalanceEngine
+
+TOKENS = [{"token_symbol": "BTC"}, {"token_symbol": "USDT"}]
+
+
+class Handler:
+    calls = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_balance(cls, token, addresses, until_block="latest"):
+        with cls._lock:
+            cls.calls.append((token["token_symbol"], [address["address"] for address in addresses]))
+        return {"balances": [{"address": address["address"], "sub_address": None,
+                              "balance": Decimal(len(address["address"])) if token["token_symbol"] == "BTC"
+                              else Decimal(0)} for address in addresses],
+                "until_block": 100 if until_block == "latest" else until_block}
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    Handler.calls = []
+
+
+def test_every_address_is_asked_once_per_token():
+    addresses = [{"address": "a", "sub_address": "1"}, {"address": "bb", "sub_address": None},
+                 {"address": "a", "sub_address": "2"}, {"address": "ccc", "sub_address": None}]
+    result = BalanceEngine(Handler, chunk_size=2).get_all_token_balances(tokens=TOKENS, addresses=addresses)
+    assert sorted(Handler.calls) == [("BTC", ["a", "bb"]), ("BTC", ["ccc"]), ("USDT", ["a", "bb"]), ("USDT", ["ccc"])]
+    assert result["until_block"] == 100
+    btc_balances = result["token_balances"][0]
+    assert btc_balances["token"] == TOKENS[0]
+    assert btc_balances["balances"] == [
+        {"address": "a", "sub_address": "1", "balance": Decimal(1)},
+        {"address": "bb", "sub_address": None, "balance": Decimal(2)},
+        {"address": "a", "sub_address": "2", "balance": Decimal(1)},
+        {"address": "ccc", "sub_address": None, "balance": Decimal(3)},
+    ]
+    assert [balance["balance"] for balance in result["token_balances"][1]["balances"]] == [0, 0, 0, 0]
+
+
+def test_until_block_is_passed_through():
+    result = BalanceEngine(Handler).get_all_token_balances(tokens=TOKENS[:1],
+                                                           addresses=[{"address": "a", "sub_address": None}],
+                                                           until_block=50)
+    assert result["until_block"] == 50
+
+
+def test_failed_call_cancels_the_pending_ones():
+    class FailingHandler(Handler):
+        @classmethod
+        def get_balance(cls, token, addresses, until_block="latest"):
+            if addresses[0]["address"] == "0":
+                raise ConnectionError("node is down")
+            time.sleep(0.05)
+            return super().get_balance(token, addresses, until_block)
+
+    addresses = [{"address": str(index), "sub_address": None} for index in range(20)]
+    with pytest.raises(ConnectionError):
+        BalanceEngine(FailingHandler, max_workers=1, chunk_size=1).get_all_token_balances(tokens=TOKENS,
+                                                                                         addresses=addresses)
+    assert len(FailingHandler.calls) < 39
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.balance_snapshots import BalanceSnapshotStore
+
+BTC = {"token_symbol": "BTC", "contract_address": None, "decimals": 8}
+USDT = {"token_symbol": "USDT", "contract_address": "0xdac", "decimals": 6}
+A = {"address": "a", "sub_address": None}
+B = {"address": "b", "sub_address": None}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BalanceSnapshotStore(str(tmp_path / "snapshots.sqlite"), checkpoint_interval=2)
+    yield store
+    store.close()
+
+
+def deposit(token: dict, address: str, amount: str) -> dict:
+    return {"token": token, "to_address": address, "amount": Decimal(amount)}
+
+
+def get_balances(store, token, addresses, block) -> list:
+    return [balance["balance"] for balance in store.get_balance(token=token, addresses=addresses, until_block=block)]
+
+
+def test_balances_at_each_block(store):
+    store.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=10)
+    store.apply_block(11, deposits=[deposit(BTC, "a", "0.5")])
+    store.apply_block(12, withdrawals=[{"token": BTC, "address": "a", "amount": Decimal("0.25")}])
+    store.apply_block(13, deposits=[deposit(BTC, "a", "2"), deposit(USDT, "a", "7")])
+    assert store.first_block == 10 and store.last_block == 13
+    assert [get_balances(store, BTC, [A], block)[0] for block in range(10, 14)] == \
+        [Decimal("1"), Decimal("1.5"), Decimal("1.25"), Decimal("3.25")]
+
+
+def test_covers_checks_the_range_and_the_seeded_addresses(store):
+    assert not store.covers(until_block=10)
+    store.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=10)
+    store.apply_block(11)
+    store.apply_block(12)
+    store.seed(BTC, [{"address": "b", "balance": Decimal("0")}], block=12)
+    assert store.covers(until_block=11) and not store.covers(until_block=9) and not store.covers(until_block=13)
+    assert store.covers(until_block=11, token=BTC, addresses=[A])
+    assert not store.covers(until_block=11, token=BTC, addresses=[A, B])  # b is only known from block 12
+    assert store.covers(until_block=12, token=BTC, addresses=[A, B])
+    assert not store.covers(until_block=12, token=USDT, addresses=[A])
+
+
+def test_unseeded_address_isnt_answered_with_zero(store):
+    store.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=10)
+    store.apply_block(11, deposits=[deposit(BTC, "b", "0.5")])
+    with pytest.raises(ValueError):
+        store.get_balance(token=BTC, addresses=[A, B], until_block=11)
+
+
+def test_checkpoints_dont_change_the_balances(tmp_path, store):
+    without_checkpoints = BalanceSnapshotStore(str(tmp_path / "plain.sqlite"), checkpoint_interval=1000)
+    for snapshots in (store, without_checkpoints):
+        snapshots.seed(BTC, [{"address": "a", "balance": Decimal("0")}], block=0)
+        for block in range(1, 10):
+            snapshots.apply_block(block, deposits=[deposit(BTC, "a", "0.1")] * (block % 3))
+    assert store._connection.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] > 1
+    for block in range(10):
+        assert get_balances(store, BTC, [A], block) == get_balances(without_checkpoints, BTC, [A], block)
+    without_checkpoints.close()
+
+
+def test_rollback_removes_the_orphaned_blocks_and_seeds(store):
+    store.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=10)
+    for block in range(11, 15):
+        store.apply_block(block, deposits=[deposit(BTC, "a", "1")])
+    store.seed(BTC, [{"address": "b", "balance": Decimal("5")}], block=14)
+    store.rollback_block(12)
+    assert store.last_block == 11
+    assert not store.covers(until_block=12)
+    assert get_balances(store, BTC, [A], 11) == [Decimal("2")]
+    store.apply_block(12, deposits=[deposit(BTC, "a", "0.5")])
+    assert get_balances(store, BTC, [A], 12) == [Decimal("2.5")]
+    assert not store.covers(until_block=12, token=BTC, addresses=[B])
+
+
+def test_repeated_addresses_keep_their_sub_addresses(store):
+    store.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=1)
+    balances = store.get_balance(token=BTC, addresses=[{"address": "a", "sub_address": "1"},
+                                                       {"address": "a", "sub_address": "2"}], until_block=1)
+    assert [balance["sub_address"] for balance in balances] == ["1", "2"]
@@ -0,0 +1,86 @@
+from btc_handler.block_cache import BlockCache
+
+
+class Node:
+    def __init__(self, last_block: int):
+        self.last_block = last_block
+        self.calls = []
+
+    def get_last_block(self) -> int:
+        self.calls.append("last_block")
+        return self.last_block
+
+    def get_block_timestamp(self, block_number: int) -> int:
+        self.calls.append(block_number)
+        return 1000 * block_number + len(self.calls)
+
+
+def test_last_block_is_kept_for_tip_ttl():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=3, block_time=600)
+    assert cache.get_last_block(node.get_last_block) == 100
+    node.last_block = 101
+    assert cache.get_last_block(node.get_last_block) == 100
+    assert node.calls == ["last_block"]
+
+    expired_cache = BlockCache(min_confirmation=3, block_time=600, tip_ttl=0)
+    assert expired_cache.get_last_block(node.get_last_block) == 101
+    assert expired_cache.get_last_block(node.get_last_block) == 101
+    assert node.calls.count("last_block") == 3
+
+
+def test_final_timestamps_are_kept_after_the_tip_ttl():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=3, block_time=600, tip_ttl=0)
+    cache.get_last_block(node.get_last_block)
+    assert cache.is_final(98) and not cache.is_final(99)
+    final_timestamp = cache.get_block_timestamp(98, fetch=node.get_block_timestamp)
+    assert cache.get_block_timestamp(98, fetch=node.get_block_timestamp) == final_timestamp
+    tip_timestamp = cache.get_block_timestamp(100, fetch=node.get_block_timestamp)
+    assert cache.get_block_timestamp(100, fetch=node.get_block_timestamp) != tip_timestamp  # Expired at once
+    assert node.calls.count(98) == 1 and node.calls.count(100) == 2
+
+
+def test_expired_timestamp_that_became_final_is_kept():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=3, block_time=600, tip_ttl=0)
+    cache.get_last_block(node.get_last_block)
+    timestamp = cache.get_block_timestamp(100, fetch=node.get_block_timestamp)
+    node.last_block = 102
+    assert cache.get_block_timestamp(100, fetch=node.get_block_timestamp,
+                                     fetch_last_block=node.get_last_block) == timestamp
+    assert node.calls.count(100) == 1
+
+
+def test_lower_tip_drops_the_blocks_above_it():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=1, block_time=600, tip_ttl=0)
+    cache.get_last_block(node.get_last_block)
+    cache.get_block_timestamp(99, fetch=node.get_block_timestamp)
+    cache.get_block_timestamp(100, fetch=node.get_block_timestamp)
+    node.last_block = 99
+    cache.get_last_block(node.get_last_block)
+    assert 100 not in cache._timestamps and 99 in cache._timestamps
+
+
+def test_invalidate_from():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=1, block_time=600)
+    cache.get_last_block(node.get_last_block)
+    for block in (97, 98, 99):
+        cache.get_block_timestamp(block, fetch=node.get_block_timestamp)
+    cache.invalidate_from(98)
+    assert list(cache._timestamps) == [97]
+    assert not cache.is_final(97)  # The last block is dropped too
+    assert cache.get_last_block(node.get_last_block) == 100
+
+
+def test_least_recently_used_timestamps_are_dropped():
+    node = Node(100)
+    cache = BlockCache(min_confirmation=1, block_time=600, max_size=2)
+    cache.get_last_block(node.get_last_block)
+    for block in (1, 2):
+        cache.get_block_timestamp(block, fetch=node.get_block_timestamp)
+    cache.get_block_timestamp(1, fetch=node.get_block_timestamp)
+    cache.get_block_timestamp(3, fetch=node.get_block_timestamp)
+    assert list(cache._timestamps) == [1, 3]
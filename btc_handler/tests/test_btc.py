@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+
+from balance_snapshots import BalanceSnapshotStore
+from btc import BTCHandler
+from utxo_index import UTXOIndex
+
+BTC = {"token_symbol": "BTC", "contract_address": None, "decimals": 8}
+A = {"address": "a", "sub_address": None}
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(BTCHandler, "get_cached_last_block", staticmethod(lambda: 5))
+    monkeypatch.setattr(BTCHandler, "get_node_balance", staticmethod(
+        lambda token, addresses: {"balances": [{**address, "balance": Decimal("9")} for address in addresses],
+                                  "until_block": "latest"}))
+    yield BTCHandler
+    BTCHandler.UTXO_INDEX = None
+    BTCHandler.BALANCE_SNAPSHOTS = None
+
+
+def test_historical_balance_needs_covering_snapshots(handler, tmp_path):
+    with pytest.raises(NotImplementedError):
+        handler.get_balance(token=BTC, addresses=[A], until_block=3)
+    handler.BALANCE_SNAPSHOTS = BalanceSnapshotStore(str(tmp_path / "snapshots.sqlite"))
+    handler.BALANCE_SNAPSHOTS.seed(BTC, [{"address": "a", "balance": Decimal("1")}], block=2)
+    handler.BALANCE_SNAPSHOTS.apply_block(3, deposits=[{"token": BTC, "to_address": "a", "amount": Decimal("1")}])
+    assert handler.get_balance(token=BTC, addresses=[A], until_block=3) == {
+        "balances": [{"address": "a", "sub_address": None, "balance": Decimal("2")}], "until_block": 3}
+    with pytest.raises(NotImplementedError):
+        handler.get_balance(token=BTC, addresses=[A, {"address": "b", "sub_address": None}], until_block=3)
+    handler.BALANCE_SNAPSHOTS.close()
+
+
+def test_synced_utxo_index_answers_the_latest_balance(handler):
+    assert handler.get_balance(token=BTC, addresses=[A])["balances"][0]["balance"] == Decimal("9")
+    handler.UTXO_INDEX = UTXOIndex(":memory:")
+    handler.UTXO_INDEX.watch([A])
+    handler.UTXO_INDEX.apply_block(4, deposits=[{"txid": "t", "param": 0, "to_address": "a",
+                                                 "amount": Decimal("0.5")}])
+    assert handler.get_balance(token=BTC, addresses=[A])["balances"][0]["balance"] == Decimal("9")  # Not synced
+    handler.UTXO_INDEX.apply_block(5)
+    assert handler.get_balance(token=BTC, addresses=[A])["balances"][0]["balance"] == Decimal("0.5")
+    assert handler.get_params(addresses=[A])[0]["utxos"][0]["amount"] == 50000000
+    handler.UTXO_INDEX.close()
+
+
+class ScanSessionPool:
+    """
+    A node that rejects overlapping scans like bitcoind does
+    """
+
+    def __init__(self):
+        self.scans = []
+        self.overlapped = False
+        self._scanning = threading.Lock()
+
+    def request(self, provider, method, url, timeout=None, **kwargs):
+        if not self._scanning.acquire(blocking=False):
+            self.overlapped = True
+            raise AssertionError("Scan already in progress")
+        try:
+            descriptors = json.loads(kwargs["data"])["params"][1]
+            self.scans.append(descriptors)
+            time.sleep(0.05)
+            unspents = [{"desc": f"{descriptor}#checksum", "amount": 0.5} for descriptor in descriptors
+                        if descriptor != "addr(c)"]
+            body = {"result": {"success": True, "unspents": unspents + unspents[:1]}, "error": None, "id": 0}
+            return type("Response", (), {"status_code": 200, "text": json.dumps(body), "headers": {}})
+        finally:
+            self._scanning.release()
+
+
+def test_node_balance_is_one_scan_and_scans_dont_overlap(monkeypatch):
+    session_pool = ScanSessionPool()
+    monkeypatch.setattr(BTCHandler.API_SWITCHER_CLIENT, "SESSION_POOL", session_pool)
+    addresses = [A, {"address": "b", "sub_address": 1}, {"address": "c", "sub_address": None}]
+    results = []
+    threads = [threading.Thread(target=lambda index=index: results.append(
+        BTCHandler.get_node_balance(token=BTC, addresses=addresses[index:]))) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not session_pool.overlapped
+    assert sorted(session_pool.scans) == [["addr(a)", "addr(b)", "addr(c)"], ["addr(b)", "addr(c)"]]
+    result = next(result for result in results if len(result["balances"]) == 3)
+    assert result == {"balances": [{"address": "a", "sub_address": None, "balance": Decimal("1.0")},
+                                   {"address": "b", "sub_address": 1, "balance": Decimal("0.5")},
+                                   {"address": "c", "sub_address": None, "balance": Decimal("0")}],
+                      "until_block": "latest"}
@@ -0,0 +1,101 @@
+import threading
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.address_index import AddressIndex
+from btc_handler.base_node_handler import BaseNodeHandler
+from btc_handler.deposit_scanner import DepositScanner
+from btc_handler.records import DepositBatch
+
+TOKEN = {"token_symbol": "BTC", "contract_address": None, "decimals": 8}
+
+
+class Handler(BaseNodeHandler):
+    calls = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_deposits_by_block(cls, addresses, from_block, until_block, tokens):
+        assert isinstance(addresses, AddressIndex)
+        with cls._lock:
+            cls.calls.append((from_block, until_block))
+        deposits = []
+        for block in range(from_block + 1, until_block + 1):
+            if block % 3:
+                continue
+            deposits.append({"token": TOKEN, "from_address": "f", "to_address": "a", "txid": f"{block:064x}",
+                             "amount": Decimal("0.1"), "block": block, "fee": None, "param": 0, "memo": None})
+            # Two outputs of the transaction to the same address, with different amounts
+            deposits.append({"token": TOKEN, "from_address": "f", "to_address": "a", "txid": f"{block:064x}",
+                             "amount": Decimal("0.2"), "block": block, "fee": None, "param": 1, "memo": None})
+        # A node that returns a deposit twice and one outside of the asked range
+        return deposits + deposits[:1] + [{**deposits[0], "block": until_block + 1}] if deposits else deposits
+
+
+ADDRESSES = [{"address": "a", "sub_address": None}]
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    Handler.calls = []
+
+
+def test_iter_deposits_by_block_yields_every_block_in_order():
+    blocks = list(Handler.iter_deposits_by_block(addresses=ADDRESSES, from_block=0, until_block=7, tokens=[TOKEN],
+                                                 blocks_per_call=3))
+    assert [block for block, _ in blocks] == list(range(1, 8))
+    assert Handler.calls == [(0, 3), (3, 6), (6, 7)]
+    assert [deposit["param"] for deposit in dict(blocks)[3]] == [0, 1, 0]  # It doesn't drop the node's duplicates
+    assert dict(blocks)[4] == []
+
+
+def test_iter_deposits_by_block_checks_blocks_per_call():
+    with pytest.raises(ValueError):
+        next(Handler.iter_deposits_by_block(addresses=ADDRESSES, from_block=0, until_block=7, tokens=[],
+                                            blocks_per_call=0))
+
+
+def test_shards_dont_overlap():
+    scanner = DepositScanner(Handler, shard_size=4)
+    assert scanner.get_shards(from_block=10, until_block=19) == [(10, 14), (14, 18), (18, 19)]
+    assert scanner.get_shards(from_block=10, until_block=10) == []
+
+
+def test_scan_dedups_and_keeps_two_outputs_of_a_transaction():
+    scanner = DepositScanner(Handler, max_workers=3, shard_size=4)
+    deposits = scanner.get_deposits(addresses=ADDRESSES, from_block=0, until_block=20, tokens=[TOKEN])
+    assert [(deposit["block"], deposit["param"]) for deposit in deposits] == \
+        [(block, param) for block in range(3, 21, 3) for param in (0, 1)]
+    assert [deposit["amount"] for deposit in deposits[:2]] == [Decimal("0.1"), Decimal("0.2")]
+    assert sorted(Handler.calls) == [(0, 4), (4, 8), (8, 12), (12, 16), (16, 20)]
+
+
+def test_scan_yields_every_block_like_iter_deposits_by_block():
+    scanner = DepositScanner(Handler, max_workers=2, shard_size=3)
+    blocks = list(scanner.iter_deposits(addresses=ADDRESSES, from_block=5, until_block=15, tokens=[TOKEN]))
+    assert [block for block, _ in blocks] == list(range(6, 16))
+    assert all(deposit["block"] == block for block, deposits in blocks for deposit in deposits)
+
+
+def test_compact_scan():
+    scanner = DepositScanner(Handler, shard_size=5)
+    deposits = scanner.get_deposits(addresses=ADDRESSES, from_block=0, until_block=10, tokens=[TOKEN], compact=True)
+    assert isinstance(deposits, DepositBatch)
+    assert deposits.to_dicts() == scanner.get_deposits(addresses=ADDRESSES, from_block=0, until_block=10,
+                                                       tokens=[TOKEN])
+
+
+def test_failed_shard_raises():
+    class FailingHandler(Handler):
+        @classmethod
+        def get_deposits_by_block(cls, addresses, from_block, until_block, tokens):
+            if from_block >= 4:
+                raise ConnectionError("node is down")
+            return []
+
+    scanner = DepositScanner(FailingHandler, shard_size=2)
+    iterator = scanner.iter_deposits(addresses=ADDRESSES, from_block=0, until_block=10, tokens=[])
+    assert [block for block, _ in (next(iterator), next(iterator), next(iterator), next(iterator))] == [1, 2, 3, 4]
+    with pytest.raises(ConnectionError):
+        next(iterator)
@@ -0,0 +1,151 @@
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.block_cache import BlockCache
+from btc_handler.deposit_watcher import DepositWatcher
+from btc_handler.exceptions import InvalidBlockError
+from btc_handler.records import Deposit
+
+
+class Chain:
+    """
+    A fake Node Handler whose chain can be replaced from a block (a reorg)
+    """
+    NETWORK_NAME = "BTC"
+
+    def __init__(self):
+        self.headers = {0: {"block": 0, "hash": "genesis", "parent_hash": None}}
+        self.block_cache = BlockCache(min_confirmation=2, block_time=600)
+
+    def mine(self, until_block: int, tag: str, from_block: int = 1):
+        for block in range(from_block, until_block + 1):
+            self.headers[block] = {"block": block, "hash": f"{tag}{block}",
+                                   "parent_hash": self.headers[block - 1]["hash"]}
+        for block in [block for block in self.headers if block > until_block]:
+            del self.headers[block]
+
+    @staticmethod
+    def get_network_configuration():
+        return {"block_time": 600, "min_confirmation": 2}
+
+    def get_cached_last_block(self):
+        return max(self.headers)
+
+    def get_block_header(self, block):
+        return self.headers[block]
+
+    def get_block_cache(self):
+        return self.block_cache
+
+    def get_deposits_by_block(self, addresses, from_block, until_block, tokens):
+        return [{"block": block, "txid": self.headers[block]["hash"], "to_address": "a", "amount": Decimal("0.1")}
+                for block in range(from_block + 1, until_block + 1)]
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def get_watcher(chain, checkpoint_path, events, **kwargs):
+    return DepositWatcher(chain, [{"address": "a", "sub_address": None}], [], checkpoint_path,
+                          on_deposits=lambda block, deposits: events.append(("deposits", block, deposits)),
+                          on_rollback=lambda block, deposits: events.append(("rollback", block, deposits)),
+                          **kwargs)
+
+
+def test_new_blocks_are_reported_in_order(checkpoint_path):
+    chain, events = Chain(), []
+    chain.mine(5, "a")
+    watcher = get_watcher(chain, checkpoint_path, events, start_block=0, blocks_per_call=2)
+    assert watcher.poll() == 5
+    assert [block for _, block, _ in events] == [1, 2, 3, 4, 5]
+    assert events[0][2][0]["txid"] == "a1"
+    assert watcher.poll() == 0
+    assert watcher.last_block == 5
+
+
+def test_watcher_starts_at_the_tip_without_a_checkpoint(checkpoint_path):
+    chain, events = Chain(), []
+    chain.mine(5, "a")
+    watcher = get_watcher(chain, checkpoint_path, events)
+    assert watcher.poll() == 0
+    chain.mine(6, "a", from_block=6)
+    assert watcher.poll() == 1
+    assert [block for _, block, _ in events] == [6]
+
+
+def test_reorg_rolls_back_the_orphaned_blocks(checkpoint_path):
+    chain, events = Chain(), []
+    chain.mine(10, "a")
+    chain.block_cache.get_last_block(lambda: 10)
+    watcher = get_watcher(chain, checkpoint_path, events, start_block=0)
+    watcher.poll()
+    events.clear()
+    chain.mine(12, "b", from_block=9)  # Blocks 9 and 10 are orphaned
+    assert watcher.poll() == 4
+    assert [(event, block) for event, block, _ in events] == [("rollback", 10), ("rollback", 9), ("deposits", 9),
+                                                             ("deposits", 10), ("deposits", 11), ("deposits", 12)]
+    assert events[0][2][0]["txid"] == "a10"  # The rollback gets the deposits that were reported
+    assert events[2][2][0]["txid"] == "b9"
+    assert watcher._recent_blocks[12][0] == "b12"
+    assert chain.block_cache._last_block is None  # The cache of the orphaned blocks is dropped
+
+
+def test_checkpoint_is_resumed(checkpoint_path):
+    chain, events = Chain(), []
+    chain.mine(4, "a")
+    get_watcher(chain, checkpoint_path, events, start_block=0).poll()
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    assert checkpoint["recent_blocks"][-1]["deposits"][0]["amount"] == {"__decimal__": "0.1"}
+
+    chain.mine(6, "a", from_block=5)
+    resumed_events = []
+    resumed_watcher = get_watcher(chain, checkpoint_path, resumed_events, start_block=0)
+    assert resumed_watcher.last_block == 4
+    assert resumed_watcher._recent_blocks[4][1][0]["amount"] == Decimal("0.1")
+    assert resumed_watcher.poll() == 2
+    assert [block for _, block, _ in resumed_events] == [5, 6]
+
+
+def test_records_are_stored_in_the_checkpoint(checkpoint_path):
+    class RecordChain(Chain):
+        def get_deposits_by_block(self, addresses, from_block, until_block, tokens):
+            return [Deposit(token={"token_symbol": "BTC"}, from_address="f", to_address="a", txid="t",
+                            amount=Decimal("0.1"), block=block) for block in range(from_block + 1, until_block + 1)]
+
+    chain = RecordChain()
+    chain.mine(2, "a")
+    get_watcher(chain, checkpoint_path, [], start_block=0).poll()
+    resumed_watcher = get_watcher(chain, checkpoint_path, [])
+    assert resumed_watcher._recent_blocks[2][1][0]["token"] == {"token_symbol": "BTC"}
+
+
+def test_checkpoint_of_another_network_is_rejected(checkpoint_path):
+    chain = Chain()
+    get_watcher(chain, checkpoint_path, [], start_block=0).poll()
+    chain.NETWORK_NAME = "LTC"
+    with pytest.raises(ValueError):
+        get_watcher(chain, checkpoint_path, [])
+
+
+def test_deep_reorg_raises_and_keeps_the_checkpoint(checkpoint_path):
+    chain, events = Chain(), []
+    chain.mine(10, "a")
+    watcher = get_watcher(chain, checkpoint_path, events, start_block=0, max_reorg_depth=3)
+    watcher.poll()
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = checkpoint_file.read()
+    events.clear()
+    chain.mine(15, "c", from_block=2)
+    with pytest.raises(InvalidBlockError):
+        watcher.poll()
+    with open(checkpoint_path) as checkpoint_file:
+        assert checkpoint_file.read() == checkpoint
+    assert events == []
+    assert watcher.last_block == 10
+    assert not os.path.exists(f"{checkpoint_path}.tmp")
@@ -0,0 +1,106 @@
+import time
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.fee_oracle import FeeOracle
+
+BTC = {"token_symbol": "BTC"}
+USDT = {"token_symbol": "USDT", "contract_address": "0xdac"}
+BAD = {"token_symbol": "BAD"}
+
+
+def get_fee(value: str) -> dict:
+    return {"default_fee": Decimal(value), "additional_input_fee": Decimal("0"), "additional_output_fee": Decimal("0")}
+
+
+class Handler:
+    fee = "0.0001"
+    batch_fails = False
+    calls = []
+
+    @staticmethod
+    def get_network_configuration():
+        return {"block_time": 600}
+
+    @classmethod
+    def get_network_fee(cls, token):
+        cls.calls.append(("single", token["token_symbol"]))
+        if token is BAD:
+            raise ConnectionError("unknown token")
+        return get_fee(cls.fee)
+
+    @classmethod
+    def get_all_tokens_network_fees(cls, tokens):
+        cls.calls.append(("all", [token["token_symbol"] for token in tokens]))
+        if cls.batch_fails or BAD in tokens:
+            raise ConnectionError("the batch failed")
+        return [{"token": token, **get_fee(cls.fee)} for token in tokens if token is not USDT]  # USDT is left out
+
+
+@pytest.fixture(autouse=True)
+def reset_handler():
+    Handler.fee, Handler.batch_fails, Handler.calls = "0.0001", False, []
+
+
+def test_fees_are_served_from_memory():
+    oracle = FeeOracle(Handler)
+    assert oracle.REFRESH_INTERVAL == 300 and oracle.MAX_AGE == 3000
+    assert oracle.get_network_fee(BTC) == get_fee("0.0001")
+    Handler.fee = "0.0002"
+    assert oracle.get_network_fee(BTC) == get_fee("0.0001")
+    assert Handler.calls == [("single", "BTC")]
+
+
+def test_tokens_left_out_of_the_batch_are_fetched_one_by_one():
+    oracle = FeeOracle(Handler)
+    fees = oracle.get_all_tokens_network_fees([BTC, USDT])
+    assert fees == [{"token": BTC, **get_fee("0.0001")}, {"token": USDT, **get_fee("0.0001")}]
+    assert Handler.calls == [("all", ["BTC", "USDT"]), ("single", "USDT")]
+
+
+def test_failing_token_doesnt_poison_the_others():
+    oracle = FeeOracle(Handler)
+    with pytest.raises(ConnectionError):
+        oracle.get_all_tokens_network_fees([BTC, BAD])
+    assert set(oracle._tokens) == {FeeOracle.get_token_key(BTC)}
+    assert oracle.get_network_fee(BTC) == get_fee("0.0001")  # It got its fee despite the failure
+    Handler.calls = []
+    Handler.fee = "0.0003"
+    oracle.refresh()
+    assert Handler.calls == [("single", "BTC")]  # BAD isn't refreshed
+    assert oracle.get_network_fee(BTC) == get_fee("0.0003")
+
+
+def test_failed_batch_falls_back_to_single_calls():
+    oracle = FeeOracle(Handler)
+    Handler.batch_fails = True
+    assert len(oracle.get_all_tokens_network_fees([BTC, USDT])) == 2
+    assert Handler.calls == [("all", ["BTC", "USDT"]), ("single", "BTC"), ("single", "USDT")]
+
+
+def test_stale_quote_is_returned_and_refreshed_in_the_background():
+    oracle = FeeOracle(Handler, refresh_interval=0.05, max_age=60)
+    oracle.get_network_fee(BTC)
+    time.sleep(0.1)
+    Handler.fee = "0.0002"
+    assert oracle.get_network_fee(BTC) == get_fee("0.0001")
+    for _ in range(50):
+        if oracle.get_network_fee(BTC) == get_fee("0.0002"):
+            break
+        time.sleep(0.02)
+    assert oracle.get_network_fee(BTC) == get_fee("0.0002")
+
+
+def test_quote_older_than_max_age_waits_for_the_node():
+    oracle = FeeOracle(Handler, refresh_interval=0, max_age=0)
+    oracle.get_network_fee(BTC)
+    Handler.fee = "0.0002"
+    assert oracle.get_network_fee(BTC) == get_fee("0.0002")
+
+
+def test_returned_fees_can_be_changed():
+    oracle = FeeOracle(Handler)
+    fee = oracle.get_network_fee(BTC)
+    fee["default_fee"] = Decimal("1")
+    assert oracle.get_network_fee(BTC) == get_fee("0.0001")
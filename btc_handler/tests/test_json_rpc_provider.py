@@ -0,0 +1,40 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.Providers.JsonRPCProvider import JsonRPCProvider
+from btc_handler.exceptions import BadRequest, NetworkBusyException
+
+SCAN_RESULT = {"success": True, "total_amount": 0.3, "unspents": [
+    {"txid": "t1", "vout": 0, "desc": "addr(1BoatSLRHtKNngkdXEeobR76b53LETtpyT)#k0nvq2mw", "amount": 0.1},
+    {"txid": "t2", "vout": 1, "desc": "addr(bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq)#8kzm8txf", "amount": 0.15},
+    {"txid": "t3", "vout": 0, "desc": "addr(1BoatSLRHtKNngkdXEeobR76b53LETtpyT)#k0nvq2mw", "amount": 0.05},
+]}
+
+
+def test_all_the_addresses_are_scanned_in_one_call():
+    request = JsonRPCProvider.get_balances_request(["a", "b"])
+    assert json.loads(request["body"])["params"] == ["start", ["addr(a)", "addr(b)"]]
+
+
+def test_scan_is_split_by_the_descriptors():
+    balances = JsonRPCProvider.parse_balances_response({"result": SCAN_RESULT, "error": None}, 200)
+    assert balances == {"1BoatSLRHtKNngkdXEeobR76b53LETtpyT": Decimal("0.15"),
+                        "bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq": Decimal("0.15")}
+    assert JsonRPCProvider.parse_balance_response({"result": SCAN_RESULT, "error": None}, 200) == Decimal("0.3")
+
+
+def test_scan_in_progress_is_transient():
+    response = {"result": None, "error": {"code": -8, "message": "Scan already in progress, use action \"abort\""}}
+    with pytest.raises(NetworkBusyException):
+        JsonRPCProvider.parse_balances_response(response, 200)
+
+
+def test_aborted_scan_and_unexpected_descriptor_are_bad_requests():
+    with pytest.raises(BadRequest):
+        JsonRPCProvider.parse_balances_response({"result": {"success": False}, "error": None}, 200)
+    unspent = {"desc": "raw(76a914)#abc", "amount": 1}
+    with pytest.raises(BadRequest):
+        JsonRPCProvider.parse_balances_response({"result": {"success": True, "unspents": [unspent]}, "error": None},
+                                                200)
@@ -0,0 +1,80 @@
+from btc_handler.provider_health import ProviderHealth, LatencyWindow
+
+
+def test_circuit_opens_at_the_error_threshold():
+    health = ProviderHealth(window=10, min_requests=4, error_threshold=0.5, cooldown=60)
+    health.record_success(0.1)
+    health.record_failure()
+    health.record_success(0.1)
+    assert health.state == ProviderHealth.CLOSED  # Not enough requests yet
+    health.record_failure()
+    assert health.state == ProviderHealth.OPEN
+    assert not health.is_available()
+
+
+def test_trip_opens_the_circuit_right_away():
+    health = ProviderHealth(cooldown=60)
+    health.record_failure(trip=True)
+    assert health.state == ProviderHealth.OPEN
+
+
+def test_half_open_probe_closes_or_opens_the_circuit():
+    health = ProviderHealth(cooldown=0, half_open_probes=1)
+    health.record_failure(trip=True)
+    assert health.is_available()
+    assert health.state == ProviderHealth.HALF_OPEN
+    health.start_request()
+    health.record_failure()
+    assert health.state == ProviderHealth.OPEN
+
+    assert health.is_available()
+    health.start_request()
+    health.record_success(0.2)
+    assert health.state == ProviderHealth.CLOSED
+    assert health.error_rate == 0
+
+
+def test_probe_lets_a_request_through_an_open_circuit():
+    health = ProviderHealth(cooldown=60, half_open_probes=1)
+    health.record_failure(trip=True)
+    assert not health.is_available() and health.failed_at is not None
+    health.probe()
+    assert health.is_available()
+    health.start_request()
+    assert not health.is_available()
+    health.end_request()  # e.g. the probe was rate limited
+    assert health.is_available() and health.state == ProviderHealth.HALF_OPEN
+
+
+def test_half_open_lets_only_the_probes_through():
+    health = ProviderHealth(cooldown=60, half_open_probes=1)
+    health.record_failure(trip=True)
+    health._set_state(ProviderHealth.HALF_OPEN, health._changed_at)
+    assert health.is_available()
+    health.start_request()
+    assert not health.is_available()
+
+
+def test_ewma_latency():
+    health = ProviderHealth(ewma_alpha=0.5)
+    assert health.ewma_latency is None
+    health.record_success(1.0)
+    health.record_success(3.0)
+    assert health.ewma_latency == 2.0
+
+
+def test_latency_percentile_needs_min_samples():
+    window = LatencyWindow(size=100, min_samples=10)
+    for latency in range(9):
+        window.record(latency / 100)
+    assert window.percentile(0.95) is None
+    window.record(0.09)
+    assert window.percentile(0.95) == 0.09
+    assert window.percentile(0.5) == 0.05
+
+
+def test_latency_window_keeps_the_last_requests():
+    window = LatencyWindow(size=10, min_samples=1)
+    for latency in range(100):
+        window.record(latency)
+    assert window.percentile(0) == 90
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from btc_handler.rate_limiter import TokenBucket, FileTokenBucket, fcntl
+
+
+def test_burst_is_free_and_the_next_requests_queue():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    waits = [bucket.reserve() for _ in range(3)]
+    assert waits == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+
+
+def test_burst_defaults_to_the_rate():
+    assert TokenBucket(rate=5).BURST == 5
+    assert TokenBucket(rate=0.5).BURST == 1
+
+
+def test_pause_holds_the_next_requests_back():
+    bucket = TokenBucket(rate=10, burst=3)
+    bucket.pause(2)
+    assert bucket.reserve() >= 2
+    bucket.pause(0)
+    assert bucket.reserve() == pytest.approx(2.2, abs=0.05)  # pause(0) doesn't add a wait
+
+
+def test_tokens_refill_with_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("btc_handler.rate_limiter.time.time", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=2)
+    bucket.reserve(2)
+    assert bucket.reserve() == pytest.approx(0.5)
+    now[0] += 1.5  # 3 tokens are refilled, but the bucket holds at most 2
+    assert bucket.reserve() == 0
+    assert bucket._tokens == pytest.approx(1)
+
+
+def test_acquire_sleeps_for_its_turn(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("btc_handler.rate_limiter.time.sleep", sleeps.append)
+    bucket = TokenBucket(rate=4, burst=1)
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps == [pytest.approx(0.25, abs=0.01)]
+
+
+def test_aacquire_doesnt_block_the_loop():
+    bucket = TokenBucket(rate=100, burst=1)
+
+    async def acquire_twice():
+        await bucket.aacquire()
+        await bucket.aacquire()
+
+    asyncio.run(acquire_twice())
+    assert bucket._tokens < 0.5
+
+
+@pytest.mark.skipif(fcntl is None, reason="FileTokenBucket needs fcntl")
+def test_file_token_bucket_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / "bucket.state")
+    first, second = FileTokenBucket(path, rate=10, burst=2), FileTokenBucket(path, rate=10, burst=2)
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert first.reserve() == pytest.approx(0.1, abs=0.01)
+    assert second.reserve() == pytest.approx(0.2, abs=0.01)
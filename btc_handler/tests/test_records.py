@@ -0,0 +1,68 @@
+import gc
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.records import _TOKENS, Deposit, DepositBatch, Transaction, to_dicts
+
+TOKEN = {"token_symbol": "BTC", "contract_address": None, "decimals": 8}
+
+
+def get_deposit(index: int, **fields) -> dict:
+    deposit = {"token": dict(TOKEN), "from_address": "from", "to_address": f"to{index % 2}",
+               "txid": f"{index:064x}", "amount": Decimal("0.0023"), "block": 100 + index, "fee": None,
+               "param": index, "memo": None}
+    deposit.update(fields)
+    return deposit
+
+
+def test_deposit_reads_like_its_dict():
+    deposit = Deposit(**get_deposit(1))
+    assert deposit["txid"] == f"{1:064x}" and deposit.get("memo") is None
+    assert deposit.get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        deposit["missing"]
+    assert deposit == get_deposit(1)
+    assert not hasattr(deposit, "__dict__")
+
+
+def test_records_share_the_token():
+    assert Deposit(**get_deposit(1)).token is Deposit(**get_deposit(2)).token
+
+
+def test_unused_tokens_are_released():
+    token = {"token_symbol": "TMP", "contract_address": None, "decimals": 8}
+    deposit = Deposit(**get_deposit(1, token=token))
+    assert deposit.token == token and len([key for key in _TOKENS.keys() if ("token_symbol", "TMP") in key]) == 1
+    del deposit
+    gc.collect()
+    assert not [key for key in _TOKENS.keys() if ("token_symbol", "TMP") in key]
+
+
+def test_transaction_to_dict():
+    transaction = {"txid": "ab", "token": TOKEN, "total_amount": Decimal("1"), "timestamp": 1, "block": 2,
+                   "fee": Decimal("0.0001"), "memo": None,
+                   "transaction_inputs": [{"address": "a", "transaction_output_txid": "cd", "param": 0}],
+                   "transaction_outputs": [{"address": "b", "amount": Decimal("1"), "index": 0}]}
+    record = Transaction(**transaction)
+    assert record.transaction_inputs[0]["address"] == "a"
+    assert record.to_dict() == transaction
+    assert to_dicts([record]) == [transaction]
+
+
+def test_deposit_batch_round_trip():
+    deposits = [get_deposit(index) for index in range(5)]
+    deposits.append(get_deposit(5, txid="not-a-txid", memo="memo", amount=Decimal(2 ** 70) / 10 ** 8, fee="0.1"))
+    batch = DepositBatch(deposits)
+    assert len(batch) == 6
+    assert batch.to_dicts() == deposits
+    assert batch[-1]["txid"] == "not-a-txid"
+    with pytest.raises(IndexError):
+        batch[6]
+
+
+def test_deposit_batch_keeps_an_amount_with_more_digits_than_the_decimals():
+    deposits = [get_deposit(0, amount=0.1 + 0.2), get_deposit(1, amount=0.5)]
+    batch = DepositBatch(deposits)
+    assert batch[0]["amount"] == 0.1 + 0.2
+    assert batch[1]["amount"] == Decimal("0.5")
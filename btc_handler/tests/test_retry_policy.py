@@ -0,0 +1,99 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from btc_handler.exceptions import BadRequest, NetworkBusyException, RateLimit, UnknownException
+from btc_handler.retry_policy import RetryPolicy, RetryBudget, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("-3") == 0
+    assert parse_retry_after("soon") is None
+    assert 50 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+
+
+def test_only_transient_failures_are_retryable():
+    policy = RetryPolicy()
+    assert policy.is_retryable(UnknownException("?"))
+    assert policy.is_retryable(NetworkBusyException(network="BTC", main_exception_message="503"))
+    assert policy.is_retryable(RateLimit(error="", node="a", status_code=429))
+    assert policy.is_retryable(requests.ConnectionError())
+    assert not policy.is_retryable(BadRequest(data={}, error="bad", node="a", status_code=400))
+    assert not policy.is_retryable(ValueError())
+
+
+def get_flaky_function(failures: list):
+    calls = []
+
+    def function():
+        calls.append(None)
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    return function, calls
+
+
+def test_run_retries_until_success(monkeypatch):
+    monkeypatch.setattr("btc_handler.retry_policy.time.sleep", lambda seconds: None)
+    function, calls = get_flaky_function([UnknownException("1"), UnknownException("2")])
+    assert RetryPolicy(max_attempts=3).run(function) == "ok"
+    assert len(calls) == 3
+
+
+def test_run_stops_at_max_attempts(monkeypatch):
+    monkeypatch.setattr("btc_handler.retry_policy.time.sleep", lambda seconds: None)
+    function, calls = get_flaky_function([UnknownException(str(index)) for index in range(5)])
+    with pytest.raises(UnknownException):
+        RetryPolicy(max_attempts=3).run(function)
+    assert len(calls) == 3
+
+
+def test_non_retryable_failure_is_raised_right_away():
+    function, calls = get_flaky_function([BadRequest(data={}, error="bad", node="a", status_code=400)])
+    with pytest.raises(BadRequest):
+        RetryPolicy(max_attempts=3).run(function)
+    assert len(calls) == 1
+
+
+def test_budget_limits_the_retries(monkeypatch):
+    monkeypatch.setattr("btc_handler.retry_policy.time.sleep", lambda seconds: None)
+    budget = RetryBudget(ratio=0, max_tokens=1)
+    policy = RetryPolicy(max_attempts=5, budget=budget)
+    function, calls = get_flaky_function([UnknownException(str(index)) for index in range(5)])
+    with pytest.raises(UnknownException):
+        policy.run(function)
+    assert len(calls) == 2  # The first attempt and the one retry of the budget
+
+
+def test_budget_refills_by_ratio():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_delay_is_jittered_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1, max_delay=3)
+    error = UnknownException("?")
+    assert all(0 <= policy.get_delay(error, attempt=5) <= 3 for _ in range(20))
+    rate_limit = RateLimit(error="", node="a", status_code=429)
+    rate_limit.retry_after = 30
+    assert policy.get_delay(rate_limit, attempt=0) == 30
+
+
+def test_arun_retries():
+    function, calls = get_flaky_function([UnknownException("1")])
+
+    async def attempt():
+        return function()
+
+    assert asyncio.run(RetryPolicy(max_attempts=2, base_delay=0).arun(attempt)) == "ok"
+    assert len(calls) == 2
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+from btc_handler.session_pool import SessionPool, AsyncSessionPool, aiohttp
+
+
+def test_session_is_reused_per_provider():
+    pool = SessionPool(pool_size=4)
+    session = pool.get_session("json-rpc")
+    assert pool.get_session("json-rpc") is session
+    assert pool.get_session("other") is not session
+    adapter = session.get_adapter("https://node.example")
+    assert adapter._pool_maxsize == 4
+    pool.close()
+    assert pool.get_session("json-rpc") is not session
+
+
+def test_request_uses_the_default_timeout(monkeypatch):
+    pool = SessionPool(timeout=(1, 2))
+    sent = []
+    monkeypatch.setattr(pool.get_session("json-rpc"), "request", lambda **kwargs: sent.append(kwargs))
+    pool.request(provider="json-rpc", method="POST", url="http://node", data="{}")
+    pool.request(provider="json-rpc", method="POST", url="http://node", timeout=5)
+    assert sent[0]["timeout"] == (1, 2) and sent[0]["data"] == "{}"
+    assert sent[1]["timeout"] == 5
+
+
+@pytest.mark.skipif(aiohttp is None, reason="aiohttp isn't installed")
+def test_each_event_loop_has_its_own_sessions():
+    pool = AsyncSessionPool(max_concurrency=3)
+    first_loop_ready, second_loop_done = threading.Event(), threading.Event()
+    sessions = {}
+
+    async def use_pool(name: str):
+        session = pool.get_session("json-rpc")
+        assert pool.get_session("json-rpc") is session
+        assert pool._get_loop_sessions()[1]["json-rpc"]._value == 3
+        sessions[name] = session
+        if name == "first":
+            first_loop_ready.set()
+            await asyncio.get_running_loop().run_in_executor(None, second_loop_done.wait, 5)
+            assert not session.closed  # The other loop didn't touch the session of this one
+        await pool.close()
+
+    def run_second_loop():
+        first_loop_ready.wait(5)
+        asyncio.run(use_pool("second"))
+        second_loop_done.set()
+
+    thread = threading.Thread(target=run_second_loop)
+    thread.start()
+    asyncio.run(use_pool("first"))
+    thread.join(5)
+    assert sessions["first"] is not sessions["second"]
+    assert sessions["first"].closed and sessions["second"].closed
+    assert not pool._loops
+
+
+@pytest.mark.skipif(aiohttp is None, reason="aiohttp isn't installed")
+def test_sessions_of_an_ended_loop_are_forgotten():
+    pool = AsyncSessionPool()
+
+    async def get_session():
+        return pool.get_session("json-rpc")
+
+    first_session = asyncio.run(get_session())
+    second_session = asyncio.run(get_session())
+    assert first_session is not second_session
+    assert len(pool._loops) == 1
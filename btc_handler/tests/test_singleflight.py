@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from btc_handler.singleflight import SingleFlight
+
+
+def test_get_key_ignores_the_order_of_the_kwargs():
+    assert SingleFlight.get_key("a", x=1, y=[2]) == SingleFlight.get_key("a", y=[2], x=1)
+    assert SingleFlight.get_key("a", x=1) != SingleFlight.get_key("b", x=1)
+
+
+def run_concurrently(single_flight, function, callers: int = 4) -> list:
+    results = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = single_flight.do("key", function)
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_callers_share_one_call_and_get_their_own_copy():
+    calls = []
+
+    def function():
+        calls.append(None)
+        time.sleep(0.2)
+        return {"balances": [1]}
+
+    results = run_concurrently(SingleFlight(), function)
+    assert len(calls) == 1
+    assert results == [{"balances": [1]}] * 4
+    results[0]["balances"].append(2)
+    assert all(result == {"balances": [1]} for result in results[1:])
+    assert len({id(result) for result in results}) == 4
+
+
+def test_the_leader_cant_change_the_shared_result():
+    single_flight = SingleFlight()
+    follower_results = []
+    followers = []
+
+    def function():
+        follower = threading.Thread(target=lambda: follower_results.append(single_flight.do("key", function)))
+        follower.start()
+        followers.append(follower)
+        time.sleep(0.1)  # The follower waits for this call
+        return {"value": 1}
+
+    result = single_flight.do("key", function)
+    result["value"] = 2
+    followers[0].join(5)
+    assert follower_results == [{"value": 1}]
+
+
+def test_result_that_isnt_shared_isnt_copied():
+    result = {"deposits": [1]}
+    assert SingleFlight().do("key", lambda: result) is result
+
+    async def function():
+        return result
+
+    async def call():
+        return await SingleFlight().ado("key", function)
+
+    assert asyncio.run(call()) is result
+
+
+def test_exception_is_shared():
+    def function():
+        time.sleep(0.2)
+        raise ConnectionError("node is down")
+
+    results = run_concurrently(SingleFlight(), function, callers=3)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_nothing_is_cached_after_the_call():
+    calls = []
+    single_flight = SingleFlight()
+    for _ in range(2):
+        single_flight.do("key", lambda: calls.append(None))
+    assert len(calls) == 2
+
+
+def test_async_callers_share_one_task():
+    calls = []
+    single_flight = SingleFlight()
+
+    async def function():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return {"value": [1]}
+
+    async def call_all():
+        return await asyncio.gather(*[single_flight.ado("key", function) for _ in range(3)])
+
+    results = asyncio.run(call_all())
+    assert len(calls) == 1
+    results[0]["value"].append(2)
+    assert results[1:] == [{"value": [1]}, {"value": [1]}]
+    assert not single_flight._async_calls
+
+
+def test_cancelled_async_caller_doesnt_cancel_the_others():
+    single_flight = SingleFlight()
+
+    async def function():
+        await asyncio.sleep(0.05)
+        return 1
+
+    async def call_and_cancel_one():
+        first = asyncio.ensure_future(single_flight.ado("key", function))
+        second = asyncio.ensure_future(single_flight.ado("key", function))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(call_and_cancel_one()) == 1
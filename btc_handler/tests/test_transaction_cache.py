@@ -0,0 +1,104 @@
+import pickle
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.address_index import AddressIndex
+from btc_handler.base_node_handler import BaseNodeHandler
+from btc_handler.transaction_cache import TransactionCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TransactionCache(str(tmp_path / "transactions.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_get_set_delete(cache):
+    arguments = {"tokens": [{"token_symbol": "BTC"}]}
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info", arguments=arguments) == (False, None)
+    cache.set(network="BTC", txid="ab", function="get_transaction_info", result={"fee": Decimal("0.1")},
+              arguments=arguments)
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info",
+                     arguments=arguments) == (True, {"fee": Decimal("0.1")})
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info", arguments={})[0] is False
+    assert cache.get(network="LTC", txid="ab", function="get_transaction_info", arguments=arguments)[0] is False
+    cache.delete(network="BTC", txid="ab")
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info", arguments=arguments)[0] is False
+
+
+def test_none_result_is_cached(cache):
+    cache.set(network="BTC", txid="ab", function="get_block_by_transaction_id", result=None)
+    assert cache.get(network="BTC", txid="ab", function="get_block_by_transaction_id") == (True, None)
+
+
+def test_result_is_stored_as_json():
+    record = type("Record", (), {"to_dict": lambda self: {"amount": Decimal("1.5")}})()
+    result = {"fee": Decimal("0.00001"), "outputs": (record, 3, "x", None)}
+    cache = TransactionCache(":memory:")
+    cache.set(network="BTC", txid="ab", function="get_transaction_info", result=result)
+    stored = cache._connection.execute("SELECT result FROM transactions").fetchone()[0]
+    assert isinstance(stored, str) and '"__decimal__": "0.00001"' in stored
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info") == \
+        (True, {"fee": Decimal("0.00001"), "outputs": [{"amount": Decimal("1.5")}, 3, "x", None]})
+    with pytest.raises(TypeError):
+        cache.set(network="BTC", txid="cd", function="get_transaction_info", result={"value": object()})
+    assert cache.get(network="BTC", txid="cd", function="get_transaction_info")[0] is False
+
+
+unpickled = []
+
+
+class Payload:
+    def __reduce__(self):
+        return unpickled.append, ("code ran",)
+
+
+def test_pickled_row_is_a_miss_and_isnt_unpickled(cache):
+    cache._connection.execute("INSERT INTO transactions VALUES (?, ?, ?, ?, ?)",
+                              ("BTC", "ab", "get_transaction_info", "", pickle.dumps(Payload())))
+    assert cache.get(network="BTC", txid="ab", function="get_transaction_info") == (False, None)
+    assert unpickled == []
+
+
+def test_address_index_argument_is_keyed_by_its_entries():
+    addresses = [{"address": "a", "sub_address": None}, {"address": "b", "sub_address": "1"}]
+    assert TransactionCache.get_arguments_key({"addresses": AddressIndex(addresses)}) == \
+        TransactionCache.get_arguments_key({"addresses": AddressIndex(reversed(addresses))})
+    assert TransactionCache.get_arguments_key({"addresses": AddressIndex(addresses)}) != \
+        TransactionCache.get_arguments_key({"addresses": AddressIndex(addresses[:1])})
+    assert TransactionCache.get_arguments_key({}) == ""
+
+
+def get_handler(cache: TransactionCache, last_block: int):
+    calls = []
+
+    class Handler(BaseNodeHandler):
+        NETWORK_NAME = "BTC"
+        TRANSACTION_CACHE = cache
+
+        @staticmethod
+        def get_network_configuration():
+            return {"min_confirmation": 3, "block_time": 600}
+
+        @staticmethod
+        def get_last_block():
+            return last_block
+
+        @staticmethod
+        def get_transaction_info(txid, tokens, addresses=None):
+            calls.append(txid)
+            return {"txid": txid, "block": int(txid)}
+
+    return Handler, calls
+
+
+def test_only_confirmed_transactions_are_cached(cache):
+    handler, calls = get_handler(cache, last_block=100)
+    for _ in range(2):
+        assert handler.get_cached_transaction_info(txid="98", tokens=[])["block"] == 98
+        assert handler.get_cached_transaction_info(txid="99", tokens=[])["block"] == 99
+    assert calls == ["98", "99", "99"]
+    assert handler.is_block_confirmed(98) and not handler.is_block_confirmed(99)
+    assert not handler.is_block_confirmed(None)
@@ -0,0 +1,104 @@
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.utxo_index import UTXOIndex
+
+SOURCE = {"address": "S", "sub_address": None}
+OTHER = {"address": "O", "sub_address": None}
+
+
+def get_deposit(txid: str, param: int, amount: str, to_address: str = "S") -> dict:
+    return {"txid": txid, "param": param, "to_address": to_address, "amount": Decimal(amount)}
+
+
+@pytest.fixture
+def index():
+    index = UTXOIndex(":memory:", decimals=8)
+    index.watch([SOURCE])
+    yield index
+    index.close()
+
+
+def spend(txid: str, spent_outputs: list, outputs: list = ()) -> dict:
+    return {"txid": txid,
+            "transaction_inputs": [{"address": "S", "transaction_output_txid": output_txid, "param": param}
+                                   for output_txid, param in spent_outputs],
+            "transaction_outputs": [{"address": address, "amount": Decimal(amount), "index": output_index}
+                                    for output_index, (address, amount) in enumerate(outputs)]}
+
+
+def test_only_watched_addresses_are_indexed(index):
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5"), get_deposit("t1", 1, "0.7", to_address="O")])
+    assert index.get_balances([SOURCE, OTHER]) == {"S": 50000000, "O": 0}
+    assert index.is_watched([SOURCE]) and not index.is_watched([SOURCE, OTHER])
+    assert index.last_block == 1 and index.is_synced(1) and not index.is_synced(2)
+
+
+def test_spent_outputs_and_change(index):
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5"), get_deposit("t2", 0, "0.25")])
+    index.apply_block(2, transactions=[spend("t3", [("t1", 0)], [("O", "0.3"), ("S", "0.1999")])])
+    assert index.get_balance([SOURCE]) == [{"address": "S", "sub_address": None, "balance": Decimal("0.4499")}]
+    assert index.get_utxos([SOURCE]) == [
+        {"transaction_output_txid": "t2", "address": "S", "param": 0, "amount": 25000000},
+        {"transaction_output_txid": "t3", "address": "S", "param": 1, "amount": 19990000},
+    ]
+
+
+def test_get_params(index):
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5")])
+    assert index.get_params([SOURCE, OTHER]) == [
+        {"address": "S", "param": None,
+         "utxos": [{"transaction_output_txid": "t1", "address": "S", "param": 0, "amount": 50000000}]},
+        {"address": "O", "param": None, "utxos": []},
+    ]
+
+
+def test_select_utxos(index):
+    index.apply_block(1, deposits=[get_deposit(f"t{amount}", 0, f"0.0{amount}") for amount in (1, 5, 3)])
+    selected = index.select_utxos([SOURCE], amount=6000000, additional_input_fee=1000)
+    assert [utxo["transaction_output_txid"] for utxo in selected] == ["t5", "t3"]
+    with pytest.raises(ValueError):
+        index.select_utxos([SOURCE], amount=9000000, additional_input_fee=1000)
+
+
+def test_rollback_undoes_the_blocks(index):
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5")])
+    index.apply_block(2, transactions=[spend("t2", [("t1", 0)], [("S", "0.4")])])
+    index.apply_block(3, deposits=[get_deposit("t3", 0, "1")])
+    index.rollback_block(2)
+    assert index.last_block == 1
+    assert index.get_utxos([SOURCE]) == [{"transaction_output_txid": "t1", "address": "S", "param": 0,
+                                          "amount": 50000000}]
+
+
+def test_unwatch_drops_the_outputs(index):
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5")])
+    index.unwatch([SOURCE])
+    assert index.get_balances([SOURCE]) == {"S": 0}
+
+
+def test_reconcile_reports_the_different_balances(index):
+    index.watch([OTHER])
+    index.apply_block(1, deposits=[get_deposit("t1", 0, "0.5"), get_deposit("t2", 0, "0.1", to_address="O")])
+
+    class Handler:
+        @staticmethod
+        def get_node_balance(token, addresses):
+            return {"balances": [{"address": "S", "sub_address": None, "balance": Decimal("0.5")},
+                                 {"address": "O", "sub_address": None, "balance": Decimal("0.2")}]}
+
+    assert index.reconcile(Handler, token={"token_symbol": "BTC"}, addresses=[SOURCE, OTHER]) == [
+        {"address": "O", "local_balance": Decimal("0.1"), "node_balance": Decimal("0.2")}]
+
+
+def test_index_is_persisted(tmp_path):
+    path = str(tmp_path / "utxos.sqlite")
+    index = UTXOIndex(path)
+    index.watch([SOURCE])
+    index.apply_block(7, deposits=[get_deposit("t1", 0, "0.5")])
+    index.close()
+    reopened_index = UTXOIndex(path)
+    assert reopened_index.last_block == 7
+    assert reopened_index.get_balances([SOURCE]) == {"S": 50000000}
+    reopened_index.close()
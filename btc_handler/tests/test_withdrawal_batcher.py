@@ -0,0 +1,195 @@
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+
+from btc_handler.utxo_index import UTXOIndex
+from btc_handler.withdrawal_batcher import WithdrawalBatcher
+
+BTC = {"token_symbol": "BTC", "contract_address": None, "decimals": 8}
+SOURCE = {"address": "S", "sub_address": None}
+
+
+class Handler:
+    NATIVE_TOKEN = BTC
+    UTXO_INDEX = None
+    fee = {"default_fee": Decimal("0.0001"), "additional_input_fee": Decimal("0.00005"),
+           "additional_output_fee": Decimal("0.00001")}
+
+    @staticmethod
+    def get_network_configuration():
+        return {"block_time": 600}
+
+    @classmethod
+    def get_cached_network_fee(cls, token):
+        return dict(cls.fee)
+
+
+class Wallet:
+    formed = []
+
+    @classmethod
+    def form_transaction(cls, transaction, token, memo=""):
+        if any(output["address"] == "unformable" for output in transaction["outputs"]):
+            raise ValueError("The transaction can't be formed")
+        cls.formed.append(transaction)
+        return {"formed_transaction": "...", "fee": transaction["fee"]}
+
+
+def get_index(amounts: list) -> UTXOIndex:
+    index = UTXOIndex(":memory:", decimals=8)
+    index.watch([SOURCE])
+    index.apply_block(1, deposits=[{"txid": f"t{number}", "param": 0, "to_address": "S", "amount": Decimal(amount)}
+                                   for number, amount in enumerate(amounts)])
+    return index
+
+
+def get_batcher(amounts: list, **kwargs) -> WithdrawalBatcher:
+    return WithdrawalBatcher(Handler, Wallet, BTC, [SOURCE], "change", utxo_index=get_index(amounts), **kwargs)
+
+
+def withdraw(amount: str, address: str = "D") -> dict:
+    return {"address": address, "amount": Decimal(amount), "id": amount}
+
+
+def check_batch(batch: dict, index: UTXOIndex):
+    """
+    The inputs pay the outputs and the fee exactly
+    """
+    amounts = {utxo["transaction_output_txid"]: utxo["amount"] for utxo in index.get_utxos([SOURCE])}
+    transaction = batch["transaction"]
+    total = sum(amounts[transaction_input["transaction_output_txid"]] for transaction_input in transaction["inputs"])
+    assert Decimal(total) / 10 ** 8 == sum(output["amount"] for output in transaction["outputs"]) + transaction["fee"]
+
+
+def test_withdrawals_are_packed_into_one_transaction():
+    batcher = get_batcher(["1", "0.5"])
+    batches, unpaid_withdrawals = batcher.pack([withdraw("0.1"), withdraw("0.2"), withdraw("0.3")])
+    assert unpaid_withdrawals == []
+    assert len(batches) == 1
+    transaction = batches[0]["transaction"]
+    assert [transaction_input["transaction_output_txid"] for transaction_input in transaction["inputs"]] == ["t0"]
+    assert transaction["outputs"][-1]["address"] == "change"
+    assert transaction["fee"] == Decimal("0.00013")  # The default fee and 3 additional outputs
+    check_batch(batches[0], batcher.UTXO_INDEX)
+
+
+def test_unpayable_withdrawal_doesnt_hold_back_the_others():
+    batcher = get_batcher(["1", "0.5"])
+    batches, unpaid_withdrawals = batcher.pack([withdraw("0.1"), withdraw("5"), withdraw("0.2"), withdraw("0.3"),
+                                                withdraw("1.3"), withdraw("0.4")])
+    # 1.3 doesn't fit next to the others, and the 0.5 output that is left can't pay it alone
+    assert [withdrawal["id"] for withdrawal in unpaid_withdrawals] == ["5", "1.3"]
+    assert [[withdrawal["id"] for withdrawal in batch["withdrawals"]] for batch in batches] == \
+        [["0.1", "0.2", "0.3"], ["0.4"]]
+    for batch in batches:
+        check_batch(batch, batcher.UTXO_INDEX)
+
+
+def test_batches_are_limited_by_the_outputs():
+    batcher = get_batcher(["1", "1", "1"], max_outputs=3)
+    batches, unpaid_withdrawals = batcher.pack([withdraw("0.1", f"D{number}") for number in range(5)])
+    assert unpaid_withdrawals == []
+    assert [len(batch["withdrawals"]) for batch in batches] == [2, 2, 1]
+    assert all(len(batch["transaction"]["outputs"]) <= 3 for batch in batches)
+    for batch in batches:
+        check_batch(batch, batcher.UTXO_INDEX)
+
+
+def test_batches_are_limited_by_the_vsize():
+    batcher = get_batcher(["0.1"] * 10, max_vsize=WithdrawalBatcher.TRANSACTION_OVERHEAD_VSIZE +
+                          3 * WithdrawalBatcher.INPUT_VSIZE + 3 * WithdrawalBatcher.OUTPUT_VSIZE)
+    batches, _ = batcher.pack([withdraw("0.15", f"D{number}") for number in range(3)])
+    assert all(batcher.get_vsize(len(batch["transaction"]["inputs"]), len(batch["transaction"]["outputs"]))
+               <= batcher.MAX_VSIZE for batch in batches)
+    assert sum(len(batch["withdrawals"]) for batch in batches) == 3
+
+
+def test_dust_change_goes_to_the_fee():
+    batcher = get_batcher(["0.10011300"])
+    batches, _ = batcher.pack([withdraw("0.1")])
+    transaction = batches[0]["transaction"]
+    assert transaction["outputs"] == [{"address": "D", "amount": Decimal("0.1")}]
+    assert transaction["fee"] == Decimal("0.000113")  # 0.00011 and the change of 300 satoshi
+
+
+def test_reserved_outputs_arent_spent_twice():
+    batcher = get_batcher(["1", "0.5"])
+    first_batches, _ = batcher.pack([withdraw("0.6")])
+    second_batches, unpaid_withdrawals = batcher.pack([withdraw("0.6")])
+    assert second_batches == [] and len(unpaid_withdrawals) == 1
+    batcher.release(first_batches[0])
+    assert len(batcher.pack([withdraw("0.6")])[0]) == 1
+
+
+def test_flush_keeps_the_unpaid_withdrawals_pending():
+    Wallet.formed = []
+    batcher = get_batcher(["1"])
+    batcher.add(withdraw("0.1"))
+    batcher.add(withdraw("0.2", "unformable"))
+    batcher.add(withdraw("5"))
+    batches = batcher.flush()
+    assert len(batches) == 1 and isinstance(batches[0]["formed_transaction"], ValueError)
+    assert batcher._reserved == set()  # The inputs of the batch that failed to form are released
+    assert [withdrawal["id"] for withdrawal in batcher._pending] == ["5"]
+
+
+def test_only_the_native_token_is_batched():
+    with pytest.raises(ValueError):
+        WithdrawalBatcher(Handler, Wallet, {"token_symbol": "USDT", "contract_address": "0xdac", "decimals": 6},
+                          [SOURCE], "change", utxo_index=get_index([]))
+
+
+def test_batcher_needs_a_utxo_index():
+    with pytest.raises(ValueError):
+        WithdrawalBatcher(Handler, Wallet, BTC, [SOURCE], "change")
+
+
+def test_worker_survives_a_failing_on_batches():
+    calls, errors = [], []
+
+    def on_batches(batches):
+        calls.append(batches)
+        raise RuntimeError("the queue is down")
+
+    batcher = get_batcher(["1", "1"], window=0.05, max_withdrawals=1, on_batches=on_batches, on_error=errors.append)
+    batcher.start()
+    batcher.add(withdraw("0.1"))
+    for _ in range(100):
+        if calls:
+            break
+        time.sleep(0.01)
+    batcher.add(withdraw("0.2"))
+    for _ in range(100):
+        if len(calls) == 2:
+            break
+        time.sleep(0.01)
+    batcher.stop()
+    assert len(calls) == 2
+    assert len(errors) == 2 and all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_add_doesnt_wait_for_the_fees():
+    fetching, release = threading.Event(), threading.Event()
+
+    class SlowHandler(Handler):
+        @classmethod
+        def get_cached_network_fee(cls, token):
+            fetching.set()
+            release.wait(5)
+            return dict(cls.fee)
+
+    batcher = WithdrawalBatcher(SlowHandler, Wallet, BTC, [SOURCE], "change", utxo_index=get_index(["1"]))
+    batcher.add(withdraw("0.1"))
+    results = []
+    flush = threading.Thread(target=lambda: results.append(batcher.flush()))
+    flush.start()
+    assert fetching.wait(5)
+    started_at = time.monotonic()
+    batcher.add(withdraw("0.2"))
+    assert time.monotonic() - started_at < 1
+    release.set()
+    flush.join(5)
+    assert [withdrawal["id"] for withdrawal in results[0][0]["withdrawals"]] == ["0.1", "0.2"]
+    assert batcher._pending == []
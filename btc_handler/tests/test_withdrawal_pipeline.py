@@ -0,0 +1,139 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from btc_handler import withdrawal_pipeline
+from btc_handler.exceptions import BadBroadCastException
+from btc_handler.withdrawal_pipeline import WithdrawalPipeline
+
+
+class TransactionMismatch(BaseException):
+    # Like the TransactionMismatch of the wallets, it can't be rebuilt from its args when it is unpickled
+    def __init__(self, transaction: dict, token: dict, raw_transaction: str, message: str):
+        self.transaction = transaction
+        self.token = token
+        self.raw_transaction = raw_transaction
+        super().__init__(message)
+
+
+class SequentialHandler:
+    get_params_calls = []
+    broadcasts = []
+
+    @staticmethod
+    def get_network_configuration():
+        return {"is_utxo_based": False, "is_sequential": True}
+
+    @classmethod
+    def get_params(cls, addresses):
+        cls.get_params_calls.append([address["address"] for address in addresses])
+        return [{"address": address["address"], "param": 10} for address in addresses]
+
+    @classmethod
+    def broadcast_transaction(cls, signed_transaction):
+        cls.broadcasts.append(signed_transaction)
+        if signed_transaction.endswith(":bad"):
+            return {"is_successful": False, "error_message": "low fee", "txid": None}
+        return {"is_successful": True, "txid": f"txid-{signed_transaction}"}
+
+
+class UTXOHandler(SequentialHandler):
+    @staticmethod
+    def get_network_configuration():
+        return {"is_utxo_based": True, "is_sequential": False}
+
+    @classmethod
+    def get_params(cls, addresses):
+        cls.get_params_calls.append([address["address"] for address in addresses])
+        return [{"address": "A", "param": None, "utxos": [{"transaction_output_txid": "t1", "param": 0}]},
+                {"address": "B", "param": None, "utxos": None}]  # The outputs of B aren't known
+
+
+class Wallet:
+    @classmethod
+    def prepare_batch_worker(cls):
+        pass
+
+    @staticmethod
+    def create_and_sign_transaction(transaction, token, memo=""):
+        transaction_input = transaction["inputs"][0]
+        if transaction_input["address"] == "mismatch":
+            raise TransactionMismatch(transaction, token, "raw", "The outputs are different")
+        return {"txid": "unsigned", "fee": 1,
+                "signed_transaction": f"{transaction_input['address']}:{transaction_input['param']}:{memo}"}
+
+
+@pytest.fixture(autouse=True)
+def reset_handler():
+    SequentialHandler.get_params_calls = []
+    SequentialHandler.broadcasts = []
+
+
+def get_withdrawal(address: str, memo: str = "", **transaction_input) -> dict:
+    return {"transaction": {"inputs": [{"address": address, "param": None, **transaction_input}], "outputs": [],
+                            "fee": 0},
+            "token": {"token_symbol": "BTC"}, "memo": memo}
+
+
+@pytest.mark.parametrize("signing_processes", [1, 2])
+def test_sequential_withdrawals(signing_processes):
+    withdrawals = [get_withdrawal("A"), get_withdrawal("A", "bad"), get_withdrawal("A"), get_withdrawal("B"),
+                   get_withdrawal("mismatch"), get_withdrawal("B")]
+    results = WithdrawalPipeline(SequentialHandler, Wallet, signing_processes=signing_processes).process(withdrawals)
+    assert SequentialHandler.get_params_calls == [["A", "B", "mismatch"]]
+    assert results[0]["txid"] == "txid-A:10:" and results[0]["broadcast"]["is_successful"]
+    assert isinstance(results[1], BadBroadCastException)
+    assert isinstance(results[2], BadBroadCastException)  # It would leave a gap in the params of A
+    assert [results[3]["signed_transaction"], results[5]["signed_transaction"]] == ["B:10:", "B:11:"]
+    assert isinstance(results[4], TransactionMismatch) and results[4].raw_transaction == "raw"
+    assert "A:12:" not in SequentialHandler.broadcasts
+    assert withdrawals[0]["transaction"]["inputs"][0]["param"] is None  # The withdrawals aren't changed
+
+
+def test_failed_get_params_fails_the_withdrawals_that_needed_it():
+    class FailingHandler(SequentialHandler):
+        @classmethod
+        def get_params(cls, addresses):
+            raise ConnectionError("node is down")
+
+    withdrawals = [get_withdrawal("A"), {**get_withdrawal("B"), "transaction": {
+        "inputs": [{"address": "B", "param": 3}], "outputs": [], "fee": 0}}]
+    results = WithdrawalPipeline(FailingHandler, Wallet, signing_processes=1).process(withdrawals)
+    assert isinstance(results[0], ConnectionError)
+    assert results[1]["signed_transaction"] == "B:3:"
+
+
+def test_utxo_inputs_are_checked_with_one_call():
+    withdrawals = [get_withdrawal("A", transaction_output_txid="t1", param=0),
+                   get_withdrawal("A", transaction_output_txid="t2", param=0),
+                   get_withdrawal("A"),
+                   get_withdrawal("B", transaction_output_txid="t9", param=4)]
+    results = WithdrawalPipeline(UTXOHandler, Wallet, signing_processes=1).process(withdrawals)
+    assert UTXOHandler.get_params_calls == [["A", "B"]]
+    assert results[0]["signed_transaction"] == "A:0:"
+    assert isinstance(results[1], ValueError) and "t2:0" in str(results[1])
+    assert isinstance(results[2], ValueError) and "doesn't name its output" in str(results[2])
+    assert results[3]["signed_transaction"] == "B:4:"
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="the processes can't be forked")
+def test_private_keys_arent_sent_to_the_signing_processes(monkeypatch):
+    sent = []
+
+    class RecordingExecutor(ProcessPoolExecutor):
+        def map(self, function, *iterables, **kwargs):
+            iterables = [list(iterable) for iterable in iterables]
+            sent.append(pickle.dumps(iterables))
+            return super().map(function, *iterables, **kwargs)
+
+    monkeypatch.setattr(withdrawal_pipeline, "ProcessPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(multiprocessing, "get_start_method", lambda *args, **kwargs: "fork")
+    withdrawals = [get_withdrawal("A", private_key="secret-a"), get_withdrawal("mismatch", private_key="secret-m")]
+    results = WithdrawalPipeline(SequentialHandler, Wallet, signing_processes=2).process(withdrawals)
+    assert len(sent) == 1 and b"secret" not in sent[0]
+    assert results[0]["signed_transaction"] == "A:10:"
+    assert isinstance(results[1], TransactionMismatch)
+    assert results[1].transaction["inputs"][0]["private_key"] == "secret-m"  # Put back from this process
+    assert withdrawal_pipeline._signing_withdrawals == []
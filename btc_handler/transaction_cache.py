@@ -0,0 +1,100 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+
+from btc_handler.address_index import AddressIndex
+
+"""
+    > Transaction Cache
+    On-disk cache of the transaction functions of the Node Handlers, keyed by network, txid, function and arguments.
+    => Only the results of the transactions with at least min_confirmation confirmations should be stored, because
+       they never change after that. The Node Handler decides it (see get_cached_transaction_info).
+    => It is a SQLite file, so the handlers of different networks and different processes can share one cache.
+    => The results are stored as JSON with the Decimals tagged (like the checkpoint of the deposit watcher), so reading
+       the shared file can't run code. Tuples come back as lists and records as their dicts.
+"""
+
+
+def _encode_result_value(value):
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if hasattr(value, "to_dict"):  # Deposit and transaction records
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} can't be stored in the transaction cache")
+
+
+def _decode_result_object(value: dict):
+    if len(value) == 1 and "__decimal__" in value:
+        return Decimal(value["__decimal__"])
+    return value
+
+
+class TransactionCache:
+    def __init__(self, path: str):
+        """
+        @param path: Path of the SQLite file of the cache. It is created if it doesn't exist.
+        """
+        self.PATH = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS transactions ("
+                                 "network TEXT NOT NULL, txid TEXT NOT NULL, function TEXT NOT NULL, "
+                                 "arguments TEXT NOT NULL, result TEXT NOT NULL, "
+                                 "PRIMARY KEY (network, txid, function, arguments))")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_arguments_key(arguments: dict) -> str:
+        """
+        @param arguments: Arguments of the function other than txid, e.g. {"tokens": [...], "addresses": [...]}
+        @return: A short key that is the same for equal arguments. An AddressIndex is keyed by its digest, so its
+            order doesn't matter and its addresses aren't serialized.
+        """
+        if not arguments:
+            return ""
+        return hashlib.sha256(json.dumps(arguments, sort_keys=True,
+                                         default=lambda value: value.digest if isinstance(value, AddressIndex)
+                                         else str(value)).encode()).hexdigest()
+
+    def get(self, network: str, txid: str, function: str, arguments: dict = None) -> tuple:
+        """
+        @param network: Name of the network
+        @param txid: Transaction id
+        @param function: Name of the function of the Node Handler, e.g. "get_transaction_info"
+        @param arguments: Arguments of the function other than txid
+        @return: A tuple of (found, result)
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM transactions WHERE network = ? AND txid = ? AND function = ? AND arguments = ?",
+                (network, txid, function, self.get_arguments_key(arguments))).fetchone()
+        if row is None or not isinstance(row[0], str):  # The rows of the older versions are pickles, they are misses
+            return False, None
+        return True, json.loads(row[0], object_hook=_decode_result_object)
+
+    def set(self, network: str, txid: str, function: str, result, arguments: dict = None):
+        """
+        @param network: Name of the network
+        @param txid: Transaction id
+        @param function: Name of the function of the Node Handler, e.g. "get_transaction_info"
+        @param result: What the function returned
+        @param arguments: Arguments of the function other than txid
+        @raise TypeError: If the result has a value that can't be stored in JSON
+        """
+        encoded_result = json.dumps(result, default=_encode_result_value)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?)",
+                                     (network, txid, function, self.get_arguments_key(arguments), encoded_result))
+
+    def delete(self, network: str, txid: str):
+        """
+        Drops all the cached results of a transaction.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM transactions WHERE network = ? AND txid = ?", (network, txid))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,242 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from btc_handler.amounts import to_base_unit, from_base_units, from_base_unit
+
+"""
+    > UTXO Index
+    Local set of the unspent outputs of the watched addresses of a UTXO-based network (is_utxo_based networks).
+    => It is built from the deposit stream (get_deposits_by_block, DepositWatcher) and the transactions that spend
+       the outputs (get_transaction_info), so balances and UTXO selection are answered without asking the node.
+    => The amounts are stored as integers in the base unit of the native token (e.g. satoshi) so sums are exact.
+    => It is a SQLite file. Blocks are applied in order and rollback_block undoes a block after a reorg.
+    => Use reconcile to compare it with the node from time to time.
+"""
+
+
+class UTXOIndex:
+    def __init__(self, path: str, decimals: int = 8):
+        """
+        @param path: Path of the SQLite file of the index. It is created if it doesn't exist.
+        @param decimals: decimals of the native token of the network
+        """
+        self.PATH = path
+        self.DECIMALS = decimals
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS watched_addresses (address TEXT PRIMARY KEY)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS utxos ("
+                                 "txid TEXT NOT NULL, output_index INTEGER NOT NULL, address TEXT NOT NULL, "
+                                 "amount INTEGER NOT NULL, block INTEGER NOT NULL, spent_block INTEGER, "
+                                 "PRIMARY KEY (txid, output_index))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS utxos_address ON utxos (address, spent_block)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS utxos_block ON utxos (block)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS utxos_spent_block ON utxos (spent_block)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def watch(self, addresses: list):
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format. Their outputs are indexed from now.
+        """
+        with self._transaction():
+            self._connection.executemany("INSERT OR IGNORE INTO watched_addresses VALUES (?)",
+                                         [(address["address"],) for address in addresses])
+
+    def unwatch(self, addresses: list):
+        with self._transaction():
+            for address in addresses:
+                self._connection.execute("DELETE FROM watched_addresses WHERE address = ?", (address["address"],))
+                self._connection.execute("DELETE FROM utxos WHERE address = ?", (address["address"],))
+
+    def is_watched(self, addresses: list) -> bool:
+        """
+        @return: Whether all the addresses are watched
+        """
+        unique_addresses = list({address["address"] for address in addresses})
+        watched = 0
+        with self._lock:
+            for index in range(0, len(unique_addresses), 500):
+                chunk = unique_addresses[index:index + 500]
+                watched += self._connection.execute(
+                    f"SELECT COUNT(*) FROM watched_addresses WHERE address IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchone()[0]
+        return watched == len(unique_addresses)
+
+    @property
+    def last_block(self):
+        """
+        @return: Height of the last applied block, or None if nothing is applied yet
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM state WHERE key = 'last_block'").fetchone()
+        return None if row is None else row[0]
+
+    def is_synced(self, block: int) -> bool:
+        """
+        @return: Whether all the blocks up to the given block are applied
+        """
+        last_block = self.last_block
+        return last_block is not None and last_block >= block
+
+    def apply_block(self, block: int, deposits: list = (), transactions: list = ()):
+        """
+        Applies the outputs and spends of a block. Blocks have to be applied in order.
+        @param block: Height of the block
+        @param deposits: deposits of the block in the format of get_deposits_by_block (param is the output index)
+        @param transactions: transactions of the block that spend the outputs of the watched addresses,
+            in the format of get_transaction_info. Their outputs to the watched addresses are indexed too.
+        """
+        outputs = [(deposit["txid"], deposit["param"], deposit["to_address"],
+                    to_base_unit(deposit["amount"], self.DECIMALS)) for deposit in deposits]
+        spends = []
+        for transaction in transactions:
+            outputs += [(transaction["txid"], output["index"], output["address"],
+                         to_base_unit(output["amount"], self.DECIMALS))
+                        for output in transaction["transaction_outputs"]]
+            spends += [(block, transaction_input["transaction_output_txid"], transaction_input["param"])
+                       for transaction_input in transaction["transaction_inputs"]]
+        with self._transaction():
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO utxos SELECT ?, ?, address, ?, ?, NULL FROM watched_addresses WHERE address = ?",
+                [(txid, output_index, amount, block, address) for txid, output_index, address, amount in outputs])
+            self._connection.executemany(
+                "UPDATE utxos SET spent_block = ? WHERE txid = ? AND output_index = ? AND spent_block IS NULL", spends)
+            self._connection.execute("INSERT OR REPLACE INTO state VALUES ('last_block', ?)", (block,))
+
+    def rollback_block(self, block: int):
+        """
+        Undoes the block and the blocks above it, e.g. from on_rollback of DepositWatcher.
+        @param block: Height of the first orphaned block
+        """
+        with self._transaction():
+            self._connection.execute("DELETE FROM utxos WHERE block >= ?", (block,))
+            self._connection.execute("UPDATE utxos SET spent_block = NULL WHERE spent_block >= ?", (block,))
+            self._connection.execute("UPDATE state SET value = ? WHERE key = 'last_block' AND value >= ?",
+                                     (block - 1, block))
+
+    def get_balances(self, addresses: list) -> dict:
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @return: {address: balance} in the base unit
+        """
+        balances = {address["address"]: 0 for address in addresses}
+        with self._lock:
+            for address in balances:
+                balances[address] = self._connection.execute(
+                    "SELECT COALESCE(SUM(amount), 0) FROM utxos WHERE address = ? AND spent_block IS NULL",
+                    (address,)).fetchone()[0]
+        return balances
+
+    def get_balance(self, addresses: list) -> list:
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @return: the balances in the format of get_balance of the Node Handler
+        """
+        balances = self.get_balances(addresses)
+        amounts = from_base_units([balances[address["address"]] for address in addresses], self.DECIMALS)
+        return [{"address": address["address"], "sub_address": address.get("sub_address"), "balance": amount}
+                for address, amount in zip(addresses, amounts)]
+
+    def get_utxos(self, addresses: list) -> list:
+        """
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @return: Unspent outputs of the addresses in the input format of form_transaction, with their amounts:
+        [
+            {
+                "transaction_output_txid": "ab12...",
+                "address": "1BoatSLRHtKNngkdXEeobR76b53LETtpyT",
+                "param": 1,
+                "amount": 230000  # in the base unit
+            }, ...
+        ]
+        """
+        utxos = []
+        with self._lock:
+            for address in dict.fromkeys(address["address"] for address in addresses):
+                utxos += [{"transaction_output_txid": txid, "address": address, "param": output_index,
+                           "amount": amount}
+                          for txid, output_index, amount in self._connection.execute(
+                              "SELECT txid, output_index, amount FROM utxos WHERE address = ? AND spent_block IS NULL "
+                              "ORDER BY block, txid, output_index", (address,))]
+        return utxos
+
+    def get_params(self, addresses: list) -> list:
+        """
+        @return: a list in the format of get_params of the Node Handler. The addresses of a UTXO-based network don't
+            have a param, so it is None, and the unspent outputs of each address (see get_utxos) are under "utxos":
+        [
+            {
+                "address": "1BoatSLRHtKNngkdXEeobR76b53LETtpyT",
+                "param": None,
+                "utxos": [...]
+            }, ...
+        ]
+        """
+        utxos_by_address = {address["address"]: [] for address in addresses}
+        for utxo in self.get_utxos(addresses):
+            utxos_by_address[utxo["address"]].append(utxo)
+        return [{"address": address, "param": None, "utxos": utxos} for address, utxos in utxos_by_address.items()]
+
+    def select_utxos(self, addresses: list, amount: int, additional_input_fee: int = 0) -> list:
+        """
+        Selects the largest unspent outputs of the addresses until they cover the amount
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @param amount: Amount that is going to be sent (with the fee) in the base unit
+        @param additional_input_fee: Fee of each input in the base unit
+        @return: the selected outputs in the format of get_utxos
+        @raise ValueError: if the outputs aren't enough
+        """
+        selected_utxos, total = [], 0
+        for utxo in sorted(self.get_utxos(addresses), key=lambda utxo: utxo["amount"], reverse=True):
+            if total >= amount:
+                break
+            if utxo["amount"] <= additional_input_fee:
+                break
+            selected_utxos.append(utxo)
+            total += utxo["amount"]
+            amount += additional_input_fee
+        if total < amount:
+            raise ValueError(f"The unspent outputs cover {total} of {amount}")
+        return selected_utxos
+
+    def reconcile(self, node_handler, token: dict, addresses: list) -> list:
+        """
+        Compares the local balances with the balances of the node
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler. Its get_node_balance is used,
+            because its get_balance may be answered by this index.
+        @param token: The native token of the network
+        @param addresses: a list of addresses in {"address", "sub_address"} format
+        @return: the addresses that have different balances in below format (empty if the index is consistent):
+        [
+            {
+                "address": "1BoatSLRHtKNngkdXEeobR76b53LETtpyT",
+                "local_balance": Decimal("0.1"),
+                "node_balance": Decimal("0.2")
+            }, ...
+        ]
+        """
+        node_balances = {balance["address"]: balance["balance"]
+                         for balance in node_handler.get_node_balance(token=token, addresses=addresses)["balances"]}
+        local_balances = self.get_balances(addresses)
+        return [{"address": address, "local_balance": from_base_unit(local_balance, self.DECIMALS),
+                 "node_balance": node_balances[address]}
+                for address, local_balance in local_balances.items()
+                if to_base_unit(node_balances[address], self.DECIMALS) != local_balance]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,259 @@
+import threading
+from collections import deque
+from decimal import Decimal, ROUND_CEILING
+
+from btc_handler.amounts import get_scale, to_base_unit, from_base_unit
+
+"""
+    > Withdrawal Batcher
+    Collects the withdrawals of a token and packs them into as few multi-output transactions as possible.
+    => A batch is flushed when WINDOW seconds have passed or MAX_WITHDRAWALS withdrawals are pending.
+    => The withdrawals are packed in the order they arrived. Each transaction is limited to MAX_VSIZE virtual bytes
+       (estimated for P2PKH inputs and outputs) and MAX_OUTPUTS outputs. A withdrawal that can't be paid now (the free
+       outputs don't cover it, or it doesn't fit in a transaction) stays pending without holding back the others.
+    => The inputs are the largest unspent outputs of the source addresses in the UTXO index, and the fee is
+       default_fee + additional_input_fee and additional_output_fee for each extra input and output (from
+       get_cached_network_fee). The change goes back to CHANGE_ADDRESS, unless it is dust.
+    => The selected outputs are reserved until the UTXO index sees them spent, so the next batches don't spend them
+       again. Call release for the batches that weren't broadcast.
+    => The fees and the unspent outputs are fetched before the pending withdrawals are taken, so add doesn't wait for
+       the node. Only one flush runs at a time.
+    => Only the native token of the network can be batched: the amounts are compared with the unspent outputs and
+       the fees, which are in the native token.
+"""
+
+
+class WithdrawalBatcher:
+    TRANSACTION_OVERHEAD_VSIZE = 10
+    INPUT_VSIZE = 148
+    OUTPUT_VSIZE = 34
+    DUST_LIMIT = 546  # in the base unit
+
+    def __init__(self, node_handler, wallet, token: dict, source_addresses: list, change_address: str,
+                 utxo_index=None, window: float = None, max_withdrawals: int = 1000, max_vsize: int = 100000,
+                 max_outputs: int = None, on_batches=None, on_error=None):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param wallet: The Wallet class of the network, e.g. BTCWallet
+        @param token: The token of the withdrawals. It must be the native token of the network.
+        @param source_addresses: The addresses that pay the withdrawals in {"address", "sub_address"} format
+        @param change_address: The address that gets the change
+        @param utxo_index: The UTXOIndex of the source addresses (UTXO_INDEX of the Node Handler by default)
+        @param window: Seconds that the withdrawals are collected for. It is block_time / 2 by default.
+        @param max_withdrawals: Number of the pending withdrawals that flush a batch before the window ends
+        @param max_vsize: Maximum estimated virtual size of a transaction
+        @param max_outputs: Maximum number of the outputs of a transaction (with the change), not limited by default
+        @param on_batches: A function of (batches) that is called with the result of each flush of start
+        @param on_error: A function of (exception) that is called when a flush of start or on_batches fails. The
+            withdrawals of a failed flush stay pending and the next window tries again.
+        @raise ValueError: if the token isn't the native token of the network or there is no UTXO index
+        """
+        if self.get_token_key(token) != self.get_token_key(node_handler.NATIVE_TOKEN):
+            raise ValueError(f"Only the native token can be batched, not {token['token_symbol']}")
+        self.NODE_HANDLER = node_handler
+        self.WALLET = wallet
+        self.TOKEN = token
+        self.SOURCE_ADDRESSES = source_addresses
+        self.CHANGE_ADDRESS = change_address
+        self.UTXO_INDEX = utxo_index if utxo_index is not None else node_handler.UTXO_INDEX
+        if self.UTXO_INDEX is None:
+            raise ValueError("The batcher needs a UTXO index of the source addresses")
+        if window is None:
+            window = node_handler.get_network_configuration()["block_time"] / 2
+        self.WINDOW = window
+        self.MAX_WITHDRAWALS = max_withdrawals
+        self.MAX_VSIZE = max_vsize
+        self.MAX_OUTPUTS = max_outputs
+        self.ON_BATCHES = on_batches
+        self.ON_ERROR = on_error
+        self._pending = []
+        self._reserved = set()  # {(transaction_output_txid, param)} of the outputs that batches are spending
+        self._lock = threading.Lock()  # Of _pending and _reserved
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def get_token_key(token: dict) -> tuple:
+        return token["token_symbol"], token.get("contract_address"), token.get("identifier")
+
+    def add(self, withdrawal: dict):
+        """
+        @param withdrawal: a withdrawal in below format:
+        {
+            "address": "1BoatSLRHtKNngkdXEeobR76b53LETtpyT",
+            "amount": Decimal("0.0023"),
+            ...  # anything else, like the id of the withdrawal, is kept
+        }
+        """
+        with self._lock:
+            self._pending.append(withdrawal)
+            if len(self._pending) >= self.MAX_WITHDRAWALS:
+                self._flush_event.set()
+
+    def get_vsize(self, inputs: int, outputs: int) -> int:
+        return self.TRANSACTION_OVERHEAD_VSIZE + self.INPUT_VSIZE * inputs + self.OUTPUT_VSIZE * outputs
+
+    def _get_base_fees(self) -> tuple:
+        decimals = self.NODE_HANDLER.NATIVE_TOKEN["decimals"]
+        network_fee = self.NODE_HANDLER.get_cached_network_fee(self.TOKEN)
+        return tuple(int((Decimal(network_fee[name]) * get_scale(decimals)).to_integral_value(ROUND_CEILING))
+                     for name in ("default_fee", "additional_input_fee", "additional_output_fee"))
+
+    def _get_free_utxos(self) -> list:
+        utxos = self.UTXO_INDEX.get_utxos(self.SOURCE_ADDRESSES)
+        unspent = {(utxo["transaction_output_txid"], utxo["param"]) for utxo in utxos}
+        with self._lock:
+            self._reserved &= unspent  # The outputs that the index saw spent don't need a reservation anymore
+            free_utxos = [utxo for utxo in utxos
+                          if (utxo["transaction_output_txid"], utxo["param"]) not in self._reserved]
+        return sorted(free_utxos, key=lambda utxo: utxo["amount"], reverse=True)
+
+    def pack(self, withdrawals: list, base_fees: tuple = None, utxos: list = None) -> tuple:
+        """
+        Packs the withdrawals into transactions in the format of form_transaction and reserves their inputs
+        @param base_fees: The result of _get_base_fees, fetched by default
+        @param utxos: The result of _get_free_utxos, fetched by default
+        @return: (batches, the withdrawals that the free unspent outputs couldn't pay), each batch in below format:
+        {
+            "withdrawals": [...],
+            "transaction": {"inputs": [...], "outputs": [...], "fee": Decimal("0.0001")}
+        }
+        """
+        if base_fees is None:
+            base_fees = self._get_base_fees()
+        if utxos is None:
+            utxos = self._get_free_utxos()
+        default_fee, additional_input_fee, additional_output_fee = base_fees
+        decimals = self.NODE_HANDLER.NATIVE_TOKEN["decimals"]
+
+        def get_fee(inputs: int, outputs: int) -> int:
+            return default_fee + additional_input_fee * (inputs - 1) + additional_output_fee * (outputs - 1)
+
+        utxos = deque(utxos)
+        free_amount = sum(utxo["amount"] for utxo in utxos)  # Of the outputs in utxos
+        batches, unpaid_withdrawals = [], []
+        batch_withdrawals, batch_inputs, batch_amount, batch_total = [], [], 0, 0
+        index = 0
+        while index < len(withdrawals):
+            amount = to_base_unit(withdrawals[index]["amount"], decimals)
+            outputs = len(batch_withdrawals) + 2  # The new output and the change
+            new_inputs = []
+            total = batch_total
+            while total < batch_amount + amount + get_fee(len(batch_inputs) + len(new_inputs), outputs) and utxos:
+                new_inputs.append(utxos.popleft())
+                total += new_inputs[-1]["amount"]
+                free_amount -= new_inputs[-1]["amount"]
+            inputs = len(batch_inputs) + len(new_inputs)
+            is_covered = total >= batch_amount + amount + get_fee(inputs, outputs)
+            fits = self.get_vsize(inputs, outputs) <= self.MAX_VSIZE and \
+                (self.MAX_OUTPUTS is None or outputs <= self.MAX_OUTPUTS)
+            if is_covered and fits:
+                batch_withdrawals.append(withdrawals[index])
+                batch_inputs += new_inputs
+                batch_amount += amount
+                batch_total = total
+                index += 1
+                continue
+            utxos.extendleft(reversed(new_inputs))
+            free_amount += total - batch_total
+            if not batch_withdrawals or amount + get_fee(1, 2) > batch_total + free_amount:
+                # Even a transaction of this withdrawal alone can't be formed now. It stays pending and the next
+                # withdrawals are still packed.
+                unpaid_withdrawals.append(withdrawals[index])
+                index += 1
+                continue
+            batches.append(self._close_batch(batch_withdrawals, batch_inputs, batch_amount, batch_total, get_fee,
+                                             decimals))
+            batch_withdrawals, batch_inputs, batch_amount, batch_total = [], [], 0, 0  # It is tried in a new batch
+        if batch_withdrawals:
+            batches.append(self._close_batch(batch_withdrawals, batch_inputs, batch_amount, batch_total, get_fee,
+                                             decimals))
+        return batches, unpaid_withdrawals
+
+    def _close_batch(self, withdrawals: list, inputs: list, amount: int, total: int, get_fee, decimals: int) -> dict:
+        outputs = [{"address": withdrawal["address"], "amount": withdrawal["amount"]} for withdrawal in withdrawals]
+        fee = get_fee(len(inputs), len(outputs) + 1)
+        change = total - amount - fee
+        if change >= self.DUST_LIMIT:
+            outputs.append({"address": self.CHANGE_ADDRESS, "amount": from_base_unit(change, decimals)})
+        else:
+            fee += change
+        with self._lock:
+            self._reserved.update((utxo["transaction_output_txid"], utxo["param"]) for utxo in inputs)
+        return {
+            "withdrawals": withdrawals,
+            "transaction": {
+                "inputs": [{"transaction_output_txid": utxo["transaction_output_txid"], "address": utxo["address"],
+                            "param": utxo["param"]} for utxo in inputs],
+                "outputs": outputs,
+                "fee": from_base_unit(fee, decimals),
+            },
+        }
+
+    def release(self, batch: dict):
+        """
+        Frees the inputs of a batch that won't be broadcast, so the next batches can spend them
+        """
+        with self._lock:
+            self._reserved.difference_update((transaction_input["transaction_output_txid"], transaction_input["param"])
+                                             for transaction_input in batch["transaction"]["inputs"])
+
+    def flush(self) -> list:
+        """
+        Packs the pending withdrawals and forms their transactions with form_transaction of the wallet.
+        The withdrawals that can't be paid yet stay pending.
+        @return: the batches of pack, each with a "formed_transaction" key that holds the result of form_transaction
+            or its exception. The inputs of a batch that failed to form are released.
+        """
+        with self._flush_lock:
+            base_fees = self._get_base_fees()
+            utxos = self._get_free_utxos()
+            with self._lock:
+                withdrawals, self._pending = self._pending, []
+                self._flush_event.clear()
+            try:
+                batches, unpaid_withdrawals = self.pack(withdrawals, base_fees=base_fees, utxos=utxos)
+            except BaseException:
+                with self._lock:
+                    self._pending[:0] = withdrawals
+                raise
+            with self._lock:
+                self._pending[:0] = unpaid_withdrawals  # Before the withdrawals that were added while packing
+        for batch in batches:
+            try:
+                batch["formed_transaction"] = self.WALLET.form_transaction(transaction=batch["transaction"],
+                                                                           token=self.TOKEN)
+            except Exception as error:
+                batch["formed_transaction"] = error
+                self.release(batch)
+        return batches
+
+    def start(self):
+        """
+        Flushes the batches every WINDOW seconds (or sooner when MAX_WITHDRAWALS are pending) in a daemon thread
+        and gives them to on_batches
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="withdrawal-batcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._flush_event.wait(self.WINDOW)
+            if self._stop_event.is_set():
+                return
+            try:
+                batches = self.flush()
+                if batches and self.ON_BATCHES is not None:
+                    self.ON_BATCHES(batches)
+            except Exception as error:
+                if self.ON_ERROR is not None:
+                    self.ON_ERROR(error)
+
+    def stop(self):
+        self._stop_event.set()
+        self._flush_event.set()
@@ -0,0 +1,258 @@
+import copy
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from btc_handler.exceptions import BadBroadCastException
+
+"""
+    > Withdrawal Pipeline
+    Forms, signs and broadcasts many withdrawals at once and returns the result or the exception of each of them.
+    => The missing params (nonce, sequence, ...) of all the withdrawals are got with one get_params call. On sequential
+       networks the withdrawals of the same address get consecutive params in the order of the list.
+    => On UTXO-based networks the inputs must name their outputs (WithdrawalBatcher selects them). The outputs are
+       checked with one get_params call, and a withdrawal that spends an output the UTXO index doesn't have unspent
+       fails before it is signed.
+    => create_and_sign_transaction of the wallet runs in a process pool (SIGNING_PROCESSES) if the processes are forked,
+       otherwise in this process. The workers inherit the withdrawals when they are forked and only get the index of a
+       withdrawal, so the private keys of the inputs are never sent through a pipe.
+    => broadcast_transaction of the Node Handler runs in a thread pool (BROADCAST_CONCURRENCY).
+    => On sequential networks the transactions of an address are broadcast one by one in the order of their params. If
+       one of them fails, the next ones of that address aren't broadcast because their params would have a gap.
+    => An exception of an item is returned in its place instead of being raised, so one bad withdrawal doesn't stop
+       the others. KeyboardInterrupt, SystemExit and GeneratorExit are still raised.
+"""
+
+_FATAL_EXCEPTIONS = (KeyboardInterrupt, SystemExit, GeneratorExit)
+
+_signing_withdrawals = []  # The withdrawals of the running sign, inherited by its forked worker processes
+_signing_lock = threading.Lock()
+
+
+class _WithdrawalPart:
+    # Stands for withdrawal[key] in the state of a dumped exception
+    def __init__(self, key: str):
+        self.key = key
+
+
+def _dump_exception(error, withdrawal: dict) -> tuple:
+    # Some exceptions (like TransactionMismatch) can't be unpickled from their args, so they are sent by their state.
+    # The parts of the withdrawal in the state (e.g. the transaction, whose inputs have the private keys) are sent as
+    # their key, and _load_exception puts them back.
+    parts = {id(value): key for key, value in withdrawal.items()}
+    state = {name: _WithdrawalPart(parts[id(value)]) if id(value) in parts else value
+             for name, value in error.__dict__.items()}
+    return type(error), error.args, state
+
+
+def _load_exception(dumped_exception: tuple, withdrawal: dict):
+    exception_class, args, state = dumped_exception
+    error = exception_class.__new__(exception_class)
+    error.args = args
+    error.__dict__.update({name: withdrawal[value.key] if isinstance(value, _WithdrawalPart) else value
+                           for name, value in state.items()})
+    return error
+
+
+def _create_and_sign_transaction(wallet, withdrawal: dict) -> tuple:
+    try:
+        return True, wallet.create_and_sign_transaction(transaction=withdrawal["transaction"],
+                                                        token=withdrawal["token"], memo=withdrawal.get("memo", ""))
+    except BaseException as error:
+        if isinstance(error, _FATAL_EXCEPTIONS):
+            raise
+        return False, _dump_exception(error, withdrawal)
+
+
+def _sign_withdrawal(wallet, index: int) -> tuple:
+    # Runs in a forked worker: the withdrawal is the index-th one of the running sign
+    return _create_and_sign_transaction(wallet, _signing_withdrawals[index])
+
+
+class WithdrawalPipeline:
+    def __init__(self, node_handler, wallet, signing_processes: int = None, broadcast_concurrency: int = 8):
+        """
+        @param node_handler: The Node Handler class of the network, e.g. BTCHandler
+        @param wallet: The Wallet class of the network, e.g. BTCWallet
+        @param signing_processes: Number of the processes that form and sign the transactions (number of the CPUs
+            by default, 1 to run in this process). The pool is only used if the processes are forked.
+        @param broadcast_concurrency: Maximum number of the broadcast_transaction calls that run at the same time
+        """
+        self.NODE_HANDLER = node_handler
+        self.WALLET = wallet
+        self.SIGNING_PROCESSES = signing_processes or os.cpu_count() or 1
+        self.BROADCAST_CONCURRENCY = broadcast_concurrency
+
+    def fill_params(self, withdrawals: list, results: list):
+        """
+        Sets the param of the inputs that don't have one with a single get_params call.
+        If the call fails, its exception is the result of the withdrawals that needed a param.
+        UTXO-based networks are checked with check_utxos instead.
+        """
+        network_configuration = self.NODE_HANDLER.get_network_configuration()
+        if network_configuration["is_utxo_based"]:
+            self.check_utxos(withdrawals, results)
+            return
+        missing_params = [(index, transaction_input) for index, withdrawal in enumerate(withdrawals)
+                          if results[index] is None for transaction_input in withdrawal["transaction"]["inputs"]
+                          if transaction_input.get("param") is None]
+        if not missing_params:
+            return
+        params = self._get_params(missing_params, results)
+        if params is None:
+            return
+        params = {param["address"]: param["param"] for param in params}
+        for index, transaction_input in missing_params:
+            address = transaction_input["address"]
+            if address not in params:
+                results[index] = KeyError(f"get_params didn't return the param of {address}")
+                continue
+            transaction_input["param"] = params[address]
+            if network_configuration["is_sequential"]:
+                params[address] += 1
+
+    def check_utxos(self, withdrawals: list, results: list):
+        """
+        Checks the inputs of a UTXO-based network with a single get_params call.
+        A withdrawal fails (with a ValueError) if one of its inputs doesn't name its output (transaction_output_txid
+        and param), or names an output that isn't unspent in the "utxos" of get_params. The outputs of an address
+        that get_params returns no "utxos" for (e.g. its UTXO index isn't synced) aren't checked.
+        """
+        named_inputs = []
+        for index, withdrawal in enumerate(withdrawals):
+            if results[index] is not None:
+                continue
+            for transaction_input in withdrawal["transaction"]["inputs"]:
+                if transaction_input.get("transaction_output_txid") is None or transaction_input.get("param") is None:
+                    results[index] = ValueError(f"The input of {transaction_input['address']} doesn't name its "
+                                                f"output (transaction_output_txid and param)")
+                    break
+            else:
+                named_inputs += [(index, transaction_input)
+                                 for transaction_input in withdrawal["transaction"]["inputs"]]
+        if not named_inputs:
+            return
+        params = self._get_params(named_inputs, results)
+        if not isinstance(params, list):
+            return
+        checked_addresses = {param["address"] for param in params if param.get("utxos") is not None}
+        unspent_outputs = {(utxo["transaction_output_txid"], utxo["param"])
+                           for param in params for utxo in param.get("utxos") or ()}
+        for index, transaction_input in named_inputs:
+            output = (transaction_input["transaction_output_txid"], transaction_input["param"])
+            if results[index] is None and transaction_input["address"] in checked_addresses and \
+                    output not in unspent_outputs:
+                results[index] = ValueError(f"The output {output[0]}:{output[1]} of {transaction_input['address']} "
+                                            f"isn't unspent")
+
+    def _get_params(self, indexed_inputs: list, results: list):
+        """
+        Calls get_params once for the addresses of the (index, input) pairs
+        @return: The params, or None if the call failed (its exception is the result of the withdrawals)
+        """
+        addresses = list(dict.fromkeys(transaction_input["address"] for _, transaction_input in indexed_inputs))
+        try:
+            return self.NODE_HANDLER.get_params(
+                addresses=[{"address": address, "sub_address": None} for address in addresses])
+        except BaseException as error:
+            if isinstance(error, _FATAL_EXCEPTIONS):
+                raise
+            for index, _ in indexed_inputs:
+                if results[index] is None:
+                    results[index] = error
+            return None
+
+    def sign(self, withdrawals: list, results: list) -> list:
+        """
+        @return: The results of create_and_sign_transaction (or the exceptions) in the order of the withdrawals
+        """
+        indexes = [index for index, result in enumerate(results) if result is None]
+        is_parallel = self.SIGNING_PROCESSES > 1 and len(indexes) > 1 and multiprocessing.get_start_method() == "fork"
+        if not is_parallel:
+            self.WALLET.prepare_batch_worker()
+            outcomes = [_create_and_sign_transaction(self.WALLET, withdrawals[index]) for index in indexes]
+        else:
+            global _signing_withdrawals
+            with _signing_lock:
+                _signing_withdrawals = withdrawals  # Set before the pool forks its workers
+                try:
+                    with ProcessPoolExecutor(max_workers=min(self.SIGNING_PROCESSES, len(indexes)),
+                                             initializer=self.WALLET.prepare_batch_worker) as executor:
+                        outcomes = list(executor.map(_sign_withdrawal, [self.WALLET] * len(indexes), indexes))
+                finally:
+                    _signing_withdrawals = []
+        for index, (is_successful, outcome) in zip(indexes, outcomes):
+            results[index] = outcome if is_successful else _load_exception(outcome, withdrawals[index])
+        return results
+
+    def _broadcast_in_order(self, signed_transactions: list) -> list:
+        """
+        Broadcasts the signed transactions one by one and stops at the first failure
+        """
+        results = []
+        for signed_transaction in signed_transactions:
+            if results and not isinstance(results[-1], dict):
+                results.append(BadBroadCastException("A previous transaction of the address wasn't broadcast"))
+                continue
+            try:
+                response = self.NODE_HANDLER.broadcast_transaction(
+                    signed_transaction=signed_transaction["signed_transaction"])
+                if not response["is_successful"]:
+                    raise BadBroadCastException(response.get("error_message") or response.get("error")
+                                                or response.get("response"))
+                results.append({**signed_transaction, "txid": response.get("txid") or signed_transaction["txid"],
+                                "broadcast": response})
+            except BaseException as error:
+                if isinstance(error, _FATAL_EXCEPTIONS):
+                    raise
+                results.append(error)
+        return results
+
+    def broadcast(self, withdrawals: list, results: list) -> list:
+        """
+        Broadcasts the signed transactions of the results and replaces them with the broadcast results
+        """
+        is_sequential = self.NODE_HANDLER.get_network_configuration()["is_sequential"]
+        groups = {}  # {key: indexes that have to be broadcast in order}
+        failed_keys = set()
+        for index, result in enumerate(results):
+            key = withdrawals[index]["transaction"]["inputs"][0]["address"] if is_sequential else index
+            if not isinstance(result, dict):
+                failed_keys.add(key)
+            elif key in failed_keys:
+                results[index] = BadBroadCastException("A previous transaction of the address wasn't signed")
+            else:
+                groups.setdefault(key, []).append(index)
+        with ThreadPoolExecutor(max_workers=self.BROADCAST_CONCURRENCY, thread_name_prefix="broadcast") as executor:
+            futures = {key: executor.submit(self._broadcast_in_order, [results[index] for index in indexes])
+                       for key, indexes in groups.items()}
+            for key, future in futures.items():
+                for index, result in zip(groups[key], future.result()):
+                    results[index] = result
+        return results
+
+    def process(self, withdrawals: list) -> list:
+        """
+        @param withdrawals: a list of withdrawals in below format:
+        [
+            {
+                "transaction": {...},  # same as create_and_sign_transaction of the wallet, the param can be None
+                "token": {...},
+                "memo": ""
+            }, ...
+        ]
+        @return: a list in the order of the withdrawals. Each item is the exception of the withdrawal or a dict in
+            below format:
+            {
+                "txid": txid,
+                "fee": fee,
+                "signed_transaction": signed_transaction_string,
+                "broadcast": the result of broadcast_transaction
+            }
+        """
+        withdrawals = copy.deepcopy(withdrawals)  # The params are filled in the copies
+        results = [None] * len(withdrawals)
+        self.fill_params(withdrawals, results)
+        self.sign(withdrawals, results)
+        return self.broadcast(withdrawals, results)
@@ -4,9 +4,41 @@
     Basic functions for working with network wallet
     => Raise your exceptions from the exceptions.py.
     => You can't use any endpoint in these functions (except form_transaction). Everything should be done offline.
+    => The batch functions (like get_new_addresses_with_keys) spread the work of the single-key functions over a
+       process pool. Override prepare_batch_worker to build the tables and contexts a worker reuses.
 """
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
+BATCH_CHUNKS_PER_PROCESS = 4  # Each process gets a few chunks, so a slow chunk doesn't keep the others waiting
+
+
+def _prepare_batch_worker(wallet_class):
+    wallet_class.prepare_batch_worker()
+
+
+def _run_batch_chunk(wallet_class, function_name: str, arguments: list) -> list:
+    function = getattr(wallet_class, function_name)
+    return [function(*argument) for argument in arguments]
+
+
+def _run_batch(wallet_class, function_name: str, arguments: list, processes: Optional[int]) -> list:
+    """
+    Calls the function of the wallet class once per argument tuple in a process pool
+    @return: The results in the order of the arguments
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(arguments) <= 1:
+        wallet_class.prepare_batch_worker()
+        return _run_batch_chunk(wallet_class, function_name, arguments)
+    chunk_size = -(-len(arguments) // (processes * BATCH_CHUNKS_PER_PROCESS))
+    chunks = [arguments[index:index + chunk_size] for index in range(0, len(arguments), chunk_size)]
+    with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), initializer=_prepare_batch_worker,
+                             initargs=(wallet_class,)) as executor:
+        results = executor.map(_run_batch_chunk, [wallet_class] * len(chunks), [function_name] * len(chunks), chunks)
+        return [result for chunk_results in results for result in chunk_results]
+
 
 class BaseWallet:
     @staticmethod
@@ -20,6 +52,25 @@ class BaseWallet:
         """
         raise NotImplementedError
 
+    @classmethod
+    def get_new_addresses_with_keys(cls, count: int, processes: int = None) -> list:
+        """
+        Batch variant of get_new_address_with_keys
+        @param count: Number of the new addresses
+        @param processes: Number of the worker processes (number of the CPUs by default, 1 to run in this process)
+        @return: a list of count tuples: (address, public_key, private_key)
+        @note: The private keys must come from a CSPRNG that is safe in forked processes (like secrets or os.urandom)
+        """
+        return _run_batch(cls, "get_new_address_with_keys", [()] * count, processes)
+
+    @classmethod
+    def prepare_batch_worker(cls):
+        """
+        Called once in each worker process of the batch functions before its first chunk (and once in this process
+        if the batch runs here). Override it to build what the single-key functions reuse, like precomputed
+        multiplication tables.
+        """
+
     @staticmethod
     def derive_address_from_public_key(public_key: str) -> str:
         """
@@ -39,6 +90,28 @@ class BaseWallet:
         """
         raise NotImplementedError
 
+    @classmethod
+    def derive_addresses_from_public_keys(cls, public_keys: list, processes: int = None) -> list:
+        """
+        Batch variant of derive_address_from_public_key
+        @param public_keys: a list of compressed public keys
+        @param processes: Number of the worker processes (number of the CPUs by default, 1 to run in this process)
+        @return: a list of the addresses in the order of public_keys
+        """
+        return _run_batch(cls, "derive_address_from_public_key", [(public_key,) for public_key in public_keys],
+                          processes)
+
+    @classmethod
+    def derive_addresses_from_private_keys(cls, private_keys: list, processes: int = None) -> list:
+        """
+        Batch variant of derive_address_from_private_key
+        @param private_keys: a list of private keys in hex
+        @param processes: Number of the worker processes (number of the CPUs by default, 1 to run in this process)
+        @return: a list of the addresses in the order of private_keys
+        """
+        return _run_batch(cls, "derive_address_from_private_key", [(private_key,) for private_key in private_keys],
+                          processes)
+
     @staticmethod
     def form_transaction(transaction: dict, token: dict, memo: str = "") -> dict:
         """
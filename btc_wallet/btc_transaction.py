@@ -0,0 +1,146 @@
+"""
+    > BTC Transaction
+    Serialization and signature hashes of legacy (P2PKH) Bitcoin transactions.
+    => The raw_transaction of a formed transaction is the unsigned transaction in hex: every input has an empty script.
+    => The signature hash (SIGHASH_ALL) of an input is rebuilt from the unsigned transaction and the P2PKH script of
+       the address that the input spends, so a signer never has to trust the message hashes it is given.
+    => Amounts in the transaction are integers in satoshi.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from btc_node_handler.btc_wallet.secp256k1 import base58check_decode
+
+SATOSHI_DECIMALS = 8
+SIGHASH_ALL = 1
+DEFAULT_SEQUENCE = 0xFFFFFFFF
+
+
+def to_satoshi(amount) -> int:
+    """
+    @param amount: An amount in BTC (Decimal, str or int)
+    @return: The amount in satoshi
+    @raise ValueError: if the amount is negative or has more than 8 decimals
+    """
+    try:
+        satoshi = Decimal(str(amount)).scaleb(SATOSHI_DECIMALS)
+    except InvalidOperation:
+        raise ValueError(f"{amount!r} isn't an amount") from None
+    if satoshi < 0 or satoshi != satoshi.to_integral_value():
+        raise ValueError(f"{amount} isn't a whole number of satoshi")
+    return int(satoshi)
+
+
+def get_p2pkh_script(address: str, version: bytes = b"\x00") -> bytes:
+    """
+    @return: The locking script (scriptPubKey) of a P2PKH address
+    @raise ValueError: if the address isn't a P2PKH address of the version
+    """
+    payload = base58check_decode(address)
+    if len(payload) != 21 or payload[:1] != version:
+        raise ValueError(f"{address} isn't a P2PKH address")
+    return b"\x76\xa9\x14" + payload[1:] + b"\x88\xac"
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0xFD:
+        return bytes([value])
+    if value <= 0xFFFF:
+        return b"\xfd" + value.to_bytes(2, "little")
+    if value <= 0xFFFFFFFF:
+        return b"\xfe" + value.to_bytes(4, "little")
+    return b"\xff" + value.to_bytes(8, "little")
+
+
+def _encode_input(transaction_input: dict, script: bytes) -> bytes:
+    return bytes.fromhex(transaction_input["txid"])[::-1] + transaction_input["vout"].to_bytes(4, "little") + \
+        encode_varint(len(script)) + script + transaction_input["sequence"].to_bytes(4, "little")
+
+
+def _encode_outputs(outputs: list) -> bytes:
+    return encode_varint(len(outputs)) + b"".join(
+        output["amount"].to_bytes(8, "little") + encode_varint(len(output["script"])) + output["script"]
+        for output in outputs)
+
+
+def serialize_transaction(transaction: dict) -> bytes:
+    """
+    @param transaction: a transaction in below format:
+    {
+        "version": 1,
+        "inputs": [{"txid": "9f4a...", "vout": 0, "script": b"", "sequence": 0xFFFFFFFF}, ...],
+        "outputs": [{"amount": 10000, "script": b"\x76\xa9..."}, ...],
+        "locktime": 0
+    }
+    @return: The transaction in the wire format (without witness)
+    """
+    return transaction["version"].to_bytes(4, "little") + encode_varint(len(transaction["inputs"])) + \
+        b"".join(_encode_input(transaction_input, transaction_input["script"])
+                 for transaction_input in transaction["inputs"]) + \
+        _encode_outputs(transaction["outputs"]) + transaction["locktime"].to_bytes(4, "little")
+
+
+def parse_transaction(raw_transaction: bytes) -> dict:
+    """
+    @return: The transaction in the format of serialize_transaction
+    @raise ValueError: if the bytes aren't exactly one legacy transaction
+    """
+    offset = 0
+
+    def read(size: int) -> bytes:
+        nonlocal offset
+        if offset + size > len(raw_transaction):
+            raise ValueError("The transaction is truncated")
+        offset += size
+        return raw_transaction[offset - size:offset]
+
+    def read_varint() -> int:
+        prefix = read(1)[0]
+        if prefix < 0xFD:
+            return prefix
+        return int.from_bytes(read({0xFD: 2, 0xFE: 4, 0xFF: 8}[prefix]), "little")
+
+    version = int.from_bytes(read(4), "little")
+    inputs = []
+    for _ in range(read_varint()):
+        txid, vout = read(32)[::-1].hex(), int.from_bytes(read(4), "little")
+        script = read(read_varint())
+        inputs.append({"txid": txid, "vout": vout, "script": script, "sequence": int.from_bytes(read(4), "little")})
+    if not inputs:
+        raise ValueError("The transaction has no input (or is in the witness format)")
+    outputs = []
+    for _ in range(read_varint()):
+        amount = int.from_bytes(read(8), "little")
+        outputs.append({"amount": amount, "script": read(read_varint())})
+    locktime = int.from_bytes(read(4), "little")
+    if offset != len(raw_transaction):
+        raise ValueError("The transaction has extra bytes")
+    return {"version": version, "inputs": inputs, "outputs": outputs, "locktime": locktime}
+
+
+def get_sighashes(transaction: dict, scripts: list) -> list:
+    """
+    @param transaction: An unsigned transaction in the format of serialize_transaction
+    @param scripts: The locking script of the output that each input spends
+    @return: The SIGHASH_ALL signature hash of each input
+    @note: The message of an input starts with the version and the (empty) inputs before it, so the SHA-256 state of
+        that prefix is carried from input to input and copied instead of hashing it again. The empty inputs, the
+        outputs and the locktime are encoded only once.
+    """
+    empty_inputs = [_encode_input(transaction_input, b"") for transaction_input in transaction["inputs"]]
+    offsets = [0]
+    for empty_input in empty_inputs:
+        offsets.append(offsets[-1] + len(empty_input))
+    empty_inputs = memoryview(b"".join(empty_inputs))
+    tail = _encode_outputs(transaction["outputs"]) + transaction["locktime"].to_bytes(4, "little") + \
+        SIGHASH_ALL.to_bytes(4, "little")
+    prefix = hashlib.sha256(transaction["version"].to_bytes(4, "little") + encode_varint(len(transaction["inputs"])))
+    sighashes = []
+    for index, (transaction_input, script) in enumerate(zip(transaction["inputs"], scripts)):
+        message = prefix.copy()
+        message.update(_encode_input(transaction_input, script))
+        message.update(empty_inputs[offsets[index + 1]:])
+        message.update(tail)
+        sighashes.append(hashlib.sha256(message.digest()).digest())
+        prefix.update(empty_inputs[offsets[index]:offsets[index + 1]])
+    return sighashes
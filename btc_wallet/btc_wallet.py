@@ -1,11 +1,45 @@
-from btc_node_handler.btc_wallet.base_wallet import BaseWallet
+import ast
+import json
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import BrokenExecutor
+
+from btc_node_handler.btc_wallet.base_wallet import BaseWallet, _run_batch
+from btc_node_handler.btc_wallet.btc_transaction import to_satoshi, get_p2pkh_script, parse_transaction, \
+    get_sighashes
+from btc_node_handler.btc_wallet.exceptions import TransactionMismatch, SigningException
+from btc_node_handler.btc_wallet.secp256k1 import N, get_generator_table, get_public_key, get_p2pkh_address, \
+    parse_private_key, decompress_public_key, sign, encode_der_signature
+
+_signing_secrets = []  # The private keys of the running get_signatures, inherited by its forked worker processes
+_signing_lock = threading.Lock()
 
 
 class BTCWallet(BaseWallet):
+    ADDRESS_VERSION = b"\x00"  # P2PKH addresses of the main network
+    SIGNING_PROCESSES = None  # Worker processes of get_signatures (number of the CPUs by default)
+    PARALLEL_SIGNING_THRESHOLD = 64  # Fewer signatures than this are signed in this process
 
     @staticmethod
     def get_new_address_with_keys():
-        return 1
+        secret = secrets.randbelow(N - 1) + 1
+        public_key = get_public_key(secret)
+        return get_p2pkh_address(public_key, BTCWallet.ADDRESS_VERSION), public_key.hex(), f"{secret:064x}"
+
+    @classmethod
+    def prepare_batch_worker(cls):
+        get_generator_table()
+
+    @staticmethod
+    def derive_address_from_public_key(public_key: str) -> str:
+        public_key = bytes.fromhex(public_key)
+        decompress_public_key(public_key)  # Raises ValueError if it isn't a valid compressed public key
+        return get_p2pkh_address(public_key, BTCWallet.ADDRESS_VERSION)
+
+    @staticmethod
+    def derive_address_from_private_key(private_key: str) -> str:
+        return get_p2pkh_address(get_public_key(parse_private_key(private_key)), BTCWallet.ADDRESS_VERSION)
 
     @staticmethod
     def form_transaction(transaction, token, memo=""):
@@ -15,6 +49,151 @@ class BTCWallet(BaseWallet):
     def sign_transaction(formed_transaction, accounts):
         return 1
 
+    @staticmethod
+    def parse_formed_transaction(formed_transaction) -> dict:
+        """
+        @param formed_transaction: The formed_transaction string of form_transaction (JSON or the repr of a dict)
+        @return: The dict of it with raw_transaction and message_hash
+        """
+        if isinstance(formed_transaction, dict):
+            return formed_transaction
+        try:
+            return json.loads(formed_transaction)
+        except ValueError:
+            return ast.literal_eval(formed_transaction.strip())
+
+    @staticmethod
+    def sign_message_hash(secret: int, message_hash: str) -> str:
+        """
+        @param secret: The private key as an integer
+        @param message_hash: The message hash of an input in hex
+        @return: The DER signature in hex
+        """
+        return encode_der_signature(sign(secret, bytes.fromhex(message_hash))).hex()
+
+    @staticmethod
+    def sign_with_key_index(key_index: int, message_hash: str) -> str:
+        """
+        Same as sign_message_hash with the key_index-th private key of the running get_signatures
+        """
+        return BTCWallet.sign_message_hash(_signing_secrets[key_index], message_hash)
+
+    @staticmethod
+    def check_transaction(unsigned_transaction: dict, transaction_params: dict, raw_transaction: str):
+        """
+        Checks that the unsigned transaction spends exactly the inputs and pays exactly the outputs of the params.
+        The fee is checked too if every input of the params has its "amount".
+        @raise TransactionMismatch: if they don't match
+        """
+        transaction, token = transaction_params["transaction"], transaction_params["token"]
+
+        def mismatch(message: str) -> TransactionMismatch:
+            return TransactionMismatch(transaction, token, raw_transaction, message)
+
+        if len(unsigned_transaction["inputs"]) != len(transaction["inputs"]):
+            raise mismatch("The number of the inputs is different")
+        for unsigned_input, transaction_input in zip(unsigned_transaction["inputs"], transaction["inputs"]):
+            if unsigned_input["txid"] != str(transaction_input["transaction_output_txid"]).lower() or \
+                    unsigned_input["vout"] != transaction_input["param"]:
+                raise mismatch(f"The input {transaction_input} isn't spent by the formed transaction")
+            if unsigned_input["script"]:
+                raise mismatch(f"The input {transaction_input} of the formed transaction has a script")
+        if len(unsigned_transaction["outputs"]) != len(transaction["outputs"]):
+            raise mismatch("The number of the outputs is different")
+        try:
+            for unsigned_output, output in zip(unsigned_transaction["outputs"], transaction["outputs"]):
+                if unsigned_output["script"] != get_p2pkh_script(output["address"], BTCWallet.ADDRESS_VERSION) or \
+                        unsigned_output["amount"] != to_satoshi(output["amount"]):
+                    raise mismatch(f"The output {output} isn't paid by the formed transaction")
+            if all("amount" in transaction_input for transaction_input in transaction["inputs"]):
+                fee = sum(to_satoshi(transaction_input["amount"]) for transaction_input in transaction["inputs"]) - \
+                    sum(unsigned_output["amount"] for unsigned_output in unsigned_transaction["outputs"])
+                if fee != to_satoshi(transaction["fee"]):
+                    raise mismatch("The fee of the formed transaction is different")
+        except ValueError as error:
+            raise SigningException(f"The transaction params are invalid: {error}") from None
+
+    @staticmethod
+    def get_signatures(raw_transaction: str, accounts: list, transaction_params: dict) -> list:
+        """
+        Signs each input of the formed transaction with the key of its account.
+        The i-th input of the formed transaction is the i-th input of transaction_params.
+        @note: The signature hashes are rebuilt from the unsigned transaction after it is checked with
+            transaction_params (see check_transaction), and the message hashes of the formed transaction must equal
+            them. Nothing that the formed transaction only claims is signed.
+        @note: The public key of each private key is derived once. The (key, sighash) pairs are signed once, in
+            a process pool if there are at least PARALLEL_SIGNING_THRESHOLD of them and the processes are forked.
+            The workers inherit the private keys when they are forked and only get the index of a key, so the keys
+            are never sent through a pipe. The signatures are deterministic (RFC 6979), so the result doesn't depend
+            on the processes.
+        """
+        try:
+            formed_transaction = BTCWallet.parse_formed_transaction(raw_transaction)
+            message_hashes = formed_transaction["message_hash"]
+            unsigned_transaction = parse_transaction(bytes.fromhex(formed_transaction["raw_transaction"]))
+        except (ValueError, SyntaxError, TypeError, KeyError):
+            raise SigningException("The formed transaction can't be parsed") from None
+        inputs = transaction_params["transaction"]["inputs"]
+        token = transaction_params["token"]
+        BTCWallet.check_transaction(unsigned_transaction, transaction_params, raw_transaction)
+        if len(message_hashes) != len(inputs):
+            raise TransactionMismatch(transaction_params["transaction"], token, raw_transaction,
+                                      "The number of the message hashes and the inputs are different")
+        try:
+            scripts = [get_p2pkh_script(transaction_input["address"], BTCWallet.ADDRESS_VERSION)
+                       for transaction_input in inputs]
+        except ValueError as error:
+            raise SigningException(f"The address of an input is invalid: {error}") from None
+        sighashes = get_sighashes(unsigned_transaction, scripts)
+        accounts_by_output = {(account["transaction_output_txid"], account["param"]): account for account in accounts}
+        keys = {}  # {private_key: (index of the secret, public key in hex, address)}
+        secrets_of_keys = []
+        jobs = []
+        for transaction_input, message_hash, sighash in zip(inputs, message_hashes, sighashes):
+            account = accounts_by_output.get((transaction_input["transaction_output_txid"], transaction_input["param"]))
+            if account is None:
+                raise SigningException(f"No account is given for the input {transaction_input}")
+            if not account["address"] == transaction_input["address"] == message_hash["address"]:
+                raise TransactionMismatch(transaction_params["transaction"], token, raw_transaction,
+                                          f"The address of the input {transaction_input} doesn't match")
+            if str(message_hash["message_hash"]).lower() != sighash.hex():
+                raise TransactionMismatch(transaction_params["transaction"], token, raw_transaction,
+                                          f"The message hash of the input {transaction_input} isn't its sighash")
+            try:
+                key = keys.get(account["private_key"])
+                if key is None:
+                    secret = parse_private_key(account["private_key"])
+                    public_key = get_public_key(secret)
+                    key = keys[account["private_key"]] = (len(secrets_of_keys), public_key.hex(),
+                                                          get_p2pkh_address(public_key, BTCWallet.ADDRESS_VERSION))
+                    secrets_of_keys.append(secret)
+            except (ValueError, TypeError):
+                raise SigningException(f"The key of the input {transaction_input} is invalid") from None
+            key_index, public_key_hex, address = key
+            if message_hash.get("public_key") not in (None, public_key_hex) or address != account["address"]:
+                raise TransactionMismatch(transaction_params["transaction"], token, raw_transaction,
+                                          f"The key of the input {transaction_input} doesn't match its address")
+            jobs.append((key_index, sighash.hex()))
+        unique_jobs = list(dict.fromkeys(jobs))
+        is_parallel = len(unique_jobs) >= BTCWallet.PARALLEL_SIGNING_THRESHOLD and \
+            multiprocessing.get_start_method() == "fork"
+        global _signing_secrets
+        with _signing_lock:
+            _signing_secrets = secrets_of_keys  # Set before the pool forks its workers
+            try:
+                signatures = dict(zip(unique_jobs, _run_batch(BTCWallet, "sign_with_key_index", unique_jobs,
+                                                              BTCWallet.SIGNING_PROCESSES if is_parallel else 1)))
+            except (ValueError, TypeError, OSError, BrokenExecutor) as error:
+                raise SigningException(f"Signing the inputs failed: {error}") from error
+            finally:
+                _signing_secrets = []
+        return [{
+            "transaction_output_txid": transaction_input["transaction_output_txid"],
+            "param": transaction_input["param"],
+            "address": transaction_input["address"],
+            "signature": signatures[job],
+        } for transaction_input, job in zip(inputs, jobs)]
+
     @staticmethod
     def create_and_sign_transaction(transaction, token, memo=""):
         return 1
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import time
+
+from btc_node_handler.btc_wallet import secp256k1
+from btc_node_handler.btc_wallet.btc_transaction import DEFAULT_SEQUENCE, get_p2pkh_script, serialize_transaction, \
+    get_sighashes
+from btc_node_handler.btc_wallet.btc_tokens import BTC_NATIVE_TOKEN
+from btc_node_handler.btc_wallet.btc_wallet import BTCWallet
+
+COUNT = 2000
+
+
+def report(name: str, count: int, seconds: float):
+    print(f"{name}: {count} in {seconds:.3f}s ({count / seconds:,.0f}/sec)")
+
+
+def timed(function, *args):
+    started_at = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started_at
+
+
+if __name__ == "__main__":
+    print("========== generator table: ")
+    secp256k1.build_generator_table()  # Warms up the interpreter
+    _, seconds = timed(secp256k1.build_generator_table)
+    print(f"build: {seconds:.3f}s")
+    _, seconds = timed(secp256k1.check_generator_table, secp256k1.get_generator_table())
+    print(f"check: {seconds:.3f}s")
+
+    print("========== keys: ")
+    keys, seconds = timed(lambda: [BTCWallet.get_new_address_with_keys() for _ in range(COUNT)])
+    report("get_new_address_with_keys", COUNT, seconds)
+    _, seconds = timed(lambda: [BTCWallet.derive_address_from_private_key(key[2]) for key in keys])
+    report("derive_address_from_private_key", COUNT, seconds)
+    _, seconds = timed(lambda: [BTCWallet.derive_address_from_public_key(key[1]) for key in keys])
+    report("derive_address_from_public_key", COUNT, seconds)
+    _, seconds = timed(secp256k1.get_public_keys, [int(key[2], 16) for key in keys])
+    report("get_public_keys (batch inversion)", COUNT, seconds)
+    _, seconds = timed(BTCWallet.get_new_addresses_with_keys, COUNT)
+    report(f"get_new_addresses_with_keys ({os.cpu_count()} processes)", COUNT, seconds)
+
+    print("========== signatures: ")
+    inputs = [{"transaction_output_txid": hashlib.sha256(key[2].encode()).hexdigest(), "param": 0, "address": key[0]}
+              for key in keys]
+    outputs = [{"address": keys[0][0], "amount": "0.001"}]
+    unsigned_transaction = {
+        "version": 1,
+        "inputs": [{"txid": transaction_input["transaction_output_txid"], "vout": 0, "script": b"",
+                    "sequence": DEFAULT_SEQUENCE} for transaction_input in inputs],
+        "outputs": [{"amount": 100000, "script": get_p2pkh_script(keys[0][0])}],
+        "locktime": 0,
+    }
+    sighashes = get_sighashes(unsigned_transaction, [get_p2pkh_script(key[0]) for key in keys])
+    formed_transaction = str({
+        "raw_transaction": serialize_transaction(unsigned_transaction).hex(),
+        "message_hash": [{"address": key[0], "public_key": key[1], "message_hash": sighash.hex()}
+                         for key, sighash in zip(keys, sighashes)]
+    })
+    accounts = [{**transaction_input, "private_key": key[2], "public_key": key[1]}
+                for transaction_input, key in zip(inputs, keys)]
+    _, seconds = timed(BTCWallet.get_signatures, formed_transaction, accounts,
+                       {"transaction": {"inputs": inputs, "outputs": outputs, "fee": 0}, "token": BTC_NATIVE_TOKEN})
+    report("get_signatures", COUNT, seconds)
+    digest = hashlib.sha256(b"benchmark").digest()
+    secret = int(keys[0][2], 16)
+    _, seconds = timed(lambda: [secp256k1.sign(secret, digest) for _ in range(COUNT)])
+    report("sign", COUNT, seconds)
+    signature = secp256k1.sign(secret, digest)
+    public_key = bytes.fromhex(keys[0][1])
+    _, seconds = timed(lambda: [secp256k1.verify(public_key, digest, signature) for _ in range(COUNT // 4)])
+    report("verify", COUNT // 4, seconds)
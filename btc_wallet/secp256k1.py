@@ -0,0 +1,510 @@
+"""
+    > secp256k1
+    Offline elliptic-curve engine of the wallet (key generation, public keys, addresses and ECDSA signatures).
+    => Points are added in Jacobian coordinates, so a multiplication needs only one modular inversion at the end.
+    => k * G uses a precomputed table of the generator with signed 8-bit windows: 33 additions and no doubling.
+       The table is built once and kept for the life of the process. It is only cached in a file if
+       GENERATOR_TABLE_PATH is set, and every entry of the file is checked when it is read.
+    => k * P of any other point uses a width-5 NAF.
+    => Many results are converted back to affine coordinates together with one inversion (batch inversion).
+    => Signatures are deterministic (RFC 6979), low-s and DER encoded.
+"""
+import hashlib
+import hmac
+import os
+
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+WINDOW_BITS = 8
+WINDOWS = 256 // WINDOW_BITS + 1  # One more window for the carry of the signed digits
+HALF_WINDOW = 1 << (WINDOW_BITS - 1)
+NAF_WIDTH = 5
+GENERATOR_TABLE_PATH = os.environ.get("SECP256K1_GENERATOR_TABLE_PATH")
+# The table decides the public keys, so its file must be as protected as the keys. Building it takes about as long
+# as checking a file, so it isn't cached in a file by default.
+
+_generator_table = None
+
+
+# > Field and point arithmetic. Affine points are (x, y) tuples, Jacobian points are (X, Y, Z) and None is infinity.
+
+
+def batch_inverse(values: list, modulus: int = P) -> list:
+    """
+    Inverts all the (non-zero) values with one modular inversion (Montgomery's trick)
+    """
+    prefixes = []
+    accumulator = 1
+    for value in values:
+        prefixes.append(accumulator)
+        accumulator = accumulator * value % modulus
+    inverse = pow(accumulator, -1, modulus)
+    inverses = [0] * len(values)
+    for index in range(len(values) - 1, -1, -1):
+        inverses[index] = inverse * prefixes[index] % modulus
+        inverse = inverse * values[index] % modulus
+    return inverses
+
+
+def jacobian_double(point):
+    if point is None:
+        return None
+    x, y, z = point
+    if y == 0:
+        return None
+    yy = y * y % P
+    s = 4 * x * yy % P
+    m = 3 * x * x % P
+    x3 = (m * m - 2 * s) % P
+    return x3, (m * (s - x3) - 8 * yy * yy) % P, 2 * y * z % P
+
+
+def jacobian_add_affine(point, affine_point):
+    """
+    @return: point + affine_point, where point is Jacobian and affine_point is affine (mixed addition)
+    """
+    if affine_point is None:
+        return point
+    if point is None:
+        return affine_point[0], affine_point[1], 1
+    x1, y1, z1 = point
+    x2, y2 = affine_point
+    z1z1 = z1 * z1 % P
+    h = (x2 * z1z1 - x1) % P
+    r = (y2 * z1 * z1z1 - y1) % P
+    if h == 0:
+        return jacobian_double(point) if r == 0 else None
+    hh = h * h % P
+    hhh = h * hh % P
+    v = x1 * hh % P
+    x3 = (r * r - hhh - 2 * v) % P
+    return x3, (r * (v - x3) - y1 * hhh) % P, z1 * h % P
+
+
+def to_affine(point):
+    if point is None:
+        return None
+    x, y, z = point
+    z_inverse = pow(z, -1, P)
+    z_inverse_2 = z_inverse * z_inverse % P
+    return x * z_inverse_2 % P, y * z_inverse_2 * z_inverse % P
+
+
+def batch_to_affine(points: list) -> list:
+    """
+    Same as to_affine for each point, with one inversion for all of them
+    """
+    finite_points = [point for point in points if point is not None]
+    inverses = iter(batch_inverse([point[2] for point in finite_points]))
+    affine_points = []
+    for point in points:
+        if point is None:
+            affine_points.append(None)
+            continue
+        z_inverse = next(inverses)
+        z_inverse_2 = z_inverse * z_inverse % P
+        affine_points.append((point[0] * z_inverse_2 % P, point[1] * z_inverse_2 * z_inverse % P))
+    return affine_points
+
+
+def negate(affine_point):
+    return None if affine_point is None else (affine_point[0], -affine_point[1] % P)
+
+
+def is_on_curve(affine_point) -> bool:
+    x, y = affine_point
+    return 0 <= x < P and 0 <= y < P and (y * y - x * x * x - 7) % P == 0
+
+
+# > Scalar multiplication
+
+
+def get_naf(scalar: int, width: int = NAF_WIDTH) -> list:
+    """
+    @return: The width-NAF digits of the scalar, least significant first
+    """
+    digits = []
+    window = 1 << width
+    while scalar:
+        if scalar & 1:
+            digit = scalar & (window - 1)
+            if digit >= window >> 1:
+                digit -= window
+            scalar -= digit
+        else:
+            digit = 0
+        digits.append(digit)
+        scalar >>= 1
+    return digits
+
+
+def multiply(affine_point, scalar: int):
+    """
+    @return: scalar * affine_point as an affine point (None for infinity)
+    """
+    return to_affine(jacobian_multiply(affine_point, scalar))
+
+
+def jacobian_multiply(affine_point, scalar: int):
+    scalar %= N
+    if affine_point is None or scalar == 0:
+        return None
+    double_point = to_affine(jacobian_double((affine_point[0], affine_point[1], 1)))
+    odd_multiples = [(affine_point[0], affine_point[1], 1)]
+    for _ in range((1 << (NAF_WIDTH - 2)) - 1):
+        odd_multiples.append(jacobian_add_affine(odd_multiples[-1], double_point))
+    odd_multiples = batch_to_affine(odd_multiples)
+    result = None
+    for digit in reversed(get_naf(scalar)):
+        result = jacobian_double(result)
+        if digit > 0:
+            result = jacobian_add_affine(result, odd_multiples[digit >> 1])
+        elif digit < 0:
+            result = jacobian_add_affine(result, negate(odd_multiples[-digit >> 1]))
+    return result
+
+
+def build_generator_table() -> list:
+    """
+    @return: table[window][digit - 1] = digit * 256 ** window * G in affine coordinates, for digit in 1..128
+    """
+    jacobian_table = []
+    base = G
+    for _ in range(WINDOWS):
+        multiples = [(base[0], base[1], 1)]
+        for _ in range(HALF_WINDOW - 1):
+            multiples.append(jacobian_add_affine(multiples[-1], base))
+        jacobian_table.append(multiples)
+        base = to_affine(jacobian_double(multiples[-1]))  # 2 * 128 * base = 256 * base
+    affine_points = batch_to_affine([point for multiples in jacobian_table for point in multiples])
+    return [affine_points[window * HALF_WINDOW:(window + 1) * HALF_WINDOW] for window in range(WINDOWS)]
+
+
+def check_generator_table(table: list):
+    """
+    Checks every entry of the table: table[0][0] == G, table[window][0] == 2 * table[window - 1][-1] and
+    table[window][digit] == table[window][digit - 1] + table[window][0]. The sums are compared in Jacobian
+    coordinates, so no inversion is needed.
+    @raise ValueError: if an entry isn't the multiple of the generator that it should be
+    """
+    if len(table) != WINDOWS or any(len(multiples) != HALF_WINDOW for multiples in table):
+        raise ValueError("The generator table has a wrong size")
+
+    def matches(affine_point, point) -> bool:
+        if point is None:
+            return False
+        x, y = affine_point
+        z_2 = point[2] * point[2] % P
+        return 0 <= x < P and 0 <= y < P and x * z_2 % P == point[0] and y * z_2 * point[2] % P == point[1]
+
+    if table[0][0] != G:
+        raise ValueError("The generator table doesn't start with the generator")
+    for window, multiples in enumerate(table):
+        if window and not matches(multiples[0], jacobian_double((*table[window - 1][-1], 1))):
+            raise ValueError(f"The window {window} of the generator table is wrong")
+        for digit in range(1, HALF_WINDOW):
+            if not matches(multiples[digit], jacobian_add_affine((*multiples[digit - 1], 1), multiples[0])):
+                raise ValueError(f"The entry {digit + 1} of the window {window} of the generator table is wrong")
+
+
+def _serialize_table(table: list) -> bytes:
+    return b"".join(x.to_bytes(32, "big") + y.to_bytes(32, "big") for multiples in table for x, y in multiples)
+
+
+def _deserialize_table(content: bytes) -> list:
+    if len(content) != WINDOWS * HALF_WINDOW * 64:
+        raise ValueError("The generator table file is corrupted")
+    points = [(int.from_bytes(content[offset:offset + 32], "big"),
+               int.from_bytes(content[offset + 32:offset + 64], "big")) for offset in range(0, len(content), 64)]
+    table = [points[window * HALF_WINDOW:(window + 1) * HALF_WINDOW] for window in range(WINDOWS)]
+    check_generator_table(table)
+    return table
+
+
+def get_generator_table(path: str = None) -> list:
+    """
+    Returns the generator table of the process. On the first call it is built, or read from the path
+    (GENERATOR_TABLE_PATH by default) if one is given. A missing or invalid file is replaced by a new one that only
+    the owner can read and write.
+    """
+    global _generator_table
+    if _generator_table is not None:
+        return _generator_table
+    path = path or GENERATOR_TABLE_PATH
+    if path is None:
+        _generator_table = build_generator_table()
+        return _generator_table
+    try:
+        with open(path, "rb") as table_file:
+            _generator_table = _deserialize_table(table_file.read())
+        return _generator_table
+    except (OSError, ValueError):
+        pass
+    _generator_table = build_generator_table()
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        file_descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(file_descriptor, "wb") as table_file:
+            table_file.write(_serialize_table(_generator_table))
+        os.replace(temporary_path, path)
+    except OSError:
+        pass  # The table is only kept in memory
+    return _generator_table
+
+
+def jacobian_multiply_generator(scalar: int):
+    scalar %= N
+    table = get_generator_table()
+    result = None
+    for window in range(WINDOWS):
+        digit = scalar & 0xFF
+        scalar >>= WINDOW_BITS
+        if digit >= HALF_WINDOW:
+            digit -= 1 << WINDOW_BITS
+            scalar += 1
+        if digit > 0:
+            result = jacobian_add_affine(result, table[window][digit - 1])
+        elif digit < 0:
+            x, y = table[window][-digit - 1]
+            result = jacobian_add_affine(result, (x, P - y))
+    return result
+
+
+def multiply_generator(scalar: int):
+    """
+    @return: scalar * G as an affine point
+    """
+    return to_affine(jacobian_multiply_generator(scalar))
+
+
+def batch_multiply_generator(scalars: list) -> list:
+    """
+    Same as multiply_generator for each scalar, with one inversion for all of them
+    """
+    return batch_to_affine([jacobian_multiply_generator(scalar) for scalar in scalars])
+
+
+# > Keys
+
+
+def compress_public_key(affine_point) -> bytes:
+    x, y = affine_point
+    return (b"\x03" if y & 1 else b"\x02") + x.to_bytes(32, "big")
+
+
+def decompress_public_key(public_key: bytes):
+    """
+    @param public_key: A compressed public key (33 bytes that start with 02 or 03)
+    @return: Its point in affine coordinates
+    @raise ValueError: if the public key isn't a valid compressed point of the curve
+    """
+    if len(public_key) != 33 or public_key[0] not in (2, 3):
+        raise ValueError("The public key must be compressed")
+    x = int.from_bytes(public_key[1:], "big")
+    y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+    if x >= P or (y * y - x * x * x - 7) % P:
+        raise ValueError("The public key isn't a point of the curve")
+    if y & 1 != public_key[0] & 1:
+        y = P - y
+    return x, y
+
+
+def parse_private_key(private_key: str) -> int:
+    """
+    @param private_key: A private key in hex
+    @return: The private key as an integer
+    @raise ValueError: if the private key isn't in the range of the curve
+    """
+    secret = int(private_key, 16)
+    if not 1 <= secret < N:
+        raise ValueError("The private key is out of the range of the curve")
+    return secret
+
+
+def get_public_key(secret: int) -> bytes:
+    """
+    @return: The compressed public key of the private key
+    """
+    return compress_public_key(multiply_generator(secret))
+
+
+def get_public_keys(secrets: list) -> list:
+    """
+    Same as get_public_key for each private key, with one inversion for all of them
+    """
+    return [compress_public_key(point) for point in batch_multiply_generator(secrets)]
+
+
+# > ECDSA
+
+
+def get_rfc6979_nonces(secret: int, digest: bytes):
+    """
+    @return: A generator of the deterministic nonces of RFC 6979 (HMAC-SHA256) for the private key and the digest
+    """
+    secret_bytes = secret.to_bytes(32, "big")
+    digest_bytes = (int.from_bytes(digest, "big") % N).to_bytes(32, "big")
+    v = b"\x01" * 32
+    k = hmac.digest(b"\x00" * 32, v + b"\x00" + secret_bytes + digest_bytes, "sha256")
+    v = hmac.digest(k, v, "sha256")
+    k = hmac.digest(k, v + b"\x01" + secret_bytes + digest_bytes, "sha256")
+    v = hmac.digest(k, v, "sha256")
+    while True:
+        v = hmac.digest(k, v, "sha256")
+        nonce = int.from_bytes(v, "big")
+        if 1 <= nonce < N:
+            yield nonce
+        k = hmac.digest(k, v + b"\x00", "sha256")
+        v = hmac.digest(k, v, "sha256")
+
+
+def sign(secret: int, digest: bytes) -> tuple:
+    """
+    @param secret: The private key
+    @param digest: The 32-byte hash of the message (the sighash of a transaction input)
+    @return: The low-s signature (r, s)
+    """
+    z = int.from_bytes(digest, "big")
+    for nonce in get_rfc6979_nonces(secret, digest):
+        r = multiply_generator(nonce)[0] % N
+        if r == 0:
+            continue
+        s = pow(nonce, -1, N) * (z + r * secret) % N
+        if s == 0:
+            continue
+        return r, min(s, N - s)
+
+
+def verify(public_key: bytes, digest: bytes, signature: tuple) -> bool:
+    r, s = signature
+    if not (1 <= r < N and 1 <= s < N):
+        return False
+    s_inverse = pow(s, -1, N)
+    z = int.from_bytes(digest, "big")
+    point = jacobian_add_affine(jacobian_multiply(decompress_public_key(public_key), r * s_inverse % N),
+                                multiply_generator(z * s_inverse % N))
+    return point is not None and to_affine(point)[0] % N == r
+
+
+def encode_der_signature(signature: tuple) -> bytes:
+    def encode_integer(value: int) -> bytes:
+        value_bytes = value.to_bytes((value.bit_length() + 8) // 8, "big")  # Keeps a leading zero for the sign bit
+        return b"\x02" + bytes([len(value_bytes)]) + value_bytes
+
+    body = encode_integer(signature[0]) + encode_integer(signature[1])
+    return b"\x30" + bytes([len(body)]) + body
+
+
+# > Addresses
+
+
+def _ripemd160(data: bytes) -> bytes:
+    try:
+        return hashlib.new("ripemd160", data).digest()
+    except ValueError:  # OpenSSL 3 builds may not ship RIPEMD-160
+        return _ripemd160_fallback(data)
+
+
+def hash160(data: bytes) -> bytes:
+    return _ripemd160(hashlib.sha256(data).digest())
+
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def base58check_encode(payload: bytes) -> str:
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(data, "big")
+    encoded = []
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded.append(BASE58_ALPHABET[remainder])
+    leading_zeros = len(data) - len(data.lstrip(b"\x00"))
+    return "1" * leading_zeros + "".join(reversed(encoded))
+
+
+def base58check_decode(encoded: str) -> bytes:
+    """
+    @return: The payload of the Base58Check string (without the checksum)
+    @raise ValueError: if the string isn't valid Base58 or its checksum is wrong
+    """
+    number = 0
+    for character in encoded:
+        index = BASE58_ALPHABET.find(character)
+        if index < 0:
+            raise ValueError(f"{character!r} isn't a Base58 character")
+        number = number * 58 + index
+    leading_zeros = len(encoded) - len(encoded.lstrip("1"))
+    data = b"\x00" * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, "big")
+    payload, checksum = data[:-4], data[-4:]
+    if len(data) < 4 or hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError("The Base58Check checksum is wrong")
+    return payload
+
+
+def get_p2pkh_address(public_key: bytes, version: bytes = b"\x00") -> str:
+    """
+    @param public_key: A compressed public key
+    @param version: Version byte of the address (0x00 on the main network)
+    @return: The legacy (P2PKH) address of the public key
+    """
+    return base58check_encode(version + hash160(public_key))
+
+
+_RIPEMD160_R1 = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14,
+                 11, 8, 3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12, 1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15,
+                 14, 5, 6, 2, 4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13]
+_RIPEMD160_R2 = [5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12, 6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9,
+                 1, 2, 15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13, 8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13,
+                 9, 7, 10, 14, 12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11]
+_RIPEMD160_S1 = [11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8, 7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11,
+                 7, 13, 12, 11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5, 11, 12, 14, 15, 14, 15, 9, 8, 9,
+                 14, 5, 6, 8, 6, 5, 12, 9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6]
+_RIPEMD160_S2 = [8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6, 9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6,
+                 15, 13, 11, 9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5, 15, 5, 8, 11, 14, 14, 6, 14, 6, 9,
+                 12, 9, 12, 5, 15, 8, 8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11]
+_RIPEMD160_K1 = [0x00000000, 0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xA953FD4E]
+_RIPEMD160_K2 = [0x50A28BE6, 0x5C4DD124, 0x6D703EF3, 0x7A6D76E9, 0x00000000]
+
+
+def _ripemd160_function(round_index: int, x: int, y: int, z: int) -> int:
+    if round_index == 0:
+        return x ^ y ^ z
+    if round_index == 1:
+        return (x & y) | (~x & z)
+    if round_index == 2:
+        return (x | ~y) ^ z
+    if round_index == 3:
+        return (x & z) | (y & ~z)
+    return x ^ (y | ~z)
+
+
+def _ripemd160_fallback(data: bytes) -> bytes:
+    def rotate_left(value: int, bits: int) -> int:
+        value &= 0xFFFFFFFF
+        return ((value << bits) | (value >> (32 - bits))) & 0xFFFFFFFF
+
+    state = [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0]
+    message = data + b"\x80" + b"\x00" * ((55 - len(data)) % 64) + (8 * len(data)).to_bytes(8, "little")
+    for offset in range(0, len(message), 64):
+        words = [int.from_bytes(message[offset + 4 * index:offset + 4 * index + 4], "little") for index in range(16)]
+        al, bl, cl, dl, el = state
+        ar, br, cr, dr, er = state
+        for step in range(80):
+            round_index = step // 16
+            t = rotate_left(al + _ripemd160_function(round_index, bl, cl, dl) + words[_RIPEMD160_R1[step]]
+                            + _RIPEMD160_K1[round_index], _RIPEMD160_S1[step]) + el
+            al, el, dl, cl, bl = el, dl, rotate_left(cl, 10), bl, t & 0xFFFFFFFF
+            t = rotate_left(ar + _ripemd160_function(4 - round_index, br, cr, dr) + words[_RIPEMD160_R2[step]]
+                            + _RIPEMD160_K2[round_index], _RIPEMD160_S2[step]) + er
+            ar, er, dr, cr, br = er, dr, rotate_left(cr, 10), br, t & 0xFFFFFFFF
+        t = (state[1] + cl + dr) & 0xFFFFFFFF
+        state[1] = (state[2] + dl + er) & 0xFFFFFFFF
+        state[2] = (state[3] + el + ar) & 0xFFFFFFFF
+        state[3] = (state[4] + al + br) & 0xFFFFFFFF
+        state[4] = (state[0] + bl + cr) & 0xFFFFFFFF
+        state[0] = t
+    return b"".join(value.to_bytes(4, "little") for value in state)
@@ -0,0 +1,18 @@
+import os
+import sys
+import types
+
+"""
+    > Wallet Test Configuration
+    The wallet modules import each other as btc_node_handler.btc_wallet.<module>, the name that this repository has
+    in the project that installs it. The checkout isn't in a btc_node_handler directory, so that name is registered
+    here as a package whose path is the repository root. Nothing is replaced: btc_node_handler.btc_wallet is the
+    btc_wallet directory of this checkout.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "btc_node_handler" not in sys.modules:
+    btc_node_handler = types.ModuleType("btc_node_handler")
+    btc_node_handler.__path__ = [ROOT]
+    sys.modules["btc_node_handler"] = btc_node_handler
@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+import pytest
+
+from btc_node_handler.btc_wallet import secp256k1
+from btc_node_handler.btc_wallet.btc_transaction import DEFAULT_SEQUENCE, encode_varint, get_p2pkh_script, \
+    get_sighashes, parse_transaction, serialize_transaction, to_satoshi
+
+# A signed transaction of the main network (one P2PKH input and two outputs) and the script of the output it spends
+SIGNED_TRANSACTION = bytes.fromhex(
+    "0100000001813f79011acb80925dfe69b3def355fe914bd1d96a3f5f71bf8303c6a989c7d1000000006b483045022100ed81ff192e75a3fd"
+    "2304004dcadb746fa5e24c5031ccfcf21320b0277457c98f02207a986d955c6e0cb35d446a89d3f56100f4d7f67801c31967743a9c8e1061"
+    "5bed01210349fc4e631e3624a545de3f89f5d8684c7b8138bd94bdd531d2e213bf016b278afeffffff02a135ef01000000001976a914bc3b"
+    "654dca7e56b04dca18f2566cdaf02e8d9ada88ac99c39800000000001976a9141c4bc762dd5423e332166702cb75f40df79fea1288ac1943"
+    "0600")
+SPENT_SCRIPT = bytes.fromhex("76a914a802fc56c704ce87c42d7c92eb75e7896bdc41ae88ac")
+SIGHASH = "27e0c5994dec7824e56dec6b2fcb342eb7cdb0d0957c2fce9882f715e85d81a6"
+
+
+def test_parse_and_serialize_round_trip():
+    transaction = parse_transaction(SIGNED_TRANSACTION)
+    assert transaction["version"] == 1 and transaction["locktime"] == 410393
+    assert transaction["inputs"][0]["txid"] == "d1c789a9c60383bf715f3f6ad9d14b91fe55f3deb369fe5d9280cb1a01793f81"
+    assert transaction["inputs"][0]["vout"] == 0 and transaction["inputs"][0]["sequence"] == 0xFFFFFFFE
+    assert [output["amount"] for output in transaction["outputs"]] == [32454049, 10011545]
+    assert serialize_transaction(transaction) == SIGNED_TRANSACTION
+
+
+def test_sighash_of_the_signed_transaction():
+    transaction = parse_transaction(SIGNED_TRANSACTION)
+    script = transaction["inputs"][0]["script"]
+    der_signature, public_key = script[1:script[0]], script[script[0] + 2:]
+    transaction["inputs"][0]["script"] = b""
+    sighash = get_sighashes(transaction, [SPENT_SCRIPT])[0]
+    assert sighash.hex() == SIGHASH
+    r_length = der_signature[3]
+    signature = (int.from_bytes(der_signature[4:4 + r_length], "big"),
+                 int.from_bytes(der_signature[6 + r_length:], "big"))
+    assert secp256k1.encode_der_signature(signature) == der_signature
+    assert secp256k1.verify(public_key, sighash, signature)
+
+
+def get_unsigned_transaction(inputs: int) -> dict:
+    return {"version": 1, "locktime": 0,
+            "inputs": [{"txid": f"{index + 1:064x}", "vout": index, "script": b"", "sequence": DEFAULT_SEQUENCE}
+                       for index in range(inputs)],
+            "outputs": [{"amount": 100000, "script": SPENT_SCRIPT}, {"amount": 5000, "script": SPENT_SCRIPT}]}
+
+
+def test_sighashes_match_the_naive_serialization():
+    import hashlib
+
+    transaction = get_unsigned_transaction(inputs=5)
+    scripts = [get_p2pkh_script("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH")] * 5
+    for index, sighash in enumerate(get_sighashes(transaction, scripts)):
+        message = {**transaction, "inputs": [{**transaction_input, "script": scripts[index] if number == index
+                                              else b""} for number, transaction_input
+                                             in enumerate(transaction["inputs"])]}
+        preimage = serialize_transaction(message) + (1).to_bytes(4, "little")
+        assert sighash == hashlib.sha256(hashlib.sha256(preimage).digest()).digest()
+
+
+def test_parse_rejects_invalid_transactions():
+    with pytest.raises(ValueError):
+        parse_transaction(SIGNED_TRANSACTION[:-1])
+    with pytest.raises(ValueError):
+        parse_transaction(SIGNED_TRANSACTION + b"\x00")
+    with pytest.raises(ValueError):
+        parse_transaction(serialize_transaction(get_unsigned_transaction(inputs=0)))
+
+
+def test_p2pkh_script():
+    assert get_p2pkh_script("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH").hex() == \
+        "76a914751e76e8199196d454941c45d1b3a323f1433bd688ac"
+    with pytest.raises(ValueError):
+        get_p2pkh_script("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH", version=b"\x6f")
+    with pytest.raises(ValueError):
+        get_p2pkh_script("3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLz")
+
+
+def test_to_satoshi():
+    assert to_satoshi(Decimal("0.0023")) == 230000
+    assert to_satoshi("1") == 100000000
+    for amount in ("0.000000001", "-1", "abc"):
+        with pytest.raises(ValueError):
+            to_satoshi(amount)
+
+
+def test_varint():
+    assert [encode_varint(value).hex() for value in (0xFC, 0xFD, 0x10000, 2 ** 32)] == \
+        ["fc", "fdfd00", "fe00000100", "ff0000000001000000"]
@@ -0,0 +1,142 @@
+import copy
+import multiprocessing
+
+import pytest
+
+from btc_node_handler.btc_wallet import btc_wallet, secp256k1
+from btc_node_handler.btc_wallet.btc_tokens import BTC_NATIVE_TOKEN
+from btc_node_handler.btc_wallet.btc_transaction import DEFAULT_SEQUENCE, get_p2pkh_script, get_sighashes, \
+    serialize_transaction
+from btc_node_handler.btc_wallet.btc_wallet import BTCWallet
+from btc_node_handler.btc_wallet.exceptions import TransactionMismatch, SigningException
+
+
+def test_derived_addresses():
+    address, public_key, private_key = BTCWallet.get_new_address_with_keys()
+    assert BTCWallet.derive_address_from_public_key(public_key) == address
+    assert BTCWallet.derive_address_from_private_key(private_key) == address
+    assert BTCWallet.derive_address_from_private_key(f"{1:064x}") == "1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH"
+    with pytest.raises(ValueError):
+        BTCWallet.derive_address_from_public_key("02" + "00" * 31 + "05")
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_batch_derivation(processes):
+    keys = BTCWallet.get_new_addresses_with_keys(4, processes=processes)
+    assert len({private_key for _, _, private_key in keys}) == 4
+    assert BTCWallet.derive_addresses_from_private_keys([key[2] for key in keys], processes=processes) == \
+        [key[0] for key in keys]
+    assert BTCWallet.derive_addresses_from_public_keys([key[1] for key in keys], processes=processes) == \
+        [key[0] for key in keys]
+
+
+def get_formed_transaction(inputs: int = 3):
+    """
+    @return: (formed_transaction, accounts, transaction_params, sighashes) of a transaction that spends 0.01 from each
+        of the inputs, each of a new key
+    """
+    keys = [BTCWallet.get_new_address_with_keys() for _ in range(inputs)]
+    transaction_inputs = [{"transaction_output_txid": f"{index + 1:064x}", "param": index, "address": key[0],
+                           "amount": "0.01"} for index, key in enumerate(keys)]
+    amount = inputs * 1000000 - 10000
+    unsigned_transaction = {
+        "version": 1, "locktime": 0,
+        "inputs": [{"txid": transaction_input["transaction_output_txid"], "vout": transaction_input["param"],
+                    "script": b"", "sequence": DEFAULT_SEQUENCE} for transaction_input in transaction_inputs],
+        "outputs": [{"amount": amount, "script": get_p2pkh_script(keys[0][0])}],
+    }
+    sighashes = get_sighashes(unsigned_transaction, [get_p2pkh_script(key[0]) for key in keys])
+    formed_transaction = {
+        "raw_transaction": serialize_transaction(unsigned_transaction).hex(),
+        "message_hash": [{"address": key[0], "public_key": key[1], "message_hash": sighash.hex()}
+                         for key, sighash in zip(keys, sighashes)],
+    }
+    accounts = [{**transaction_input, "private_key": key[2]} for transaction_input, key in zip(transaction_inputs, keys)]
+    transaction_params = {
+        "transaction": {"inputs": transaction_inputs, "outputs": [{"address": keys[0][0], "amount": amount / 10 ** 8}],
+                        "fee": "0.0001"},
+        "token": BTC_NATIVE_TOKEN,
+    }
+    return formed_transaction, accounts, transaction_params, sighashes
+
+
+def decode_der_signature(signature: str) -> tuple:
+    der_signature = bytes.fromhex(signature)
+    r_length = der_signature[3]
+    return (int.from_bytes(der_signature[4:4 + r_length], "big"),
+            int.from_bytes(der_signature[6 + r_length:], "big"))
+
+
+def assert_signed(signatures: list, formed_transaction: dict, sighashes: list):
+    assert len(signatures) == len(sighashes)
+    for signature, message_hash, sighash in zip(signatures, formed_transaction["message_hash"], sighashes):
+        assert signature["address"] == message_hash["address"]
+        assert secp256k1.verify(bytes.fromhex(message_hash["public_key"]), sighash,
+                                decode_der_signature(signature["signature"]))
+
+
+def test_signatures_of_the_inputs():
+    formed_transaction, accounts, transaction_params, sighashes = get_formed_transaction()
+    signatures = BTCWallet.get_signatures(str(formed_transaction), list(reversed(accounts)), transaction_params)
+    assert [signature["param"] for signature in signatures] == [0, 1, 2]
+    assert_signed(signatures, formed_transaction, sighashes)
+    assert btc_wallet._signing_secrets == []
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="the processes can't be forked")
+def test_parallel_signatures_match_the_sequential_ones(monkeypatch):
+    formed_transaction, accounts, transaction_params, sighashes = get_formed_transaction(inputs=4)
+    sequential_signatures = BTCWallet.get_signatures(str(formed_transaction), accounts, transaction_params)
+    monkeypatch.setattr(BTCWallet, "PARALLEL_SIGNING_THRESHOLD", 2)
+    monkeypatch.setattr(BTCWallet, "SIGNING_PROCESSES", 2)
+    monkeypatch.setattr(multiprocessing, "get_start_method", lambda *args, **kwargs: "fork")
+    parallel_signatures = BTCWallet.get_signatures(str(formed_transaction), accounts, transaction_params)
+    assert parallel_signatures == sequential_signatures
+    assert_signed(parallel_signatures, formed_transaction, sighashes)
+    assert btc_wallet._signing_secrets == []
+
+
+def test_tampered_params_are_rejected():
+    formed_transaction, accounts, transaction_params, _ = get_formed_transaction()
+    params = copy.deepcopy(transaction_params)
+    params["transaction"]["outputs"][0]["amount"] = "0.02"
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(formed_transaction), accounts, params)
+    params = copy.deepcopy(transaction_params)
+    params["transaction"]["fee"] = "0.0002"
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(formed_transaction), accounts, params)
+    params = copy.deepcopy(transaction_params)
+    params["transaction"]["inputs"][1]["param"] = 5
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(formed_transaction), accounts, params)
+
+
+def test_tampered_formed_transaction_is_rejected():
+    formed_transaction, accounts, transaction_params, _ = get_formed_transaction()
+    tampered = copy.deepcopy(formed_transaction)
+    tampered["message_hash"][1]["message_hash"] = "00" * 32
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(tampered), accounts, transaction_params)
+    tampered = copy.deepcopy(formed_transaction)
+    tampered["message_hash"][0]["public_key"] = tampered["message_hash"][1]["public_key"]
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(tampered), accounts, transaction_params)
+    tampered = copy.deepcopy(formed_transaction)
+    tampered["raw_transaction"] = "zz"
+    with pytest.raises(SigningException):
+        BTCWallet.get_signatures(str(tampered), accounts, transaction_params)
+
+
+def test_wrong_or_missing_key_is_rejected():
+    formed_transaction, accounts, transaction_params, _ = get_formed_transaction()
+    with pytest.raises(SigningException):
+        BTCWallet.get_signatures(str(formed_transaction), accounts[1:], transaction_params)
+    wrong_accounts = copy.deepcopy(accounts)
+    wrong_accounts[0]["private_key"] = accounts[1]["private_key"]
+    with pytest.raises(TransactionMismatch):
+        BTCWallet.get_signatures(str(formed_transaction), wrong_accounts, transaction_params)
+    wrong_accounts[0]["private_key"] = "not a key"
+    with pytest.raises(SigningException):
+        BTCWallet.get_signatures(str(formed_transaction), wrong_accounts, transaction_params)
+    assert btc_wallet._signing_secrets == []
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import stat
+
+import pytest
+
+from btc_node_handler.btc_wallet import secp256k1
+
+# Deterministic ECDSA (RFC 6979, HMAC-SHA256) vectors of the private key 1
+SIGNATURE_VECTORS = [
+    (b"Satoshi Nakamoto",
+     0x934b1ea10a4b3c1757e2b0c017d0b6143ce3c9a7e6a4a49860d7a6ab210ee3d8,
+     0x2442ce9d2b916064108014783e923ec36b49743e2ffa1c4496f01a512aafd9e5),
+    (b"All those moments will be lost in time, like tears in rain. Time to die...",
+     0x8600dbd41e348fe5c9465ab92d23e3db8b98b873beecd930736488696438cb6b,
+     0x547fe64427496db33bf66019dacbf0039c04199abb0122918601db38a72cfc21),
+]
+
+
+@pytest.mark.parametrize("message, r, s", SIGNATURE_VECTORS)
+def test_rfc6979_vectors(message, r, s):
+    digest = hashlib.sha256(message).digest()
+    assert secp256k1.sign(1, digest) == (r, s)
+    assert secp256k1.verify(secp256k1.get_public_key(1), digest, (r, s))
+    assert not secp256k1.verify(secp256k1.get_public_key(2), digest, (r, s))
+    assert not secp256k1.verify(secp256k1.get_public_key(1), hashlib.sha256(b"other").digest(), (r, s))
+
+
+def test_signatures_are_low_s():
+    for secret in (1, 2, secp256k1.N - 1, 0xDEADBEEF):
+        digest = hashlib.sha256(secret.to_bytes(32, "big")).digest()
+        r, s = secp256k1.sign(secret, digest)
+        assert s <= secp256k1.N // 2
+        assert secp256k1.verify(secp256k1.get_public_key(secret), digest, (r, s))
+
+
+def test_address_of_the_private_key_1():
+    public_key = secp256k1.get_public_key(1)
+    assert public_key.hex() == "0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"
+    assert secp256k1.get_p2pkh_address(public_key) == "1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH"
+    assert secp256k1.hash160(public_key).hex() == "751e76e8199196d454941c45d1b3a323f1433bd6"
+
+
+def test_generator_multiples_match_the_naive_multiplication():
+    scalars = [1, 2, 255, 256, 257, 2 ** 128 + 12345, secp256k1.N - 1, secp256k1.N + 5]
+    assert secp256k1.batch_multiply_generator(scalars) == [secp256k1.multiply(secp256k1.G, scalar)
+                                                          for scalar in scalars]
+    assert secp256k1.get_public_keys([1, 2]) == [secp256k1.get_public_key(1), secp256k1.get_public_key(2)]
+
+
+def test_public_key_compression_round_trip():
+    for secret in (1, 3, secp256k1.N - 1):
+        point = secp256k1.multiply_generator(secret)
+        assert secp256k1.decompress_public_key(secp256k1.compress_public_key(point)) == point
+    with pytest.raises(ValueError):
+        secp256k1.decompress_public_key(b"\x02" + (5).to_bytes(32, "big"))
+
+
+def test_base58check():
+    payload = b"\x00" + bytes(range(20))
+    encoded = secp256k1.base58check_encode(payload)
+    assert secp256k1.base58check_decode(encoded) == payload
+    assert secp256k1.base58check_decode("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH")[1:].hex() == \
+        "751e76e8199196d454941c45d1b3a323f1433bd6"
+    with pytest.raises(ValueError):
+        secp256k1.base58check_decode("1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMJ")
+    with pytest.raises(ValueError):
+        secp256k1.base58check_decode("0OIl")
+
+
+def test_ripemd160_fallback_matches_the_vectors():
+    assert secp256k1._ripemd160_fallback(b"").hex() == "9c1185a5c5e9fc54612808977ee8f548b2258d31"
+    assert secp256k1._ripemd160_fallback(b"abc").hex() == "8eb208f7e05d987a9b044a8e98c6b087f15a0bfc"
+
+
+def test_tampered_generator_table_is_rejected():
+    table = [list(multiples) for multiples in secp256k1.get_generator_table()]
+    secp256k1.check_generator_table(table)
+    table[7][5], table[7][6] = table[7][6], table[7][5]
+    with pytest.raises(ValueError):
+        secp256k1.check_generator_table(table)
+    with pytest.raises(ValueError):
+        secp256k1.check_generator_table(table[:-1])
+
+
+@pytest.fixture
+def empty_table(monkeypatch):
+    monkeypatch.setattr(secp256k1, "_generator_table", None)
+
+
+def test_generator_table_file_is_private_and_checked(tmp_path, empty_table):
+    path = str(tmp_path / "generator.table")
+    table = secp256k1.get_generator_table(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert secp256k1._deserialize_table(open(path, "rb").read()) == table
+
+    content = bytearray(open(path, "rb").read())
+    content[64 * 300] ^= 1  # An entry that isn't a multiple of the generator anymore
+    with open(path, "wb") as table_file:
+        table_file.write(content)
+    with pytest.raises(ValueError):
+        secp256k1._deserialize_table(bytes(content))
+    secp256k1._generator_table = None
+    assert secp256k1.get_generator_table(path) == table  # The invalid file is replaced
+    assert open(path, "rb").read() == secp256k1._serialize_table(table)
+
+
+def test_generator_table_is_only_kept_in_memory_without_a_path(tmp_path, empty_table, monkeypatch):
+    monkeypatch.setattr(secp256k1, "GENERATOR_TABLE_PATH", None)
+    monkeypatch.chdir(tmp_path)
+    assert len(secp256k1.get_generator_table()) == secp256k1.WINDOWS
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,15 @@
+import os
+import sys
+
+"""
+    > Test Configuration
+    Makes the modules importable the way the project imports them when the tests run from this directory.
+    => btc_handler modules are imported as btc_handler.<module> from this directory.
+    => btc.py imports its neighbours by their bare names, so btc_handler is on the path too.
+"""
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+for path in (ROOT, os.path.join(ROOT, "btc_handler")):
+    if path not in sys.path:
+        sys.path.insert(0, path)